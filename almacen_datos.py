@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+
+# Almacén columnar para archivos con el esquema de Wage.csv. El CSV (separado por
+# ";") se convierte una sola vez a Arrow IPC sin compresión, con las columnas
+# categóricas codificadas como diccionario. El archivo se lee con memory-mapping
+# (sin copiar los buffers) y se pueden pedir solo las columnas necesarias.
+# Los valores categóricos se guardan tal cual vienen (con sus espacios iniciales),
+# que es como los vio el modelo en entrenamiento.
+
+COLUMNAS_CATEGORICAS = ["sex", "maritl", "race", "education", "jobclass", "health", "health_ins"]
+EXTENSION = ".arrow"
+
+
+def ruta_columnar(ruta_csv):
+    return os.path.splitext(ruta_csv)[0] + EXTENSION
+
+
+def convertir_csv(ruta_csv, ruta_salida=None, sep=";", tam_bloque=1 << 24):
+    # Conversión en streaming: memoria acotada por tam_bloque sin importar el tamaño del CSV.
+    # Cada columna categórica mantiene un diccionario global que solo crece, así
+    # que el archivo se escribe con deltas de diccionario.
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+
+    ruta_salida = ruta_salida or ruta_columnar(ruta_csv)
+    lector = pcsv.open_csv(
+        ruta_csv,
+        read_options=pcsv.ReadOptions(block_size=tam_bloque),
+        parse_options=pcsv.ParseOptions(delimiter=sep),
+        convert_options=pcsv.ConvertOptions(
+            column_types={c: pa.string() for c in COLUMNAS_CATEGORICAS}
+        ),
+    )
+    categoricas = [c for c in lector.schema.names if c in COLUMNAS_CATEGORICAS]
+    esquema = pa.schema([
+        pa.field(f.name, pa.dictionary(pa.int32(), pa.string())) if f.name in categoricas else f
+        for f in lector.schema
+    ])
+    diccionarios = {c: {} for c in categoricas}
+    filas = 0
+    inicio = time.perf_counter()
+    opciones = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    temporal = ruta_salida + ".tmp"
+    with pa.OSFile(temporal, "wb") as destino, pa.ipc.new_file(destino, esquema, options=opciones) as escritor:
+        for lote in lector:
+            columnas = []
+            for nombre, columna in zip(lote.schema.names, lote.columns):
+                if nombre in diccionarios:
+                    columnas.append(_codificar(columna, diccionarios[nombre]))
+                else:
+                    columnas.append(columna)
+            escritor.write_batch(pa.RecordBatch.from_arrays(columnas, schema=esquema))
+            filas += lote.num_rows
+    os.replace(temporal, ruta_salida)
+    print(f"{filas} filas convertidas en {time.perf_counter() - inicio:.2f} s -> {ruta_salida}")
+    return ruta_salida
+
+
+def _codificar(columna, diccionario):
+    # Codifica contra el diccionario global de la columna (valor -> índice)
+    import pyarrow as pa
+
+    local = columna.dictionary_encode()
+    mapeo = np.empty(len(local.dictionary), dtype=np.int32)
+    for i, valor in enumerate(local.dictionary.to_pylist()):
+        mapeo[i] = diccionario.setdefault(valor, len(diccionario))
+    indices = local.indices.to_numpy(zero_copy_only=False)
+    validos = local.indices.is_valid().to_numpy(zero_copy_only=False)
+    globales = pa.array(mapeo[np.where(validos, indices, 0)], mask=~validos, type=pa.int32())
+    return pa.DictionaryArray.from_arrays(globales, pa.array(list(diccionario), type=pa.string()))
+
+
+def leer_tabla(ruta, columnas=None):
+    # Tabla Arrow respaldada por el archivo mapeado en memoria (zero-copy)
+    import pyarrow as pa
+
+    tabla = pa.ipc.open_file(pa.memory_map(ruta, "r")).read_all()
+    return tabla.select(columnas) if columnas is not None else tabla
+
+
+def resolver_ruta(ruta_csv):
+    # Usa el almacén columnar si existe y está al día respecto al CSV
+    columnar = ruta_columnar(ruta_csv)
+    if os.path.exists(columnar) and (
+        not os.path.exists(ruta_csv) or os.path.getmtime(columnar) >= os.path.getmtime(ruta_csv)
+    ):
+        return columnar
+    return ruta_csv
+
+
+def leer_dataset(ruta_csv="Wage.csv", columnas=None):
+    # DataFrame con categóricas como category; lee el .arrow si está disponible
+    ruta = resolver_ruta(ruta_csv)
+    if ruta.endswith(EXTENSION):
+        return leer_tabla(ruta, columnas).to_pandas(split_blocks=True)
+    import pandas as pd
+
+    df = pd.read_csv(ruta, sep=";", usecols=columnas)
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+# Lectura incremental del CSV: quien agrega datos en línea guarda el origen (hasta
+# qué byte procesó y la huella de los últimos bytes) y, si el archivo solo creció
+# por el final, lee únicamente lo nuevo
+
+def huella_cola(ruta, hasta, tamano=4096):
+    with open(ruta, "rb") as f:
+        f.seek(max(0, hasta - tamano))
+        bloque = f.read(min(hasta, tamano))
+    # Una línea a medio escribir no cuenta como punto de corte
+    if bloque and not bloque.endswith(b"\n"):
+        return None
+    return hashlib.sha256(bloque).hexdigest()
+
+
+def origen_archivo(ruta):
+    info = os.stat(ruta)
+    return {"ruta": os.path.abspath(ruta), "bytes": info.st_size, "mtime_ns": info.st_mtime_ns,
+            "cola": huella_cola(ruta, info.st_size)}
+
+
+def cambio_archivo(ruta, origen):
+    # "sin cambios", "incremental" (solo creció por el final) o "reconstruir"
+    if not origen or origen["ruta"] != os.path.abspath(ruta):
+        return "reconstruir"
+    info = os.stat(ruta)
+    if info.st_size == origen["bytes"] and info.st_mtime_ns == origen["mtime_ns"]:
+        return "sin cambios"
+    if origen["cola"] and info.st_size >= origen["bytes"] and huella_cola(ruta, origen["bytes"]) == origen["cola"]:
+        return "incremental"
+    return "reconstruir"
+
+
+class _TramoArchivo(io.RawIOBase):
+    # Vista de solo lectura de [desde, hasta) de un archivo, para que pandas lea solo ese tramo
+
+    def __init__(self, f, desde, hasta):
+        self.f = f
+        self.f.seek(desde)
+        self.restante = hasta - desde
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        n = self.f.readinto(memoryview(destino)[:max(0, min(len(destino), self.restante))])
+        self.restante -= n
+        return n
+
+
+def leer_bloques_csv(ruta, sep=";", tam_bloque=200_000, desde_byte=0, hasta_byte=None, dtype=None):
+    # DataFrames de a tam_bloque filas entre dos bytes que caen en inicio de línea; el
+    # encabezado se toma siempre de la primera línea del archivo
+    import pandas as pd
+
+    with open(ruta, "rb") as f:
+        encabezado = f.readline().decode("utf-8").strip().split(sep)
+        desde_byte = max(desde_byte, f.tell())
+        hasta_byte = os.path.getsize(ruta) if hasta_byte is None else hasta_byte
+        if hasta_byte <= desde_byte:
+            return
+        tramo = io.BufferedReader(_TramoArchivo(f, desde_byte, hasta_byte))
+        yield from pd.read_csv(tramo, sep=sep, header=None, names=encabezado, chunksize=tam_bloque,
+                               dtype={c: t for c, t in (dtype or {}).items() if c in encabezado})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte un CSV con el esquema de Wage.csv a Arrow IPC columnar")
+    parser.add_argument("csv", nargs="?", default="Wage.csv")
+    parser.add_argument("--salida", default=None)
+    parser.add_argument("--sep", default=";")
+    args = parser.parse_args()
+    convertir_csv(args.csv, args.salida, args.sep)
@@ -1,23 +1,191 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
+from fastapi import Depends, FastAPI, Header, Query, UploadFile, File, Response
+from pydantic import BaseModel, BeforeValidator, Field, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-import joblib
-import pandas as pd
 import os
-import google.generativeai as genai
 from fastapi import HTTPException
 from enum import Enum
+from typing import Annotated, Any, Dict, List, Literal, Optional
+import itertools
+import asyncio
+import io
+import json
+import threading
 import numpy as np
 
-# Configuración de API Key para Google Gemini
-genai_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=genai_api_key)
+from observabilidad import (
+    METRICAS, MiddlewareMetricas, configurar_logging, exponer_metricas, marcar_fin_handler,
+    marcar_inicio_handler, medir_etapa,
+)
+from vocabulario import COLUMNAS_VOCABULARIO, Vocabulario
+
+# pandas, catboost/joblib y google.generativeai se importan solo cuando se usan:
+# el modelo se carga en el primer uso o en el calentamiento al iniciar.
+RUTA_MODELO = os.getenv("RUTA_MODELO", "best_wage_model.joblib")
+# Hilos de CatBoost por llamada a predict (-1 = todos los núcleos de la máquina,
+# aunque el proceso tenga afinidad a menos); servidor.py lo fija por worker
+MODELO_HILOS = int(os.getenv("MODELO_HILOS", "-1"))
+
+_genai = None
+
+def obtener_genai():
+    # Configuración de API Key para Google Gemini (diferida hasta la primera llamada)
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        _genai = genai
+    return _genai
+
+
+# Registro de modelos (REGISTRO_MODELOS, por defecto modelos/): si tiene una
+# versión activa se sirve esa; si no, RUTA_MODELO. Todo lo que depende del
+# artefacto (pipeline, motor compilado/exportado y tabla) vive en un
+# ModeloServido que se reemplaza de una sola vez al cambiar de versión.
+from clasificacion_salario import NUMERO_CLASES, cuantiles_desde_texto
+from registro_modelos import EvaluacionSombra, ModeloServido, RegistroModelos
+
+# BACKEND_MODELO=exportado: evalúa con el motor numpy exportado por
+# `python motor_compilado.py` (sin catboost, pandas ni unpickle en los workers).
+# Si el archivo no existe o es de otra versión del modelo se usa el pipeline joblib
+BACKEND_MODELO = os.getenv("BACKEND_MODELO", "joblib")
+if BACKEND_MODELO not in ("joblib", "exportado"):
+    raise ValueError(f"BACKEND_MODELO desconocido: {BACKEND_MODELO}")
+
+registro = RegistroModelos(os.getenv("REGISTRO_MODELOS", "modelos"))
+
+def crear_servido(ruta, version=None, ruta_motor=None):
+    return ModeloServido(
+        ruta,
+        version,
+        backend=BACKEND_MODELO,
+        # Motor compilado opcional (MOTOR_COMPILADO=1): evalúa una fila sin DataFrame
+        compilar=os.getenv("MOTOR_COMPILADO", "0") == "1",
+        # Tabla precalculada de la grilla completa (python tabla_predicciones.py);
+        # se descarta si fue generada con otra versión del modelo
+        ruta_tabla=os.getenv("TABLA_PREDICCIONES", "tabla_predicciones.npy"),
+        ruta_motor=ruta_motor,
+        # Bandas de clasificación: <modelo>.bandas.json o, si no existe, cuantiles de Wage.csv
+        cuantiles=cuantiles_desde_texto(os.getenv("CLASIFICACION_CUANTILES")),
+    )
+
+def servido_inicial():
+    version = registro.leer_activa()
+    if version is not None:
+        return crear_servido(registro.ruta_artefacto(version), version)
+    return crear_servido(RUTA_MODELO, ruta_motor=os.getenv("MOTOR_EXPORTADO"))
+
+servido = servido_inicial()
+
+def obtener_modelo():
+    # Carga pipeline completo que incluye preprocesamiento y modelo (una sola vez)
+    return servido.obtener_modelo()
+
+def inicializar_trabajador():
+    # Con el motor exportado activo los trabajadores no necesitan el pipeline joblib
+    if servido.motor is None:
+        obtener_modelo()
+
+# Cache LRU/TTL de respuestas de /predict (CACHE_TAMANO=0 la desactiva);
+# CACHE_COMPARTIDA apunta a un archivo SQLite compartido entre workers
+from cache_predicciones import CachePredicciones
+cache = None
+if int(os.getenv("CACHE_TAMANO", "10000")) > 0:
+    cache = CachePredicciones(
+        servido.ruta,
+        servido.bandas.a_dict(),
+        tamano_maximo=int(os.getenv("CACHE_TAMANO", "10000")),
+        ttl=float(os.getenv("CACHE_TTL", "3600")),
+        ruta_compartida=os.getenv("CACHE_COMPARTIDA") or None,
+    )
+
+# Ejecutor de inferencia fuera del event loop: INFERENCIA_MODO=hilos|procesos,
+# INFERENCIA_TRABAJADORES y INFERENCIA_COLA (solicitudes en espera antes de responder 503)
+from ejecutor_inferencia import EjecutorInferencia, ColaLlena
+ejecutor = None
+_lock_ejecutor = threading.Lock()
 
-# Carga pipeline completo que incluye preprocesamiento y modelo
-modelo = joblib.load("best_wage_model.joblib")
+def obtener_ejecutor():
+    global ejecutor
+    if ejecutor is None:
+        with _lock_ejecutor:
+            if ejecutor is None:
+                modo = os.getenv("INFERENCIA_MODO", "hilos")
+                ejecutor = EjecutorInferencia(
+                    modo=modo,
+                    trabajadores=int(os.getenv("INFERENCIA_TRABAJADORES", str(os.cpu_count() or 1))),
+                    cola_maxima=int(os.getenv("INFERENCIA_COLA", "64")),
+                    # En modo procesos cada trabajador carga su propia copia del modelo
+                    inicializador=inicializar_trabajador if modo == "procesos" else None,
+                )
+    return ejecutor
+
+def agregar_metricas_cola(response: Response, metricas):
+    # Profundidad de cola y tiempos de la solicitud, para dimensionar los trabajadores
+    response.headers["X-Cola-Profundidad"] = str(metricas["profundidad_cola"])
+    response.headers["X-Cola-Espera-ms"] = str(metricas["espera_ms"])
+    response.headers["X-Inferencia-ms"] = str(metricas["inferencia_ms"])
+    if "tamano_lote" in metricas:
+        response.headers["X-Lote-Tamano"] = str(metricas["tamano_lote"])
+        response.headers["X-Lote-Espera-ms"] = str(metricas["espera_lote_ms"])
+
+# Micro-lotes para /predict (MICROLOTES=0 los desactiva): MICROLOTES_MAX_FILAS
+# y MICROLOTES_ESPERA_MS acotan el tamaño del lote y la espera agregada
+from microlotes import MicroLotes
+microlotes = None
+
+def obtener_microlotes():
+    global microlotes
+    if microlotes is None and os.getenv("MICROLOTES", "1") == "1":
+        ejecutor_activo = obtener_ejecutor()
+        microlotes = MicroLotes(
+            predecir_registros,
+            ejecutor_activo.ejecutar,
+            max_filas=int(os.getenv("MICROLOTES_MAX_FILAS", "64")),
+            max_espera_ms=float(os.getenv("MICROLOTES_ESPERA_MS", "5")),
+            max_en_vuelo=ejecutor_activo.trabajadores,
+        )
+    return microlotes
+
+# Explicaciones con LLM en segundo plano: EXPLICACIONES_BACKEND=gemini|local|desactivado
+# (por defecto gemini si hay GOOGLE_API_KEY, si no el backend local sin red)
+from explicaciones import ServicioExplicaciones, BackendGemini, BackendLocal
+servicio_explicaciones = None
+
+def obtener_explicaciones():
+    global servicio_explicaciones
+    if servicio_explicaciones is None:
+        nombre = os.getenv("EXPLICACIONES_BACKEND", "gemini" if os.getenv("GOOGLE_API_KEY") else "local")
+        if nombre == "desactivado":
+            return None
+        backend = (
+            BackendGemini(obtener_genai, os.getenv("GEMINI_MODELO", "gemini-1.5-flash"))
+            if nombre == "gemini" else BackendLocal()
+        )
+        servicio_explicaciones = ServicioExplicaciones(
+            backend,
+            generar_prompt_explicacion,
+            lambda: servido.bandas,
+            ancho_cubeta=float(os.getenv("EXPLICACIONES_ANCHO_CUBETA", "5")),
+            concurrencia=int(os.getenv("EXPLICACIONES_CONCURRENCIA", "4")),
+            timeout=float(os.getenv("EXPLICACIONES_TIMEOUT", "20")),
+        )
+    return servicio_explicaciones
+
+# PRECARGAR_MODELO=1 carga el modelo al importar el módulo, para que un proceso
+# padre (p. ej. gunicorn --preload) lo comparta con los workers por copy-on-write
+if os.getenv("PRECARGAR_MODELO", "0") == "1":
+    obtener_modelo()
 
 app = FastAPI(title="API Predicción de Salarios")
 
+# Log estructurado (JSON) y muestreado: LOG_MUESTREO es la fracción de
+# predicciones que se registran; la escritura ocurre en un hilo aparte
+logger = configurar_logging(
+    muestreo=float(os.getenv("LOG_MUESTREO", "0.01")),
+    nivel=os.getenv("LOG_NIVEL", "INFO"),
+)
+app.add_middleware(MiddlewareMetricas)
+
 # Configuración de CORS
 app.add_middleware(
     CORSMiddleware,
@@ -33,15 +201,33 @@ class HealthEnum(str, Enum):
     muy_buena_o_excelente = "Muy Buena o Excelente"
 
 
+# Vocabulario de categorías tal como están en el dataset de entrenamiento: los
+# valores se normalizan (espacios y mayúsculas) al valor canónico y lo que no
+# existe se rechaza con 422 por campo
+vocabulario = Vocabulario.desde_csv(os.getenv("RUTA_DATOS", "Wage.csv"))
+
+# Monitor de deriva de las entradas de /predict contra Wage.csv; los puntajes se
+# recalculan cada DERIVA_INTERVALO segundos (0 lo desactiva)
+from monitor_deriva import MonitorDeriva
+monitor_deriva = None
+if float(os.getenv("DERIVA_INTERVALO", "60")) > 0:
+    monitor_deriva = MonitorDeriva.desde_csv(
+        os.getenv("RUTA_DATOS", "Wage.csv"), min_muestras=int(os.getenv("DERIVA_MIN_MUESTRAS", "100"))
+    )
+    METRICAS.append(monitor_deriva)
+
+def categoria(columna, tipo=None):
+    return Annotated[tipo or vocabulario.tipo(columna), BeforeValidator(vocabulario.normalizador(columna))]
+
 # Modelo de entrada para predicción
 class WageInput(BaseModel):
     age: int
-    education: str
-    jobclass: str
-    health: HealthEnum
-    health_ins: str
-    maritl: str
-    race: str
+    education: categoria("education")
+    jobclass: categoria("jobclass")
+    health: categoria("health", HealthEnum)
+    health_ins: categoria("health_ins")
+    maritl: categoria("maritl")
+    race: categoria("race")
     year: int
     
     class Config:  # ojo: 4 espacios exactos, alineado con los atributos
@@ -58,26 +244,190 @@ class WageInput(BaseModel):
             }
         }
 
+def calentar_modelo(objetivo=None):
+    # Carga el modelo y hace una inferencia de prueba para dejarlo listo
+    objetivo = objetivo or servido
+    try:
+        ejemplo = WageInput(**WageInput.model_config["json_schema_extra"]["example"])
+        modelo_cargado = objetivo.obtener_modelo() if objetivo.motor is None else None
+        if modelo_cargado is not None:
+            import pandas as pd
+            modelo_cargado.predict(pd.DataFrame([ejemplo.dict()]), thread_count=MODELO_HILOS)
+        predecir_registros([ejemplo], objetivo)
+        objetivo.estado["calentado"] = True
+    except Exception as e:
+        objetivo.estado["error"] = str(e)
+        logger.error("Error al calentar el modelo", extra={"campos": {"version": objetivo.version, "error": str(e)}})
+    return objetivo.estado["calentado"]
+
+
+@app.on_event("startup")
+async def iniciar_calentamiento():
+    obtener_ejecutor()
+    threading.Thread(target=calentar_modelo, name="calentar-modelo", daemon=True).start()
+    if os.path.isdir(registro.directorio):
+        asyncio.get_running_loop().create_task(vigilar_registro())
+    if monitor_deriva is not None:
+        asyncio.get_running_loop().create_task(calcular_deriva())
+
+
+@app.on_event("shutdown")
+def cerrar_ejecutor():
+    if ejecutor is not None:
+        ejecutor.cerrar()
+    if sombra is not None:
+        sombra.cerrar()
+
+
+@app.get("/ready")
+def ready():
+    if not servido.estado["calentado"]:
+        raise HTTPException(status_code=503, detail={"listo": False, **servido.estado})
+    return {"listo": True, **servido.estado}
+
+
+# -------------------------------
+# Registro de modelos: cambio en caliente y modo sombra
+# -------------------------------
+
+# Cambios en curso por versión ({"accion", "estado", "error"}) y evaluación en sombra activa
+cambios_modelo: Dict[str, Dict[str, Any]] = {}
+sombra = None
+_lock_cambio = threading.Lock()
+
+def verificar_admin(x_admin_token: str = Header(None)):
+    # Los endpoints de administración exigen ADMIN_TOKEN; sin él quedan deshabilitados
+    esperado = os.getenv("ADMIN_TOKEN")
+    if not esperado or x_admin_token != esperado:
+        raise HTTPException(status_code=403, detail="Token de administración inválido o no configurado")
+
+def preparar_version(version, accion):
+    # En un hilo aparte: carga y calienta la versión; la solicitud nunca espera esto
+    global servido, sombra
+    cambio = cambios_modelo[version]
+    try:
+        nuevo = crear_servido(registro.ruta_artefacto(version), version)
+        if not calentar_modelo(nuevo):
+            raise RuntimeError(nuevo.estado["error"])
+        with _lock_cambio:
+            if accion == "activar":
+                registro.marcar_activa(version)
+                if ejecutor is not None and ejecutor.modo == "procesos":
+                    # Los trabajadores nuevos cargan la versión activa al arrancar
+                    ejecutor.reiniciar_pool()
+                # Una sola asignación: cada solicitud usa la versión vieja o la nueva, nunca una mezcla
+                servido = nuevo
+                if cache is not None:
+                    cache.cambiar_modelo(nuevo.ruta, nuevo.bandas.a_dict())
+            else:
+                anterior = sombra
+                sombra = EvaluacionSombra(
+                    version,
+                    lambda registros: predecir_registros(registros, nuevo),
+                    resumen_salario,
+                    fraccion=cambio["fraccion"],
+                )
+                if anterior is not None:
+                    anterior.cerrar()
+        cambio["estado"] = "listo"
+        logger.info("Modelo preparado", extra={"campos": {"version": version, "accion": accion}, "sin_muestreo": True})
+    except Exception as e:
+        cambio.update(estado="error", error=str(e))
+        logger.error("No se pudo preparar el modelo", extra={"campos": {"version": version, "error": str(e)}})
+
+def iniciar_cambio(version, accion, fraccion=None):
+    try:
+        registro.metadatos(version)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail=f"Versión {version} no encontrada en el registro")
+    with _lock_cambio:
+        actual = cambios_modelo.get(version)
+        if actual is not None and actual["estado"] == "cargando":
+            return actual
+        cambios_modelo[version] = {"version": version, "accion": accion, "estado": "cargando",
+                                   "error": None, "fraccion": fraccion}
+    threading.Thread(target=preparar_version, args=(version, accion),
+                     name=f"preparar-{version}", daemon=True).start()
+    return cambios_modelo[version]
+
+async def vigilar_registro():
+    # Otros procesos (u otro worker que recibió el cambio) actualizan ACTIVO;
+    # cada worker lo revisa cada REGISTRO_INTERVALO segundos y se pone al día solo
+    intervalo = float(os.getenv("REGISTRO_INTERVALO", "10"))
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            version = registro.leer_activa()
+            if version is not None and version != servido.version:
+                iniciar_cambio(version, "activar")
+        except Exception as e:
+            logger.error("Error al revisar el registro de modelos", extra={"campos": {"error": str(e)}})
+
+
+async def calcular_deriva():
+    # Sumar los vectores por hilo y comparar contra la línea base toma microsegundos:
+    # corre en el event loop sin pasar por el ejecutor
+    intervalo = float(os.getenv("DERIVA_INTERVALO", "60"))
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            reporte = monitor_deriva.calcular()
+            if reporte["nivel"] in ("moderada", "significativa"):
+                logger.warning("deriva", extra={"campos": {
+                    "nivel": reporte["nivel"], "caracteristica": reporte["caracteristica_mas_derivada"],
+                }})
+        except Exception as e:
+            logger.error("Error al calcular la deriva", extra={"campos": {"error": str(e)}})
+
+
+@app.get("/admin/modelos", dependencies=[Depends(verificar_admin)])
+def admin_modelos():
+    return {
+        "activa": servido.version,
+        "sha256": servido.sha256,
+        "registro": registro.directorio,
+        "versiones": registro.listar(),
+        "cambios": list(cambios_modelo.values()),
+    }
+
+
+@app.post("/admin/modelos/{version}/activar", status_code=202, dependencies=[Depends(verificar_admin)])
+def admin_activar(version: str):
+    if version == servido.version:
+        return {"version": version, "accion": "activar", "estado": "listo", "error": None}
+    return iniciar_cambio(version, "activar")
+
+
+@app.post("/admin/modelos/{version}/sombra", status_code=202, dependencies=[Depends(verificar_admin)])
+def admin_sombra(version: str, fraccion: float = Query(0.05, gt=0, le=1)):
+    return iniciar_cambio(version, "sombra", fraccion)
+
+
+@app.get("/admin/sombra", dependencies=[Depends(verificar_admin)])
+def admin_sombra_estadisticas():
+    if sombra is None:
+        return {"habilitada": False}
+    return {"habilitada": True, **sombra.estadisticas()}
+
+
+@app.delete("/admin/sombra", dependencies=[Depends(verificar_admin)])
+def admin_sombra_detener():
+    global sombra
+    anterior, sombra = sombra, None
+    if anterior is not None:
+        anterior.cerrar()
+        return {"habilitada": False, **anterior.estadisticas()}
+    return {"habilitada": False}
+
+
 @app.get("/")
 def home():
     return {"mensaje": "API de Predicción de Salarios funcionando 🚀"}
 
-def resumen_salario(valores):
-    # valores: lista de salarios, normalmente será solo [salario]
-    salario = valores[0]
-    if salario >= 170:
-        clasificacion = 5
-    elif salario >= 145:
-        clasificacion = 4
-    elif salario >= 120:
-        clasificacion = 3
-    elif salario >= 95:
-        clasificacion = 2
-    elif salario >= 70:
-        clasificacion = 1
-    else:
-        clasificacion = 0
-    return clasificacion
+def resumen_salario(valores, objetivo=None):
+    # valores: arreglo de salarios; devuelve la clasificación (0 a 5) de cada uno con
+    # las bandas de cuantiles guardadas junto al modelo servido
+    return (objetivo or servido).bandas.clasificar(valores)
 
 def generar_prompt_explicacion(salario, clasificacion):
     prompt = (
@@ -103,30 +453,439 @@ def explicar_clasificacion_salario(clasificacion: int):
     return explicaciones.get(clasificacion, "Clasificación desconocida")
 
 
+EXPLICACIONES_CLASIFICACION = np.array(
+    [explicar_clasificacion_salario(c) for c in range(NUMERO_CLASES)],
+    dtype=object,
+)
+
+def explicar_clasificacion_vector(clasificaciones):
+    # Versión vectorizada de explicar_clasificacion_salario (indexa la tabla de textos)
+    return EXPLICACIONES_CLASIFICACION[np.asarray(clasificaciones, dtype=int)]
+
+
 usar_log = False  # Cambia a False si modelo no usó log en target
 
+COLUMNAS_ENTRADA = list(WageInput.model_fields)
+
+def columnas_registros(registros: List[WageInput]):
+    # Registros validados -> dict columna -> lista de valores (enums por su valor)
+    columnas = {c: [getattr(r, c) for r in registros] for c in COLUMNAS_ENTRADA}
+    columnas["health"] = [getattr(h, "value", h) for h in columnas["health"]]
+    return columnas
+
+def predecir_registros(registros: List[WageInput], objetivo=None):
+    # Orden: tabla precalculada, motor compilado y por último el modelo completo,
+    # con una sola llamada vectorizada para las filas que quedan. Se toma una sola
+    # referencia al ModeloServido para que un cambio de versión no mezcle modelos
+    objetivo = objetivo or servido
+    tabla, motor = objetivo.tabla, objetivo.motor
+    preds = np.empty(len(registros), dtype=float)
+    pendientes = list(range(len(registros)))
+    if tabla is not None:
+        restantes = []
+        with medir_etapa("tabla"):
+            for i in pendientes:
+                pred = tabla.buscar(registros[i])
+                if pred is None:
+                    restantes.append(i)
+                else:
+                    preds[i] = pred
+        pendientes = restantes
+    if pendientes and motor is not None:
+        with medir_etapa("motor"):
+            pred = motor.predecir_columnas(columnas_registros([registros[i] for i in pendientes]))
+        if pred is not None:
+            preds[pendientes] = pred
+            pendientes = []
+    if pendientes:
+        import pandas as pd
+        modelo_activo = objetivo.obtener_modelo()
+        with medir_etapa("dataframe"):
+            new_data = pd.DataFrame(columnas_registros([registros[i] for i in pendientes]), columns=COLUMNAS_ENTRADA)
+        with medir_etapa("modelo"):
+            preds[pendientes] = modelo_activo.predict(new_data, thread_count=MODELO_HILOS)
+    return preds
+
+def predecir_registro(data: WageInput):
+    return float(predecir_registros([data])[0])
+
+async def usar_cache(metodo, *args):
+    # Con CACHE_COMPARTIDA la cache consulta SQLite (hasta 1 s de espera por locks):
+    # en un hilo, para no frenar el event loop; la cache local en memoria va directa
+    if cache.compartido is not None:
+        return await asyncio.to_thread(metodo, *args)
+    return metodo(*args)
+
+def campos_cache(data: WageInput):
+    # Clave normalizada: valores en el orden de los campos, enums por su valor
+    return tuple(getattr(v, "value", v) for v in data.__dict__.values())
+
+
+@app.get("/clasificacion/umbrales")
+def umbrales_clasificacion():
+    # Bordes de cada clase para el modelo activo: clase i = [bordes[i-1], bordes[i])
+    return {
+        "version": servido.version,
+        **servido.bandas.a_dict(),
+        "clases": [
+            {"clasificacion": c, "explicacion": explicar_clasificacion_salario(c)}
+            for c in range(NUMERO_CLASES)
+        ],
+    }
+
+
+@app.get("/vocabulario")
+def obtener_vocabulario():
+    return vocabulario.a_dict()
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(exponer_metricas(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/deriva")
+def deriva(recalcular: bool = False):
+    if monitor_deriva is None:
+        raise HTTPException(status_code=404, detail="Monitor de deriva desactivado (DERIVA_INTERVALO=0)")
+    if recalcular or monitor_deriva.reporte is None:
+        return monitor_deriva.calcular()
+    return monitor_deriva.reporte
+
+
+@app.get("/cache/estadisticas")
+def cache_estadisticas():
+    if cache is None:
+        return {"habilitada": False}
+    return {"habilitada": True, **cache.estadisticas()}
+
+
+@app.get("/inferencia/estadisticas")
+def inferencia_estadisticas():
+    return obtener_ejecutor().estadisticas()
+
+
+@app.get("/microlotes/estadisticas")
+def microlotes_estadisticas():
+    planificador = obtener_microlotes()
+    if planificador is None:
+        return {"habilitado": False}
+    return {"habilitado": True, **planificador.estadisticas()}
+
+
+@app.get("/explicaciones/estadisticas")
+def explicaciones_estadisticas():
+    servicio = obtener_explicaciones()
+    if servicio is None:
+        return {"habilitado": False}
+    return {"habilitado": True, **servicio.estadisticas()}
+
+
+@app.get("/explicaciones/{explicacion_id}")
+async def explicacion(explicacion_id: str):
+    servicio = obtener_explicaciones()
+    resultado = servicio.consultar(explicacion_id) if servicio is not None else None
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="Explicación no encontrada")
+    return resultado
+
+
 @app.post("/predict")
-def predict(data: WageInput):
+async def predict(data: WageInput, response: Response):
+    marcar_inicio_handler()
+    if monitor_deriva is not None:
+        monitor_deriva.observar(data)
+    if cache is not None:
+        respuesta = await usar_cache(cache.obtener, campos_cache(data))
+        if respuesta is not None:
+            marcar_fin_handler()
+            return respuesta
     try:
-        new_data = pd.DataFrame([data.dict()])
-        log_pred = modelo.predict(new_data)[0]
+        planificador = obtener_microlotes()
+        if planificador is not None:
+            log_pred, metricas = await planificador.predecir(data)
+        else:
+            log_pred, metricas = await obtener_ejecutor().ejecutar(predecir_registro, data)
+        agregar_metricas_cola(response, metricas)
 
         if usar_log:
             wage_pred = np.exp(log_pred)
         else:
             wage_pred = log_pred
 
-        print(f"Predicción modelo: {log_pred}, salario estimado: {wage_pred}")
+        logger.info("prediccion", extra={"campos": {
+            "prediccion_modelo": float(log_pred),
+            "salario_estimado": float(wage_pred),
+            "inferencia_ms": metricas.get("inferencia_ms"),
+            "tamano_lote": metricas.get("tamano_lote"),
+        }})
 
-        clasif = resumen_salario([wage_pred])
-        explicacion = explicar_clasificacion_salario(clasif)
-        prompt = generar_prompt_explicacion(wage_pred, clasif)
+        with medir_etapa("clasificacion"):
+            clasif = int(resumen_salario([wage_pred])[0])
+            explicacion = explicar_clasificacion_salario(clasif)
+            prompt = generar_prompt_explicacion(wage_pred, clasif)
 
-        return {
+        respuesta = {
             "prediccion_salario": round(float(wage_pred), 2),
             "clasificacion": clasif,
             "explicacion": explicacion,
             "mensaje_explicativo": prompt
         }
+        servicio = obtener_explicaciones()
+        if servicio is not None:
+            respuesta["explicacion_id"] = servicio.solicitar(wage_pred, clasif)
+        # Modo sombra: una muestra se puntúa con el candidato en otro hilo, sin esperar
+        evaluacion = sombra
+        if evaluacion is not None and evaluacion.muestrear():
+            evaluacion.enviar([data], [log_pred], metricas.get("inferencia_ms"))
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en predicción: {e}")
+    if cache is not None:
+        await usar_cache(cache.guardar, campos_cache(data), respuesta)
+    marcar_fin_handler()
+    return respuesta
+
+
+# -------------------------------
+# Predicción por lotes
+# -------------------------------
+
+# LOTE_MAX_FILAS acota las filas de /predict/batch y /predict/batch/archivo (413 si se pasa)
+MAX_FILAS_LOTE = int(os.getenv("LOTE_MAX_FILAS", "10000"))
+
+def verificar_tamano_lote(filas):
+    if filas > MAX_FILAS_LOTE:
+        raise HTTPException(status_code=413, detail=f"El lote tiene {filas} filas (máximo {MAX_FILAS_LOTE})")
+
+def normalizar_registros(registros: List[Any]):
+    # Normaliza las categorías por columna (una búsqueda por valor distinto);
+    # los valores desconocidos quedan igual y los rechaza la validación por fila
+    registros = [dict(r) if isinstance(r, dict) else r for r in registros]
+    dicts = [i for i, r in enumerate(registros) if isinstance(r, dict)]
+    for columna in COLUMNAS_VOCABULARIO:
+        indices = [i for i in dicts if isinstance(registros[i].get(columna), str)]
+        if not indices:
+            continue
+        normalizados, validos = vocabulario.normalizar_columna(columna, [registros[i][columna] for i in indices])
+        for i, valor, valido in zip(indices, normalizados, validos):
+            if valido:
+                registros[i][columna] = valor
+    return registros
+
+def predecir_lote(registros: List[Any]):
+    # Valida fila por fila; los errores se reportan sin tumbar el lote completo
+    registros = normalizar_registros(registros)
+    resultados: List[Dict[str, Any]] = [None] * len(registros)
+    validos = []
+    indices_validos = []
+    for i, registro in enumerate(registros):
+        if not isinstance(registro, dict):
+            resultados[i] = {"indice": i, "error": [
+                {"campo": "", "mensaje": f"Se esperaba un objeto con los campos de WageInput, no {type(registro).__name__}"}
+            ]}
+            continue
+        try:
+            validos.append(WageInput.model_validate(registro))
+            indices_validos.append(i)
+        except ValidationError as e:
+            errores = [
+                {"campo": ".".join(str(p) for p in err["loc"]), "mensaje": err["msg"]}
+                for err in e.errors()
+            ]
+            resultados[i] = {"indice": i, "error": errores}
+
+    if validos:
+        # Un solo DataFrame columnar y una sola llamada al modelo
+        log_pred = predecir_registros(validos)
+        wage_pred = np.exp(log_pred) if usar_log else log_pred
+
+        clasif = resumen_salario(wage_pred)
+        explicaciones = explicar_clasificacion_vector(clasif)
+        salarios = np.round(wage_pred, 2)
+
+        for j, i in enumerate(indices_validos):
+            resultados[i] = {
+                "indice": i,
+                "prediccion_salario": float(salarios[j]),
+                "clasificacion": int(clasif[j]),
+                "explicacion": explicaciones[j],
+            }
+
+    return {
+        "total": len(registros),
+        "validos": len(validos),
+        "errores": len(registros) - len(validos),
+        "resultados": resultados,
+    }
+
+
+@app.post("/predict/batch")
+async def predict_batch(registros: List[Any], response: Response):
+    # Cada elemento se valida por separado: uno que no es objeto es un error de esa fila
+    verificar_tamano_lote(len(registros))
+    try:
+        resultado, metricas = await obtener_ejecutor().ejecutar(predecir_lote, registros)
+        agregar_metricas_cola(response, metricas)
+        return resultado
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en predicción por lotes: {e}")
+
+
+def leer_registros_archivo(contenido: bytes, nombre: str, sep: str):
+    # NDJSON (.ndjson/.jsonl) o CSV con el mismo esquema de Wage.csv
+    if nombre.endswith((".ndjson", ".jsonl")):
+        lineas = contenido.decode("utf-8").splitlines()
+        return [json.loads(linea) for linea in lineas if linea.strip()]
+    import pandas as pd
+    df = pd.read_csv(io.BytesIO(contenido), sep=sep, dtype=str, keep_default_na=False)
+    return df.to_dict(orient="records")
+
+
+@app.post("/predict/batch/archivo")
+async def predict_batch_archivo(response: Response, archivo: UploadFile = File(...), sep: str = ";"):
+    ejecutor_activo = obtener_ejecutor()
+    try:
+        contenido = await archivo.read()
+        # Cota rápida por líneas antes de parsear (una línea de más por el encabezado CSV)
+        verificar_tamano_lote(contenido.count(b"\n") - 1)
+        registros, _ = await ejecutor_activo.ejecutar(
+            leer_registros_archivo, contenido, (archivo.filename or "").lower(), sep
+        )
+        verificar_tamano_lote(len(registros))
+    except HTTPException:
+        raise
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el archivo: {e}")
+    try:
+        resultado, metricas = await ejecutor_activo.ejecutar(predecir_lote, registros)
+        agregar_metricas_cola(response, metricas)
+        return resultado
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en predicción por lotes: {e}")
+
+
+# -------------------------------
+# Sensibilidad (what-if) y dependencia parcial
+# -------------------------------
+
+# SENSIBILIDAD_MAX_FILAS acota las filas puntuadas por solicitud (grilla x muestra)
+MAX_FILAS_SENSIBILIDAD = int(os.getenv("SENSIBILIDAD_MAX_FILAS", "100000"))
+RANGOS_NUMERICOS = {"age": (18, 80), "year": (2003, 2009)}
+
+class Barrido(BaseModel):
+    campo: Literal[tuple(COLUMNAS_ENTRADA)]
+    valores: Optional[List[Any]] = None
+    desde: Optional[int] = None
+    hasta: Optional[int] = None
+    paso: int = Field(1, gt=0)
+
+class SensibilidadInput(BaseModel):
+    base: Optional[WageInput] = None
+    barridos: List[Barrido] = Field(..., min_length=1, max_length=2)
+    dependencia_parcial: bool = False
+    muestra: int = Field(200, ge=1, le=5000)
+
+def valores_barrido(barrido: Barrido, base: WageInput):
+    # Valores pedidos, o por defecto el rango numérico o todo el vocabulario; cada
+    # valor se valida una sola vez sobre la base y queda en su forma canónica
+    if barrido.valores is not None:
+        valores = barrido.valores
+    elif barrido.campo in RANGOS_NUMERICOS:
+        minimo, maximo = RANGOS_NUMERICOS[barrido.campo]
+        valores = list(range(barrido.desde if barrido.desde is not None else minimo,
+                             (barrido.hasta if barrido.hasta is not None else maximo) + 1, barrido.paso))
+    else:
+        valores = vocabulario.valores[barrido.campo]
+    canonicos = []
+    for valor in valores:
+        try:
+            registro = WageInput.model_validate({**base.model_dump(mode="json"), barrido.campo: valor})
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={
+                "campo": barrido.campo, "valor": valor, "mensaje": e.errors()[0]["msg"],
+            })
+        canonico = getattr(getattr(registro, barrido.campo), "value", getattr(registro, barrido.campo))
+        if canonico not in canonicos:
+            canonicos.append(canonico)
+    if not canonicos:
+        raise HTTPException(status_code=422, detail={"campo": barrido.campo, "mensaje": "El barrido no tiene valores"})
+    return canonicos
+
+_muestra_dataset = None
+
+def muestra_dataset(n):
+    # Filas de Wage.csv (solo las columnas de entrada) para la dependencia parcial; muestra fija
+    global _muestra_dataset
+    if _muestra_dataset is None:
+        from almacen_datos import leer_dataset
+        datos = leer_dataset(os.getenv("RUTA_DATOS", "Wage.csv"), columnas=COLUMNAS_ENTRADA)
+        datos = datos.astype({c: str for c in COLUMNAS_VOCABULARIO})
+        _muestra_dataset = datos.sample(frac=1, random_state=0).to_dict(orient="records")
+    return _muestra_dataset[:n]
+
+def calcular_sensibilidad(base: Optional[WageInput], campos, valores, dependencia_parcial=False, muestra=200):
+    # Toda la grilla (x la muestra si es dependencia parcial) en una sola llamada vectorizada
+    grilla = list(itertools.product(*valores))
+    if dependencia_parcial:
+        filas = muestra_dataset(muestra)
+        registros = [
+            WageInput.model_construct(**{**fila, **dict(zip(campos, punto))})
+            for punto in grilla for fila in filas
+        ]
+    else:
+        filas = None
+        registros = [base.model_copy(update=dict(zip(campos, punto))) for punto in grilla]
+    if base is not None:
+        registros.append(base)
+    preds = predecir_registros(registros)
+    if usar_log:
+        preds = np.exp(preds)
+    prediccion_base = float(preds[-1]) if base is not None else None
+    curva = preds[:len(grilla) * (len(filas) if filas else 1)]
+    if filas:
+        curva = curva.reshape(len(grilla), len(filas)).mean(axis=1)
+    forma = [len(v) for v in valores]
+    return {
+        "campos": list(campos),
+        "valores": {c: v for c, v in zip(campos, valores)},
+        "predicciones": np.round(curva, 2).reshape(forma).tolist(),
+        "clasificacion": resumen_salario(curva).reshape(forma).tolist(),
+        "prediccion_base": round(prediccion_base, 2) if prediccion_base is not None else None,
+        "dependencia_parcial": dependencia_parcial,
+        "filas_muestra": len(filas) if filas else None,
+        "filas_puntuadas": len(registros),
+    }
+
+
+@app.post("/predict/sensibilidad")
+async def predict_sensibilidad(entrada: SensibilidadInput, response: Response):
+    # Barre uno o dos campos sobre un registro base (o, con dependencia_parcial, sobre
+    # una muestra de Wage.csv promediando) y devuelve la curva o la superficie
+    campos = [b.campo for b in entrada.barridos]
+    if len(set(campos)) != len(campos):
+        raise HTTPException(status_code=422, detail="Cada campo se puede barrer una sola vez")
+    if entrada.base is None and not entrada.dependencia_parcial:
+        raise HTTPException(status_code=422, detail="Falta el registro base (o usar dependencia_parcial)")
+    referencia = entrada.base or WageInput(**WageInput.model_config["json_schema_extra"]["example"])
+    valores = [valores_barrido(b, referencia) for b in entrada.barridos]
+    filas = int(np.prod([len(v) for v in valores])) * (entrada.muestra if entrada.dependencia_parcial else 1)
+    if filas > MAX_FILAS_SENSIBILIDAD:
+        raise HTTPException(status_code=422, detail=f"La grilla pide {filas} filas (máximo {MAX_FILAS_SENSIBILIDAD})")
+    try:
+        resultado, metricas = await obtener_ejecutor().ejecutar(
+            calcular_sensibilidad, entrada.base, campos, valores, entrada.dependencia_parcial, entrada.muestra
+        )
+        agregar_metricas_cola(response, metricas)
+        return resultado
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en el análisis de sensibilidad: {e}")
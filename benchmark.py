@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Benchmark reproducible del modelo y de la API. Mide:
+#   - importación de app y carga del modelo (en un proceso limpio),
+#   - modelo.predict con lotes de 1 a 100k filas muestreadas de Wage.csv,
+#   - /predict en proceso (cliente ASGI, sin red) con concurrencia creciente,
+#   - memoria residente máxima,
+#   - con --servidores N, `uvicorn app:app --workers N` contra servidor.py
+#     (workers preforkeados) por HTTP real: solicitudes por segundo por núcleo
+#     y RSS/PSS de cada worker.
+# Los resultados van a JSON con p50/p95/p99. Con --comparar se contrastan con
+# una línea base guardada y se marcan las regresiones.
+
+TAMANOS_LOTE = [1, 10, 100, 1_000, 10_000, 100_000]
+CONCURRENCIAS = [1, 4, 16, 64]
+CAMPOS_ENTRADA = ["age", "education", "jobclass", "health", "health_ins", "maritl", "race", "year"]
+SEMILLA = 0
+
+_SCRIPT_ARRANQUE = """
+import json, resource, time
+inicio = time.perf_counter()
+import app
+importacion = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app.obtener_modelo()
+carga = time.perf_counter() - inicio
+print(json.dumps({"importacion_s": importacion, "carga_modelo_s": carga,
+                  "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def percentiles(muestras_s):
+    ms = np.asarray(muestras_s, dtype=float) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def muestrear_filas(n, ruta_csv="Wage.csv"):
+    from almacen_datos import leer_dataset
+
+    df = leer_dataset(ruta_csv, columnas=CAMPOS_ENTRADA)
+    return df.sample(n=n, replace=True, random_state=SEMILLA).reset_index(drop=True)
+
+
+def medir_arranque(repeticiones=3):
+    # Proceso nuevo en cada repetición: mide imports y carga desde cero
+    entorno = {**os.environ, "PYTHONPATH": os.getcwd(), "PRECARGAR_MODELO": "0"}
+    resultados = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", _SCRIPT_ARRANQUE], env=entorno,
+                                capture_output=True, text=True, check=True)
+        resultados.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    return {
+        clave: round(float(np.median([r[clave] for r in resultados])), 3)
+        for clave in ("importacion_s", "carga_modelo_s", "rss_max_mb")
+    }
+
+
+def medir_modelo(modelo, tamanos=TAMANOS_LOTE, presupuesto_s=1.0, min_repeticiones=3):
+    filas = muestrear_filas(max(tamanos))
+    # Columnas como las arma app.py: texto sin categorías de pandas
+    filas = filas.astype({c: str for c in CAMPOS_ENTRADA if c not in ("age", "year")})
+    X_total = filas[list(modelo.feature_names_)]
+    modelo.predict(X_total.iloc[:1])
+    resultados = {}
+    for tamano in tamanos:
+        X = X_total.iloc[:tamano]
+        tiempos = []
+        inicio = time.perf_counter()
+        while len(tiempos) < min_repeticiones or (time.perf_counter() - inicio < presupuesto_s and len(tiempos) < 1000):
+            t0 = time.perf_counter()
+            modelo.predict(X)
+            tiempos.append(time.perf_counter() - t0)
+        resultados[str(tamano)] = {
+            **percentiles(tiempos),
+            "repeticiones": len(tiempos),
+            "filas_s": round(tamano / float(np.median(tiempos)), 1),
+        }
+        print(f"modelo.predict lote={tamano}: {resultados[str(tamano)]}", file=sys.stderr)
+    return resultados
+
+
+def cuerpos_predict(n):
+    filas = muestrear_filas(n)
+    return [
+        {c: (int(v) if c in ("age", "year") else str(v).strip()) for c, v in fila.items()}
+        for fila in filas.to_dict(orient="records")
+    ]
+
+
+async def _carga_api(app_mod, cuerpos, concurrencia, solicitudes):
+    import httpx
+
+    transporte = httpx.ASGITransport(app=app_mod.app)
+    latencias = []
+    estados = {}
+    siguiente = 0
+
+    async def trabajador(cliente):
+        nonlocal siguiente
+        while siguiente < solicitudes:
+            cuerpo = cuerpos[siguiente % len(cuerpos)]
+            siguiente += 1
+            t0 = time.perf_counter()
+            respuesta = await cliente.post("/predict", json=cuerpo)
+            latencias.append(time.perf_counter() - t0)
+            estados[respuesta.status_code] = estados.get(respuesta.status_code, 0) + 1
+
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(cliente) for _ in range(concurrencia)))
+        segundos = time.perf_counter() - inicio
+    return {
+        **percentiles(latencias),
+        "solicitudes": len(latencias),
+        "solicitudes_s": round(len(latencias) / segundos, 1),
+        "estados": {str(k): v for k, v in sorted(estados.items())},
+    }
+
+
+def medir_api(concurrencias=CONCURRENCIAS, solicitudes_por_nivel=500):
+    # Sin cache de respuestas: se mide el camino completo de /predict
+    os.environ.setdefault("CACHE_TAMANO", "0")
+    os.environ.setdefault("EXPLICACIONES_BACKEND", "local")
+    import app as app_mod
+
+    cuerpos = cuerpos_predict(solicitudes_por_nivel)
+
+    async def correr():
+        # lifespan_context ejecuta los eventos de startup/shutdown de la app
+        resultados = {}
+        async with app_mod.app.router.lifespan_context(app_mod.app):
+            app_mod.calentar_modelo()
+            for concurrencia in concurrencias:
+                resultados[str(concurrencia)] = await _carga_api(app_mod, cuerpos, concurrencia, solicitudes_por_nivel)
+                print(f"/predict concurrencia={concurrencia}: {resultados[str(concurrencia)]}", file=sys.stderr)
+        return resultados
+
+    return asyncio.run(correr())
+
+
+def procesos_hijos(pid):
+    # Sin psutil: el cuarto campo de /proc/<pid>/stat es el padre
+    hijos = []
+    for entrada in os.listdir("/proc"):
+        if entrada.isdigit():
+            try:
+                with open(f"/proc/{entrada}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        hijos.append(int(entrada))
+            except (OSError, IndexError, ValueError):
+                continue
+    return hijos
+
+
+def memoria_proceso(pid):
+    # RSS cuenta completas las páginas compartidas; PSS las reparte entre los procesos que las usan
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                valores[partes[0][:-1]] = int(partes[1]) / 1024
+    return {
+        "rss_mb": round(valores["Rss"], 1),
+        "pss_mb": round(valores["Pss"], 1),
+        "privada_mb": round(valores["Private_Clean"] + valores["Private_Dirty"], 1),
+    }
+
+
+def _comando_servidor(tipo, trabajadores, puerto):
+    if tipo == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(puerto),
+                "--workers", str(trabajadores), "--log-level", "warning"]
+    return [sys.executable, "servidor.py", "--host", "127.0.0.1", "--puerto", str(puerto),
+            "--trabajadores", str(trabajadores), "--log-nivel", "warning"]
+
+
+def _esperar_listo(url, timeout_s=120, seguidas=10):
+    # /ready con conexiones nuevas cae en workers distintos: se piden varias respuestas 200 seguidas
+    import httpx
+
+    limite = time.perf_counter() + timeout_s
+    ok = 0
+    while ok < seguidas:
+        if time.perf_counter() > limite:
+            raise RuntimeError(f"{url} no quedó listo en {timeout_s} s")
+        try:
+            ok = ok + 1 if httpx.get(f"{url}/ready", timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            ok = 0
+        if not ok:
+            time.sleep(0.2)
+
+
+async def _carga_http(url, cuerpos, concurrencia, duracion_s):
+    import httpx
+
+    latencias = []
+    estados = {}
+    siguiente = 0
+    limite = time.perf_counter() + duracion_s
+
+    async def trabajador(cliente):
+        nonlocal siguiente
+        while time.perf_counter() < limite:
+            cuerpo = cuerpos[siguiente % len(cuerpos)]
+            siguiente += 1
+            t0 = time.perf_counter()
+            try:
+                estado = (await cliente.post("/predict", json=cuerpo)).status_code
+            except httpx.HTTPError:
+                estado = "error_red"
+            latencias.append(time.perf_counter() - t0)
+            estados[estado] = estados.get(estado, 0) + 1
+
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30) as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(cliente) for _ in range(concurrencia)))
+        segundos = time.perf_counter() - inicio
+    return latencias, estados, segundos
+
+
+def medir_servidor(tipo, trabajadores, cuerpos, concurrencia=32, duracion_s=10.0):
+    # Levanta el servidor en un puerto libre, lo carga por HTTP real y mide la memoria de cada proceso
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    url = f"http://127.0.0.1:{puerto}"
+    entorno = {**os.environ, "CACHE_TAMANO": "0", "LOG_MUESTREO": "0", "EXPLICACIONES_BACKEND": "local"}
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(_comando_servidor(tipo, trabajadores, puerto), env=entorno)
+    try:
+        _esperar_listo(url)
+        arranque = time.perf_counter() - inicio
+        asyncio.run(_carga_http(url, cuerpos, concurrencia, min(2.0, duracion_s)))  # calentamiento
+        latencias, estados, segundos = asyncio.run(_carga_http(url, cuerpos, concurrencia, duracion_s))
+
+        # Memoria después de la carga: las páginas compartidas que los workers tocaron ya se copiaron
+        hijos = procesos_hijos(proceso.pid)
+        workers = [pid for pid in hijos if b"resource_tracker" not in open(f"/proc/{pid}/cmdline", "rb").read()]
+        workers = workers or [proceso.pid]  # uvicorn con un solo worker sirve en el proceso principal
+        memoria = [memoria_proceso(pid) for pid in workers]
+        total_pss = sum(memoria_proceso(pid)["pss_mb"] for pid in set([proceso.pid] + hijos))
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+            proceso.wait()
+
+    nucleos = min(trabajadores, os.cpu_count() or 1)
+    solicitudes_s = len(latencias) / segundos
+    return {
+        "trabajadores": trabajadores,
+        "arranque_s": round(arranque, 2),
+        **percentiles(latencias),
+        "solicitudes": len(latencias),
+        "solicitudes_s": round(solicitudes_s, 1),
+        "solicitudes_s_por_nucleo": round(solicitudes_s / nucleos, 1),
+        "estados": {str(k): v for k, v in sorted(estados.items(), key=str)},
+        **{f"worker_{clave}": round(float(np.mean([m[clave] for m in memoria])), 1) for clave in memoria[0]},
+        "total_pss_mb": round(total_pss, 1),
+    }
+
+
+def medir_servidores(trabajadores, concurrencia=32, duracion_s=10.0):
+    # `uvicorn app:app --workers N` contra `servidor.py --trabajadores N`, con los mismos cuerpos
+    cuerpos = cuerpos_predict(1000)
+    resultados = {}
+    for tipo in ("uvicorn", "prefork"):
+        resultados[tipo] = medir_servidor(tipo, trabajadores, cuerpos, concurrencia, duracion_s)
+        print(f"servidor {tipo} x{trabajadores}: {resultados[tipo]}", file=sys.stderr)
+    return resultados
+
+
+def ejecutar(ruta_modelo="best_wage_model.joblib", rapido=False, servidores=0, duracion_servidores=10.0):
+    from carga_modelo import cargar_modelo
+    from tabla_predicciones import hash_archivo
+
+    tamanos = TAMANOS_LOTE[:4] if rapido else TAMANOS_LOTE
+    concurrencias = CONCURRENCIAS[:2] if rapido else CONCURRENCIAS
+    resultados = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "modelo_sha256": hash_archivo(ruta_modelo),
+        "arranque": medir_arranque(1 if rapido else 3),
+    }
+    print(f"arranque: {resultados['arranque']}", file=sys.stderr)
+    resultados["modelo_predict"] = medir_modelo(cargar_modelo(ruta_modelo), tamanos,
+                                                presupuesto_s=0.3 if rapido else 1.0)
+    resultados["api_predict"] = medir_api(concurrencias, 100 if rapido else 500)
+    resultados["rss_max_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if servidores:
+        resultados["servidores"] = medir_servidores(servidores, duracion_s=duracion_servidores)
+    return resultados
+
+
+def _metricas(resultados):
+    # Aplana el JSON a {nombre: (valor, mayor_es_mejor, es_cola)}
+    metricas = {}
+    for clave in ("importacion_s", "carga_modelo_s", "rss_max_mb"):
+        metricas[f"arranque.{clave}"] = (resultados["arranque"][clave], False, False)
+    for seccion, rendimiento in (("modelo_predict", "filas_s"), ("api_predict", "solicitudes_s")):
+        for nivel, valores in resultados.get(seccion, {}).items():
+            for p in ("p50_ms", "p95_ms", "p99_ms"):
+                metricas[f"{seccion}.{nivel}.{p}"] = (valores[p], False, p != "p50_ms")
+            metricas[f"{seccion}.{nivel}.{rendimiento}"] = (valores[rendimiento], True, False)
+    metricas["rss_max_mb"] = (resultados["rss_max_mb"], False, False)
+    for tipo, valores in resultados.get("servidores", {}).items():
+        metricas[f"servidores.{tipo}.solicitudes_s_por_nucleo"] = (valores["solicitudes_s_por_nucleo"], True, False)
+        for clave in ("worker_pss_mb", "total_pss_mb"):
+            metricas[f"servidores.{tipo}.{clave}"] = (valores[clave], False, False)
+    return metricas
+
+
+def comparar(actual, base, tolerancia=0.2, tolerancia_cola=1.0):
+    # Regresión: la métrica empeora más que la tolerancia relativa respecto a la base.
+    # p95/p99 son mucho más ruidosos que la mediana, por eso tienen su propia tolerancia
+    regresiones = []
+    metricas_base = _metricas(base)
+    for nombre, (valor, mayor_es_mejor, es_cola) in _metricas(actual).items():
+        if nombre not in metricas_base or not metricas_base[nombre][0]:
+            continue
+        referencia = metricas_base[nombre][0]
+        cambio = (valor - referencia) / referencia
+        empeora = -cambio if mayor_es_mejor else cambio
+        marca = "REGRESIÓN" if empeora > (tolerancia_cola if es_cola else tolerancia) else ""
+        print(f"{nombre:40s} {referencia:>12.3f} -> {valor:>12.3f} ({cambio:+.1%}) {marca}")
+        if marca:
+            regresiones.append({"metrica": nombre, "base": referencia, "actual": valor, "cambio": round(cambio, 4)})
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del modelo de salarios y de la API")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    parser.add_argument("--salida", default="benchmark.json")
+    parser.add_argument("--comparar", default=None, help="JSON de línea base contra el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo permitido (0.2 = 20%%)")
+    parser.add_argument("--tolerancia-cola", type=float, default=1.0, help="Igual, para p95/p99")
+    parser.add_argument("--rapido", action="store_true", help="Menos tamaños, niveles y repeticiones")
+    parser.add_argument("--servidores", type=int, default=0, metavar="N",
+                        help="Además compara uvicorn --workers N con servidor.py --trabajadores N por HTTP")
+    parser.add_argument("--duracion-servidores", type=float, default=10.0, help="Segundos de carga por servidor")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.modelo, args.rapido, args.servidores, args.duracion_servidores)
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        if base.get("modelo_sha256") != resultados["modelo_sha256"]:
+            print("Aviso: la línea base se midió con otro archivo de modelo", file=sys.stderr)
+        resultados["regresiones"] = comparar(resultados, base, args.tolerancia, args.tolerancia_cola)
+    with open(args.salida, "w") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.salida}")
+    if resultados.get("regresiones"):
+        print(f"{len(resultados['regresiones'])} métricas con regresión")
+        sys.exit(1)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from tabla_predicciones import hash_archivo
+
+# Cache LRU con TTL para las respuestas de /predict. Las claves incluyen el hash
+# del modelo servido y de sus bandas de clasificación, así que ni un modelo nuevo
+# ni bandas nuevas reutilizan entradas anteriores. La cache se invalida cuando el
+# modelo en memoria cambia (cambiar_modelo), no cuando cambia el archivo en disco:
+# hasta que se recarga, el archivo nuevo no es lo que se está sirviendo.
+# El backend compartido (SQLite) permite que varios workers de uvicorn de la
+# misma máquina compartan entradas.
+
+# Mismo logger JSON de la API (observabilidad.configurar_logging)
+logger = logging.getLogger("wage_api")
+
+
+def version_servida(ruta_modelo, bandas):
+    # Hash del modelo + hash de las bandas (dict de BandasSalario.a_dict)
+    huella_bandas = hashlib.sha256(json.dumps(bandas, sort_keys=True).encode("utf-8")).hexdigest()
+    return hash_archivo(ruta_modelo)[:16] + huella_bandas[:16]
+
+
+class BackendSQLite:
+
+    def __init__(self, ruta, tamano_maximo):
+        self.ruta = ruta
+        self.tamano_maximo = tamano_maximo
+        self.local = threading.local()
+        with self._conexion() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS predicciones "
+                "(clave TEXT PRIMARY KEY, valor TEXT, expira REAL, creado REAL)"
+            )
+
+    def _conexion(self):
+        # Una conexión por hilo; WAL permite lectores concurrentes entre procesos
+        con = getattr(self.local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=1.0, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self.local.con = con
+        return con
+
+    def obtener(self, clave):
+        fila = self._conexion().execute(
+            "SELECT valor FROM predicciones WHERE clave = ? AND expira > ?", (clave, time.time())
+        ).fetchone()
+        return None if fila is None else json.loads(fila[0])
+
+    def guardar(self, clave, valor, ttl):
+        ahora = time.time()
+        con = self._conexion()
+        con.execute(
+            "INSERT OR REPLACE INTO predicciones VALUES (?, ?, ?, ?)",
+            (clave, json.dumps(valor), ahora + ttl, ahora),
+        )
+        # Recorte ocasional por antigüedad para respetar el tamaño máximo
+        if hash(clave) % 100 == 0:
+            con.execute("DELETE FROM predicciones WHERE expira <= ?", (ahora,))
+            con.execute(
+                "DELETE FROM predicciones WHERE clave IN (SELECT clave FROM predicciones "
+                "ORDER BY creado DESC LIMIT -1 OFFSET ?)",
+                (self.tamano_maximo,),
+            )
+
+    def limpiar(self):
+        self._conexion().execute("DELETE FROM predicciones")
+
+
+class CachePredicciones:
+
+    def __init__(self, ruta_modelo, bandas, tamano_maximo=10_000, ttl=3600.0, ruta_compartida=None):
+        self.tamano_maximo = tamano_maximo
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+        self.compartido = BackendSQLite(ruta_compartida, tamano_maximo) if ruta_compartida else None
+
+        self.aciertos = 0
+        self.aciertos_compartidos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expirados = 0
+        self.invalidaciones = 0
+
+        self.version_modelo = version_servida(ruta_modelo, bandas)
+
+    def cambiar_modelo(self, ruta_modelo, bandas):
+        # Cambio de versión en memoria (registro): claves nuevas
+        self.invalidar(version_servida(ruta_modelo, bandas))
+
+    def invalidar(self, version):
+        # Vacía la cache local; las entradas compartidas de la versión anterior quedan inalcanzables
+        with self.lock:
+            self.version_modelo = version
+            self.entradas.clear()
+            self.invalidaciones += 1
+
+    def clave(self, campos):
+        return self.version_modelo + "|" + "|".join(str(v) for v in campos)
+
+    def obtener(self, campos):
+        clave = self.clave(campos)
+        ahora = time.monotonic()
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is not None:
+                expira, valor = entrada
+                if expira > ahora:
+                    self.entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self.entradas[clave]
+                self.expirados += 1
+        if self.compartido is not None:
+            valor = self.compartido.obtener(clave)
+            if valor is not None:
+                self._guardar_local(clave, valor, ahora)
+                with self.lock:
+                    self.aciertos_compartidos += 1
+                return valor
+        with self.lock:
+            self.fallos += 1
+        return None
+
+    def _guardar_local(self, clave, valor, ahora):
+        with self.lock:
+            self.entradas[clave] = (ahora + self.ttl, valor)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.tamano_maximo:
+                self.entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def guardar(self, campos, valor):
+        clave = self.clave(campos)
+        self._guardar_local(clave, valor, time.monotonic())
+        if self.compartido is not None:
+            try:
+                self.compartido.guardar(clave, valor, self.ttl)
+            except sqlite3.Error as e:
+                logger.warning("No se pudo escribir en la cache compartida", extra={"campos": {"error": str(e)}})
+
+    def limpiar(self):
+        with self.lock:
+            self.entradas.clear()
+        if self.compartido is not None:
+            self.compartido.limpiar()
+
+    def estadisticas(self):
+        with self.lock:
+            consultas = self.aciertos + self.aciertos_compartidos + self.fallos
+            return {
+                "tamano": len(self.entradas),
+                "tamano_maximo": self.tamano_maximo,
+                "ttl_segundos": self.ttl,
+                "compartida": self.compartido is not None,
+                "aciertos": self.aciertos,
+                "aciertos_compartidos": self.aciertos_compartidos,
+                "fallos": self.fallos,
+                "tasa_aciertos": (self.aciertos + self.aciertos_compartidos) / consultas if consultas else 0.0,
+                "desalojos": self.desalojos,
+                "expirados": self.expirados,
+                "invalidaciones": self.invalidaciones,
+                "version_modelo": self.version_modelo,
+            }
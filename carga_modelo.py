@@ -0,0 +1,51 @@
+import argparse
+import os
+import time
+
+# Carga del modelo de salarios. Si junto al .joblib existe un .cbm (formato
+# nativo de CatBoost) exportado de ese mismo joblib, se usa ese: no hay unpickle
+# ni dependencia de las versiones exactas con las que se serializó el joblib. La
+# exportación guarda el hash del joblib en <modelo>.cbm.sha256; si no coincide
+# (o falta) el .cbm se ignora, sin importar las fechas de los archivos.
+
+
+def ruta_nativa(ruta_modelo):
+    return os.path.splitext(ruta_modelo)[0] + ".cbm"
+
+
+def nativa_vigente(ruta_modelo):
+    cbm = ruta_nativa(ruta_modelo)
+    try:
+        with open(cbm + ".sha256", encoding="utf-8") as f:
+            origen = f.read().strip()
+    except FileNotFoundError:
+        return False
+    from tabla_predicciones import hash_archivo
+    return os.path.exists(cbm) and origen == hash_archivo(ruta_modelo)
+
+
+def cargar_modelo(ruta_modelo="best_wage_model.joblib"):
+    if nativa_vigente(ruta_modelo):
+        from catboost import CatBoostRegressor
+        return CatBoostRegressor().load_model(ruta_nativa(ruta_modelo))
+    import joblib
+    return joblib.load(ruta_modelo)
+
+
+def exportar_nativo(ruta_modelo="best_wage_model.joblib"):
+    import joblib
+    modelo = joblib.load(ruta_modelo)
+    cbm = ruta_nativa(ruta_modelo)
+    modelo.save_model(cbm)
+    from tabla_predicciones import hash_archivo
+    with open(cbm + ".sha256", "w", encoding="utf-8") as f:
+        f.write(hash_archivo(ruta_modelo) + "\n")
+    return cbm
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el modelo joblib al formato nativo de CatBoost (.cbm)")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    args = parser.parse_args()
+    inicio = time.perf_counter()
+    print(f"Modelo exportado a {exportar_nativo(args.modelo)} en {time.perf_counter() - inicio:.2f} s")
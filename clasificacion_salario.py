@@ -0,0 +1,88 @@
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+# Clasificación salarial por bandas de cuantiles de Wage.csv. Los bordes se
+# calculan una vez y se guardan junto al modelo (<modelo>.bandas.json), así
+# cada versión del modelo clasifica con sus propias bandas. Clasificar es un
+# np.searchsorted sobre el arreglo completo de predicciones.
+#
+# Los cuantiles por defecto reproducen aproximadamente los umbrales fijos
+# anteriores (70, 95, 120, 145 y 170 mil dólares).
+
+CUANTILES_POR_DEFECTO = (0.10, 0.40, 0.70, 0.88, 0.97)
+NUMERO_CLASES = 6
+
+
+def ruta_bandas(ruta_modelo):
+    return os.path.splitext(ruta_modelo)[0] + ".bandas.json"
+
+
+def leer_salarios(ruta_csv="Wage.csv", columna="wage", sep=";"):
+    with open(ruta_csv, newline="", encoding="utf-8") as f:
+        return np.array([float(fila[columna]) for fila in csv.DictReader(f, delimiter=sep)])
+
+
+class BandasSalario:
+
+    def __init__(self, bordes, cuantiles=None, origen="fijo"):
+        bordes = np.asarray(bordes, dtype=float)
+        if len(bordes) != NUMERO_CLASES - 1:
+            raise ValueError(f"Se esperan {NUMERO_CLASES - 1} bordes, hay {len(bordes)}")
+        if np.any(np.diff(bordes) <= 0):
+            raise ValueError(f"Los bordes deben ser estrictamente crecientes: {bordes.tolist()}")
+        self.bordes = bordes
+        self.cuantiles = list(cuantiles) if cuantiles is not None else None
+        self.origen = origen
+
+    @classmethod
+    def desde_datos(cls, ruta_csv="Wage.csv", cuantiles=CUANTILES_POR_DEFECTO, columna="wage"):
+        salarios = leer_salarios(ruta_csv, columna)
+        bordes = np.round(np.quantile(salarios, cuantiles), 2)
+        return cls(bordes, cuantiles, origen=os.path.basename(ruta_csv))
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos["bordes"], datos.get("cuantiles"), datos.get("origen", "fijo"))
+
+    def guardar(self, ruta, **extra):
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({**self.a_dict(), **extra}, f, indent=2, ensure_ascii=False)
+        os.replace(ruta + ".tmp", ruta)
+
+    def clasificar(self, salarios):
+        # Clase 0 por debajo del primer borde, 5 desde el último (borde incluido en la clase superior)
+        return np.searchsorted(self.bordes, np.asarray(salarios, dtype=float), side="right")
+
+    def a_dict(self):
+        return {"bordes": self.bordes.tolist(), "cuantiles": self.cuantiles, "origen": self.origen}
+
+
+def cargar_bandas(ruta_modelo, ruta_csv="Wage.csv", cuantiles=None):
+    # Cuantiles explícitos (CLASIFICACION_CUANTILES) mandan sobre las bandas guardadas
+    # con el modelo; sin ellos se usan las guardadas y, si no hay, los cuantiles por defecto
+    ruta = ruta_bandas(ruta_modelo)
+    if cuantiles is None and os.path.exists(ruta):
+        return BandasSalario.cargar(ruta)
+    return BandasSalario.desde_datos(ruta_csv, cuantiles or CUANTILES_POR_DEFECTO)
+
+
+def cuantiles_desde_texto(texto):
+    return tuple(float(c) for c in texto.split(",")) if texto else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula las bandas de clasificación salarial y las guarda junto al modelo")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    parser.add_argument("--csv", default="Wage.csv")
+    parser.add_argument("--cuantiles", default=",".join(str(c) for c in CUANTILES_POR_DEFECTO))
+    args = parser.parse_args()
+    bandas = BandasSalario.desde_datos(args.csv, cuantiles_desde_texto(args.cuantiles))
+    ruta = ruta_bandas(args.modelo)
+    bandas.guardar(ruta)
+    print(f"Bordes {bandas.bordes.tolist()} (cuantiles {bandas.cuantiles}) -> {ruta}")
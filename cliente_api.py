@@ -0,0 +1,119 @@
+import asyncio
+import collections
+import json
+import random
+import threading
+
+import httpx
+
+# Cliente de la API para el dashboard. Streamlit re-ejecuta el script en cada
+# interacción, así que el cliente se crea una vez (st.cache_resource) y mantiene
+# un pool de conexiones keep-alive de httpx en un event loop propio en un hilo
+# aparte; los métodos síncronos solo encolan la corrutina y esperan su resultado.
+#
+# - Reintentos acotados con backoff exponencial y jitter ante errores de red,
+#   timeouts y 502/503/504 (respetando Retry-After).
+# - Solicitudes idénticas en vuelo se combinan: la segunda espera la respuesta
+#   de la primera en lugar de enviar otra.
+# - predecir_lote puntúa una tabla completa de perfiles en una sola solicitud.
+
+ESTADOS_REINTENTABLES = {502, 503, 504}
+
+
+class ErrorAPI(Exception):
+
+    def __init__(self, estado, detalle):
+        super().__init__(f"{estado}: {detalle}" if estado else str(detalle))
+        self.estado = estado
+        self.detalle = detalle
+
+
+class ClienteAPI:
+
+    def __init__(self, url_base, timeout=10.0, timeout_conexion=3.0, intentos=3, espera_base=0.2,
+                 espera_maxima=2.0, max_conexiones=10):
+        self.url_base = url_base.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=timeout_conexion)
+        self.intentos = intentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.limites = httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones)
+        self.en_vuelo = {}
+        self.contadores = collections.Counter()
+
+        self.loop = asyncio.new_event_loop()
+        self.hilo = threading.Thread(target=self.loop.run_forever, name="cliente-api", daemon=True)
+        self.hilo.start()
+        # El AsyncClient se crea dentro del loop que lo va a usar
+        self.cliente = self._ejecutar(self._crear_cliente(), None)
+
+    async def _crear_cliente(self):
+        return httpx.AsyncClient(base_url=self.url_base, timeout=self.timeout, limits=self.limites)
+
+    def _ejecutar(self, corrutina, timeout):
+        return asyncio.run_coroutine_threadsafe(corrutina, self.loop).result(timeout)
+
+    def _espera(self, intento, respuesta=None):
+        if respuesta is not None and respuesta.headers.get("Retry-After", "").isdigit():
+            return min(float(respuesta.headers["Retry-After"]), self.espera_maxima)
+        return min(self.espera_base * 2 ** intento, self.espera_maxima) * random.uniform(0.5, 1.0)
+
+    async def _enviar(self, metodo, ruta, cuerpo=None, params=None):
+        for intento in range(self.intentos):
+            self.contadores["solicitudes"] += 1
+            try:
+                respuesta = await self.cliente.request(metodo, ruta, json=cuerpo, params=params)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if intento == self.intentos - 1:
+                    self.contadores["errores"] += 1
+                    raise ErrorAPI(None, f"No se pudo conectar con la API: {e}") from e
+                espera = self._espera(intento)
+            else:
+                if respuesta.status_code in ESTADOS_REINTENTABLES and intento < self.intentos - 1:
+                    espera = self._espera(intento, respuesta)
+                elif respuesta.is_error:
+                    self.contadores["errores"] += 1
+                    try:
+                        detalle = respuesta.json().get("detail", respuesta.text)
+                    except ValueError:
+                        detalle = respuesta.text
+                    raise ErrorAPI(respuesta.status_code, detalle)
+                else:
+                    return respuesta.json()
+            self.contadores["reintentos"] += 1
+            await asyncio.sleep(espera)
+
+    async def solicitar(self, metodo, ruta, cuerpo=None, params=None):
+        # Combina solicitudes idénticas en vuelo (mismo método, ruta, parámetros y cuerpo)
+        clave = (metodo, ruta, json.dumps(params, sort_keys=True), json.dumps(cuerpo, sort_keys=True))
+        futuro = self.en_vuelo.get(clave)
+        if futuro is not None:
+            self.contadores["combinadas"] += 1
+            return await asyncio.shield(futuro)
+        futuro = asyncio.ensure_future(self._enviar(metodo, ruta, cuerpo, params))
+        self.en_vuelo[clave] = futuro
+        futuro.add_done_callback(lambda _: self.en_vuelo.pop(clave, None))
+        return await asyncio.shield(futuro)
+
+    # Interfaz síncrona para el script de Streamlit
+
+    def obtener(self, ruta, params=None, timeout=None):
+        return self._ejecutar(self.solicitar("GET", ruta, params=params), timeout)
+
+    def predecir(self, registro, timeout=None):
+        return self._ejecutar(self.solicitar("POST", "/predict", registro), timeout)
+
+    def predecir_lote(self, registros, timeout=None):
+        # Una sola solicitud a /predict/batch; los resultados vuelven en el orden de entrada
+        return self._ejecutar(self.solicitar("POST", "/predict/batch", list(registros)), timeout)
+
+    def sensibilidad(self, cuerpo, timeout=None):
+        # Curva o superficie what-if completa en una sola solicitud a /predict/sensibilidad
+        return self._ejecutar(self.solicitar("POST", "/predict/sensibilidad", cuerpo), timeout)
+
+    def estadisticas(self):
+        return {**self.contadores, "en_vuelo": len(self.en_vuelo)}
+
+    def cerrar(self):
+        self._ejecutar(self.cliente.aclose(), 5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
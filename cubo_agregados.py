@@ -0,0 +1,301 @@
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from almacen_datos import cambio_archivo, leer_bloques_csv, origen_archivo
+from vocabulario import clave
+
+# Cubo de agregados del salario para el dashboard. Para cada subconjunto de las
+# dimensiones (educación, raza, clase de trabajo y banda de edad) guarda arreglos
+# densos indexados por los códigos de esas dimensiones con el conteo, la media,
+# la suma de cuadrados de desviaciones (varianza), mínimo, máximo y un histograma
+# del salario en bins finos del que salen mediana y cuantiles. Un corte es
+# indexar esos arreglos: su costo no depende del número de filas.
+#
+# Media y varianza se combinan con la fórmula de Chan, así que agregar filas
+# nuevas actualiza el cubo sin volver a leer las anteriores. actualizar_desde_csv
+# recuerda hasta qué byte del CSV procesó y, si el archivo solo creció por el
+# final, lee únicamente lo agregado.
+
+DIMENSIONES = ["education", "race", "jobclass", "banda_edad"]
+BORDES_EDAD = (25, 35, 45, 55, 65)
+BANDAS_EDAD = ["18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+ORDEN = {
+    "education": ["< HS Grad", "HS Grad", "Some College", "College Grad", "Advanced Degree"],
+    "banda_edad": BANDAS_EDAD,
+}
+ANCHO_BIN = 0.5
+SALARIO_MAXIMO_HISTOGRAMA = 350.0
+FORMATO_CUBO = 1
+
+
+def ruta_cubo(ruta_csv):
+    return os.path.splitext(ruta_csv)[0] + ".cubo.npz"
+
+
+def banda_edad(edades):
+    return np.asarray(BANDAS_EDAD, dtype=object)[np.searchsorted(BORDES_EDAD, np.asarray(edades), side="right")]
+
+
+def ordenar_valores(dimension, valores):
+    # Orden natural si se conoce (educación, edad); si no, alfabético sin espacios
+    orden = {clave(v): i for i, v in enumerate(ORDEN.get(dimension, []))}
+    return sorted(valores, key=lambda v: (orden.get(clave(v), len(orden)), clave(v)))
+
+
+def _estadistico_orden(hist, acumulado, k, ancho):
+    # Valor aproximado del k-ésimo menor salario (k desde 0): bin que lo contiene,
+    # repartiendo uniformemente las observaciones del bin
+    indice = np.argmax(acumulado > k[..., None], axis=-1)
+    previo = np.where(indice > 0, np.take_along_axis(acumulado, np.maximum(indice - 1, 0)[..., None], -1)[..., 0], 0)
+    en_bin = np.maximum(np.take_along_axis(hist, indice[..., None], -1)[..., 0], 1)
+    return (indice + (k - previo + 0.5) / en_bin) * ancho
+
+
+def _cuantiles(hist, conteo, minimo, maximo, cuantiles, ancho):
+    # Misma interpolación lineal entre rangos que np.quantile, con error de a lo sumo un bin
+    acumulado = np.cumsum(hist, axis=-1)
+    resultado = {}
+    for q in cuantiles:
+        rango = q * np.maximum(conteo - 1, 0)
+        abajo = np.floor(rango)
+        valor = _estadistico_orden(hist, acumulado, abajo, ancho)
+        arriba = _estadistico_orden(hist, acumulado, np.minimum(abajo + 1, np.maximum(conteo - 1, 0)), ancho)
+        valor = np.clip(valor + (rango - abajo) * (arriba - valor), minimo, maximo)
+        resultado[q] = np.where(conteo > 0, valor, np.nan)
+    return resultado
+
+
+class CuboSalarios:
+
+    def __init__(self, dimensiones=DIMENSIONES, ancho_bin=ANCHO_BIN, salario_maximo=SALARIO_MAXIMO_HISTOGRAMA):
+        self.dimensiones = list(dimensiones)
+        self.ancho_bin = ancho_bin
+        self.salario_maximo = salario_maximo
+        # El último bin acumula todo lo que supera salario_maximo
+        self.bins = int(np.ceil(salario_maximo / ancho_bin)) + 1
+        self.valores = {d: list(BANDAS_EDAD) if d == "banda_edad" else [] for d in self.dimensiones}
+        self.codigos = {d: {v: i for i, v in enumerate(vs)} for d, vs in self.valores.items()}
+        self.grupos = [g for k in range(len(self.dimensiones) + 1) for g in itertools.combinations(self.dimensiones, k)]
+        self.celdas = {g: self._vacias(self._forma(g)) for g in self.grupos}
+        self.filas = 0
+        self.origen = None
+        self.lock = threading.RLock()
+
+    def _forma(self, grupo):
+        return tuple(len(self.valores[d]) for d in grupo)
+
+    def _vacias(self, forma):
+        return {
+            "n": np.zeros(forma, dtype=np.int64),
+            "media": np.zeros(forma),
+            "m2": np.zeros(forma),
+            "minimo": np.full(forma, np.inf),
+            "maximo": np.full(forma, -np.inf),
+            "hist": np.zeros(forma + (self.bins,), dtype=np.int32),
+        }
+
+    def _ampliar(self, dimension, nuevos):
+        # Categorías que no estaban: se agregan al final y los arreglos crecen con ceros en ese eje
+        for valor in nuevos:
+            self.codigos[dimension][valor] = len(self.valores[dimension])
+            self.valores[dimension].append(valor)
+        relleno = {"n": 0, "media": 0.0, "m2": 0.0, "minimo": np.inf, "maximo": -np.inf, "hist": 0}
+        for grupo, celdas in self.celdas.items():
+            if dimension not in grupo:
+                continue
+            eje = grupo.index(dimension)
+            for nombre, arreglo in celdas.items():
+                ancho = [(0, 0)] * arreglo.ndim
+                ancho[eje] = (0, len(nuevos))
+                celdas[nombre] = np.pad(arreglo, ancho, constant_values=relleno[nombre])
+
+    def agregar(self, df):
+        # df con las columnas de Wage.csv; banda_edad se deriva de age
+        with self.lock:
+            salarios = df["wage"].to_numpy(dtype=float)
+            valido = np.isfinite(salarios)
+            salarios = salarios[valido]
+            if len(salarios) == 0:
+                return 0
+            codigos = {}
+            for d in self.dimensiones:
+                columna = banda_edad(df["age"].to_numpy()) if d == "banda_edad" else df[d].to_numpy(dtype=object)
+                unicos, inversa = np.unique(columna[valido].astype(str), return_inverse=True)
+                nuevos = [u for u in unicos if u not in self.codigos[d]]
+                if nuevos:
+                    self._ampliar(d, nuevos)
+                codigos[d] = np.array([self.codigos[d][u] for u in unicos], dtype=np.intp)[inversa]
+            bins = np.minimum((salarios / self.ancho_bin).astype(np.intp), self.bins - 1).clip(0)
+
+            for grupo in self.grupos:
+                forma = self._forma(grupo)
+                tamano = int(np.prod(forma))
+                indice = (np.ravel_multi_index([codigos[d] for d in grupo], forma) if grupo
+                          else np.zeros(len(salarios), dtype=np.intp))
+                c = self.celdas[grupo]
+                n_b = np.bincount(indice, minlength=tamano).reshape(forma)
+                media_b = np.divide(np.bincount(indice, salarios, tamano).reshape(forma), n_b,
+                                    out=np.zeros(forma), where=n_b > 0)
+                m2_b = np.bincount(indice, (salarios - media_b.reshape(-1)[indice]) ** 2, tamano).reshape(forma)
+                # Combinación de Chan de (n, media, m2) existentes con los del lote
+                n = c["n"] + n_b
+                delta = media_b - c["media"]
+                peso = np.divide(n_b, n, out=np.zeros(forma), where=n > 0)
+                c["media"] = c["media"] + delta * peso
+                c["m2"] = c["m2"] + m2_b + delta ** 2 * c["n"] * peso
+                c["n"] = n
+                minimo = np.full(tamano, np.inf)
+                maximo = np.full(tamano, -np.inf)
+                np.minimum.at(minimo, indice, salarios)
+                np.maximum.at(maximo, indice, salarios)
+                c["minimo"] = np.minimum(c["minimo"], minimo.reshape(forma))
+                c["maximo"] = np.maximum(c["maximo"], maximo.reshape(forma))
+                c["hist"] += np.bincount(indice * self.bins + bins, minlength=tamano * self.bins) \
+                    .reshape(forma + (self.bins,)).astype(np.int32)
+            self.filas += len(salarios)
+            return len(salarios)
+
+    def corte(self, por=(), filtros=None, cuantiles=(0.25, 0.5, 0.75)):
+        # Estadísticas por cada combinación de `por`, restringidas a filtros {dimensión: valor}
+        import pandas as pd
+
+        por = [por] if isinstance(por, str) else list(por)
+        filtros = dict(filtros or {})
+        with self.lock:
+            grupo = tuple(d for d in self.dimensiones if d in por or d in filtros)
+            c = self.celdas[grupo]
+            seleccion = []
+            for d in grupo:
+                if d in filtros:
+                    codigo = self.codigos[d].get(filtros[d])
+                    if codigo is None:
+                        codigo = next((i for v, i in self.codigos[d].items() if clave(v) == clave(filtros[d])), None)
+                    seleccion.append([] if codigo is None else [codigo])
+                else:
+                    seleccion.append(list(range(len(self.valores[d]))))
+            indice = np.ix_(*seleccion) if grupo else ()
+            n = c["n"][indice]
+            media = c["media"][indice]
+            m2 = c["m2"][indice]
+            minimo = c["minimo"][indice]
+            maximo = c["maximo"][indice]
+            hist = c["hist"][indice] if grupo else c["hist"].copy()
+            etiquetas = [[self.valores[d][i] for i in s] for d, s in zip(grupo, seleccion)]
+
+        estimados = _cuantiles(hist, n, minimo, maximo, cuantiles, self.ancho_bin)
+        columnas = {
+            "n": n,
+            "media": np.where(n > 0, media, np.nan),
+            "varianza": np.divide(m2, n - 1, out=np.full(n.shape, np.nan), where=n > 1),
+            "minimo": np.where(n > 0, minimo, np.nan),
+            "maximo": np.where(n > 0, maximo, np.nan),
+            **{("mediana" if q == 0.5 else f"p{round(q * 100):g}"): v for q, v in estimados.items()},
+        }
+        columnas["desviacion"] = np.sqrt(columnas["varianza"])
+        # Las dimensiones filtradas pero no pedidas se eliminan del resultado
+        mantener = [i for i, d in enumerate(grupo) if d in por]
+        if grupo:
+            malla = pd.MultiIndex.from_product(etiquetas, names=list(grupo))
+            tabla = pd.DataFrame({k: np.reshape(v, -1) for k, v in columnas.items()}, index=malla).reset_index()
+            tabla = tabla.drop(columns=[grupo[i] for i in range(len(grupo)) if i not in mantener])
+        else:
+            tabla = pd.DataFrame({k: [float(v)] for k, v in columnas.items()})
+        return tabla[tabla["n"] > 0].reset_index(drop=True)
+
+    def construir_desde_csv(self, ruta_csv, sep=";", tam_bloque=200_000, desde_byte=0, hasta_byte=None):
+        bloques = leer_bloques_csv(ruta_csv, sep, tam_bloque, desde_byte, hasta_byte,
+                                   dtype={d: str for d in self.dimensiones})
+        return sum(self.agregar(bloque) for bloque in bloques)
+
+    def actualizar_desde_csv(self, ruta_csv, sep=";"):
+        # Devuelve "sin cambios", "incremental" o "reconstruido"
+        with self.lock:
+            cambio = cambio_archivo(ruta_csv, self.origen)
+            if cambio == "sin cambios":
+                return cambio
+            origen = origen_archivo(ruta_csv)
+            if cambio == "incremental":
+                self.construir_desde_csv(ruta_csv, sep, desde_byte=self.origen["bytes"], hasta_byte=origen["bytes"])
+                self.origen = origen
+                return "incremental"
+            # Primera vez, o el archivo se reescribió: se reconstruye desde cero
+            limpio = CuboSalarios(self.dimensiones, self.ancho_bin, self.salario_maximo)
+            limpio.construir_desde_csv(ruta_csv, sep, hasta_byte=origen["bytes"])
+            self.valores, self.codigos, self.celdas, self.filas = limpio.valores, limpio.codigos, limpio.celdas, limpio.filas
+            self.origen = origen
+            return "reconstruido"
+
+    def guardar(self, ruta):
+        # Solo arreglos numpy y un JSON de metadatos: se carga con allow_pickle=False
+        with self.lock:
+            arreglos = {
+                f"{'|'.join(grupo)}:{nombre}": arreglo
+                for grupo, celdas in self.celdas.items() for nombre, arreglo in celdas.items()
+            }
+            metadatos = {
+                "formato": FORMATO_CUBO,
+                "dimensiones": self.dimensiones,
+                "ancho_bin": self.ancho_bin,
+                "salario_maximo": self.salario_maximo,
+                "valores": self.valores,
+                "filas": self.filas,
+                "origen": self.origen,
+            }
+            temporal = ruta + ".tmp.npz"
+            np.savez(temporal, metadatos=np.array(json.dumps(metadatos, ensure_ascii=False)), **arreglos)
+            os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta, allow_pickle=False) as datos:
+            arreglos = {k: datos[k] for k in datos.files}
+        meta = json.loads(str(arreglos.pop("metadatos")))
+        if meta.get("formato") != FORMATO_CUBO:
+            raise ValueError(f"Formato de cubo no soportado: {meta.get('formato')}")
+        cubo = cls(meta["dimensiones"], meta["ancho_bin"], meta["salario_maximo"])
+        cubo.valores = meta["valores"]
+        cubo.codigos = {d: {v: i for i, v in enumerate(vs)} for d, vs in cubo.valores.items()}
+        cubo.filas = meta["filas"]
+        cubo.origen = meta["origen"]
+        for grupo in cubo.grupos:
+            cubo.celdas[grupo] = {nombre: arreglos[f"{'|'.join(grupo)}:{nombre}"] for nombre in cubo.celdas[grupo]}
+        return cubo
+
+    def valores_ordenados(self, dimension):
+        return ordenar_valores(dimension, self.valores[dimension])
+
+
+def cubo_para(ruta_csv="Wage.csv", sep=";"):
+    # Carga el cubo guardado junto al CSV (o lo construye) y lo pone al día
+    ruta = ruta_cubo(ruta_csv)
+    cubo = None
+    if os.path.exists(ruta):
+        try:
+            cubo = CuboSalarios.cargar(ruta)
+        except Exception as e:
+            print(f"Cubo descartado ({e}), se reconstruye")
+    cubo = cubo or CuboSalarios()
+    if cubo.actualizar_desde_csv(ruta_csv, sep) != "sin cambios":
+        cubo.guardar(ruta)
+    return cubo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye o actualiza el cubo de agregados de salario")
+    parser.add_argument("csv", nargs="?", default="Wage.csv")
+    parser.add_argument("--sep", default=";")
+    parser.add_argument("--por", default="", help="Dimensiones separadas por coma, p. ej. education,race")
+    parser.add_argument("--filtro", action="append", default=[], help="dimension=valor (se puede repetir)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    cubo = cubo_para(args.csv, args.sep)
+    print(f"Cubo de {cubo.filas} filas listo en {time.perf_counter() - inicio:.2f} s -> {ruta_cubo(args.csv)}")
+    filtros = dict(f.split("=", 1) for f in args.filtro)
+    print(cubo.corte([d for d in args.por.split(",") if d], filtros).round(2).to_string(index=False))
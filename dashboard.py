@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
-import requests
 import os
 
+from almacen_datos import COLUMNAS_CATEGORICAS, leer_dataset, resolver_ruta
+from cliente_api import ClienteAPI
+from cubo_agregados import cubo_para, ordenar_valores
+from estadisticas_streaming import resumen_para
+
 st.set_page_config(page_title="Predicción de Salarios", layout="wide")
 
 # Obtener la URL de la API
@@ -14,9 +18,66 @@ def get_api_url():
 
 API_URL = get_api_url().rstrip("/")
 
+# Un cliente por URL compartido entre re-ejecuciones y sesiones: conexiones keep-alive,
+# reintentos con backoff y solicitudes idénticas en vuelo combinadas
+@st.cache_resource(show_spinner=False)
+def obtener_cliente(api_url):
+    return ClienteAPI(api_url)
+
+cliente = obtener_cliente(API_URL)
+
+RUTA_DATOS = "Wage.csv"
+
+# Capa de datos cacheada: Streamlit re-ejecuta el script en cada interacción, así
+# que el dataset solo se vuelve a leer cuando cambia la firma (mtime + tamaño) del
+# archivo efectivo (Wage.arrow si está al día, si no el CSV)
+def firma_archivo(ruta):
+    efectiva = resolver_ruta(ruta)
+    info = os.stat(efectiva)
+    return (efectiva, info.st_mtime_ns, info.st_size)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def cargar_datos(ruta, firma):
+    return leer_dataset(ruta)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def categorias_por_columna(ruta, firma):
+    datos = cargar_datos(ruta, firma)
+    categorias = {col: datos[col].unique().tolist() for col in COLUMNAS_CATEGORICAS if col in datos.columns}
+    categorias["year"] = sorted(datos["year"].unique().tolist())
+    return categorias
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def resumen_estadistico(ruta, firma):
+    return cargar_datos(ruta, firma).describe()
+
+# Cubo de agregados compartido entre sesiones: se construye una vez y en cada
+# re-ejecución solo se pone al día si el CSV creció (lee únicamente lo agregado)
+@st.cache_resource(show_spinner=False)
+def obtener_cubo(ruta):
+    return cubo_para(ruta)
+
+# Resumen en una pasada del salario (momentos, sketch de cuantiles y moda) para
+# la comparación antes/después; igual que el cubo, solo lee las filas nuevas
+@st.cache_resource(show_spinner=False)
+def obtener_resumen(ruta):
+    return resumen_para(ruta)
+
+DIMENSIONES_CUBO = {"education": "Educación", "race": "Raza", "jobclass": "Trabajo", "banda_edad": "Edad"}
+
+# Bandas de clasificación del modelo activo, calculadas y guardadas por la API
+@st.cache_data(show_spinner=False, ttl=300)
+def obtener_umbrales(api_url):
+    try:
+        return obtener_cliente(api_url).obtener("/clasificacion/umbrales", timeout=5)
+    except Exception:
+        return None
+
 # Cargar dataset para visualizaciones
 try:
-    df = pd.read_csv("Wage.csv", sep=";")
+    firma = firma_archivo(RUTA_DATOS)
+    df = cargar_datos(RUTA_DATOS, firma)
+    categorias = categorias_por_columna(RUTA_DATOS, firma)
 except Exception:
     st.error("No se pudo cargar el archivo proyecto_normalizado.csv")
     st.stop()
@@ -30,16 +91,16 @@ st.title("💼 Dashboard - Predicción de Salarios")
 st.sidebar.header("Predicción rápida")
 
 age = st.sidebar.number_input("Edad", min_value=18, max_value=70, value=30)
-education = st.sidebar.selectbox("Educación", df["education"].unique().tolist())
-jobclass = st.sidebar.selectbox("Trabajo", df["jobclass"].unique().tolist())
-health = st.sidebar.selectbox("Salud", df["health"].unique().tolist())
-health_ins = st.sidebar.selectbox("¿Seguro de salud?", df["health_ins"].unique().tolist())
-maritl = st.sidebar.selectbox("Estado civil", df["maritl"].unique().tolist())
-race = st.sidebar.selectbox("Raza", df["race"].unique().tolist())
-year = st.sidebar.selectbox("Año", sorted(df["year"].unique().tolist()))
-
-if st.sidebar.button("Predecir salario"):
-    payload = {
+education = st.sidebar.selectbox("Educación", categorias["education"])
+jobclass = st.sidebar.selectbox("Trabajo", categorias["jobclass"])
+health = st.sidebar.selectbox("Salud", categorias["health"])
+health_ins = st.sidebar.selectbox("¿Seguro de salud?", categorias["health_ins"])
+maritl = st.sidebar.selectbox("Estado civil", categorias["maritl"])
+race = st.sidebar.selectbox("Raza", categorias["race"])
+year = st.sidebar.selectbox("Año", categorias["year"])
+
+def payload_actual():
+    return {
         "age": age,
         "education": education,
         "jobclass": jobclass,
@@ -49,14 +110,24 @@ if st.sidebar.button("Predecir salario"):
         "race": race,
         "year": year
     }
+
+if st.sidebar.button("Predecir salario"):
+    payload = payload_actual()
     try:
-        r = requests.post(f"{API_URL}/predict", json=payload, timeout=15)
-        r.raise_for_status()
-        data_resp = r.json()
+        with st.sidebar:
+            with st.spinner("Consultando la API..."):
+                data_resp = cliente.predecir(payload)
 
           # Mostrar resultados completos
         st.sidebar.success(f"💰 Salario estimado: {data_resp.get('prediccion_salario')}")
         st.sidebar.write(f"📊 Clasificación salarial: {data_resp.get('clasificacion')}")
+        umbrales = obtener_umbrales(API_URL)
+        if umbrales:
+            bordes = umbrales["bordes"]
+            clase = data_resp.get("clasificacion")
+            desde = f"{bordes[clase - 1]:.2f}" if clase else "-"
+            hasta = f"{bordes[clase]:.2f}" if clase < len(bordes) else "-"
+            st.sidebar.caption(f"Banda {clase}: desde {desde} hasta {hasta} mil dólares (cuantiles de Wage.csv)")
         st.sidebar.write(f"📝 Explicación: {data_resp.get('explicacion')}")
         st.sidebar.write("💡 Mensaje explicativo:")
         st.sidebar.text_area("", value=data_resp.get("mensaje_explicativo"), height=120)
@@ -67,16 +138,122 @@ if st.sidebar.button("Predecir salario"):
     except Exception as e:
         st.sidebar.error(f"Error al conectar con la API: {e}")
 
+# -------------------------------
+# Sección: ¿Qué pasa si...? (sensibilidad)
+# -------------------------------
+st.subheader("🔍 ¿Qué pasa si...?")
+st.caption("Parte del perfil de la barra lateral y recorre uno o dos campos con una sola consulta a la API.")
+CAMPOS_SENSIBILIDAD = {
+    "age": "Edad", "year": "Año", "education": "Educación", "jobclass": "Trabajo", "health": "Salud",
+    "health_ins": "¿Seguro de salud?", "maritl": "Estado civil", "race": "Raza",
+}
+col_x, col_serie, col_modo = st.columns(3)
+campo_x = col_x.selectbox("Recorrer", list(CAMPOS_SENSIBILIDAD), format_func=CAMPOS_SENSIBILIDAD.get)
+opciones_serie = ["ninguno"] + [c for c in CAMPOS_SENSIBILIDAD if c != campo_x]
+campo_serie = col_serie.selectbox("Una línea por", opciones_serie,
+                                  index=opciones_serie.index("education") if campo_x == "age" else 0,
+                                  format_func=lambda c: CAMPOS_SENSIBILIDAD.get(c, "Ninguno"))
+parcial = col_modo.checkbox("Promediar sobre el dataset (dependencia parcial)")
+if st.button("Calcular curva"):
+    barridos = [{"campo": campo_x}] + ([{"campo": campo_serie}] if campo_serie != "ninguno" else [])
+    try:
+        with st.spinner("Consultando la API..."):
+            st.session_state["sensibilidad"] = cliente.sensibilidad(
+                {"base": payload_actual(), "barridos": barridos, "dependencia_parcial": parcial}
+            )
+    except Exception as e:
+        st.error(f"Error al conectar con la API: {e}")
+
+resultado = st.session_state.get("sensibilidad")
+if resultado:
+    import numpy as np
+    import plotly.graph_objects as go
+
+    campos = resultado["campos"]
+    valores_x = resultado["valores"][campos[0]]
+    superficie = np.array(resultado["predicciones"], dtype=float).reshape(len(valores_x), -1)
+    orden_x = [valores_x.index(v) for v in ordenar_valores(campos[0], valores_x)]
+    etiquetas = [resultado["valores"][campos[1]][j] for j in range(superficie.shape[1])] if len(campos) > 1 else [None]
+    fig = go.Figure()
+    for j in [etiquetas.index(v) for v in ordenar_valores(campos[1], etiquetas)] if len(campos) > 1 else [0]:
+        fig.add_trace(go.Scatter(
+            x=[str(valores_x[i]).strip() for i in orden_x], y=superficie[orden_x, j], mode="lines+markers",
+            name=str(etiquetas[j]).strip() if etiquetas[j] is not None else "Salario estimado",
+        ))
+    if resultado["prediccion_base"] is not None:
+        fig.add_hline(y=resultado["prediccion_base"], line_dash="dot", annotation_text="Perfil actual")
+    fig.update_layout(xaxis_title=CAMPOS_SENSIBILIDAD[campos[0]], yaxis_title="Salario estimado (miles de dólares)",
+                      showlegend=len(campos) > 1, height=450)
+    st.plotly_chart(fig, width="stretch")
+    if resultado["dependencia_parcial"]:
+        st.caption(f"Promedio de {resultado['filas_muestra']} registros de Wage.csv por punto "
+                   f"({resultado['filas_puntuadas']} predicciones en una llamada).")
+
 # -------------------------------
 # Sección: Vista previa dataset
 # -------------------------------
 st.subheader("📋 Vista previa de datos")
 try:
-    df = pd.read_csv("Wage.csv", sep=";")
     st.dataframe(df.head())
+    st.markdown("**Resumen estadístico**")
+    st.dataframe(resumen_estadistico(RUTA_DATOS, firma))
 except Exception:
     st.warning("No se pudo cargar el dataset `Wage.csv`. Verifica que esté en el repositorio.")
 
+# -------------------------------
+# Sección: Salario por grupo (cubo de agregados)
+# -------------------------------
+st.subheader("📊 Salario por grupo")
+try:
+    import plotly.graph_objects as go
+
+    cubo = obtener_cubo(RUTA_DATOS)
+    cubo.actualizar_desde_csv(RUTA_DATOS)
+    nombres = list(DIMENSIONES_CUBO)
+    col_por, col_color, col_medida = st.columns(3)
+    por = col_por.selectbox("Agrupar por", nombres, format_func=DIMENSIONES_CUBO.get)
+    color = col_color.selectbox("Comparar por", ["ninguno"] + [d for d in nombres if d != por],
+                                format_func=lambda d: DIMENSIONES_CUBO.get(d, "Ninguno"))
+    medida = col_medida.radio("Gráfico", ["Distribución", "Media", "Mediana"], horizontal=True)
+    filtros = {}
+    otras = [d for d in nombres if d not in (por, color)]
+    for col, dimension in zip(st.columns(len(otras)), otras):
+        eleccion = col.selectbox(DIMENSIONES_CUBO[dimension], ["Todos"] + cubo.valores_ordenados(dimension),
+                                 format_func=str.strip, key=f"filtro_{dimension}")
+        if eleccion != "Todos":
+            filtros[dimension] = eleccion
+
+    grupos = [por] + ([color] if color != "ninguno" else [])
+    tabla = cubo.corte(grupos, filtros, cuantiles=(0.05, 0.25, 0.5, 0.75, 0.95))
+    orden = {v: i for i, v in enumerate(cubo.valores_ordenados(por))}
+    tabla = tabla.sort_values(por, key=lambda s: s.map(orden), kind="stable")
+    series = [(None, tabla)] if color == "ninguno" else [
+        (valor, tabla[tabla[color] == valor]) for valor in cubo.valores_ordenados(color) if (tabla[color] == valor).any()
+    ]
+
+    fig = go.Figure()
+    for nombre, parte in series:
+        x = parte[por].str.strip()
+        etiqueta = nombre.strip() if nombre else "Todos"
+        if medida == "Distribución":
+            # Cajas a partir de los cuantiles precalculados (bigotes en p5 y p95)
+            fig.add_trace(go.Box(x=x, q1=parte["p25"], median=parte["mediana"], q3=parte["p75"],
+                                 lowerfence=parte["p5"], upperfence=parte["p95"], mean=parte["media"],
+                                 sd=parte["desviacion"], name=etiqueta))
+        else:
+            columna = "media" if medida == "Media" else "mediana"
+            fig.add_trace(go.Bar(x=x, y=parte[columna], name=etiqueta,
+                                 error_y=dict(type="data", array=parte["desviacion"]) if columna == "media" else None,
+                                 customdata=parte["n"], hovertemplate="%{x}: %{y:.2f} (n=%{customdata})"))
+    fig.update_layout(boxmode="group", barmode="group", yaxis_title="Salario (miles de dólares)",
+                      xaxis_title=DIMENSIONES_CUBO[por], showlegend=color != "ninguno", height=450)
+    st.plotly_chart(fig, width="stretch")
+    st.caption(f"{cubo.filas} registros de {RUTA_DATOS}; cuantiles aproximados con bins de {cubo.ancho_bin} mil dólares.")
+    with st.expander("Tabla del corte"):
+        st.dataframe(tabla.round(2), hide_index=True)
+except Exception as e:
+    st.warning(f"No se pudo construir el cubo de agregados: {e}")
+
 # -------------------------------
 # Sección: Información del proyecto
 # -------------------------------
@@ -329,6 +506,28 @@ Esto confirma que la depuración de datos permitió obtener un panorama mucho m
 
 """)
 
+st.markdown("## Antes y después de las cercas IQR sobre los datos actuales")
+try:
+    resumen_salarios = obtener_resumen(RUTA_DATOS)
+    resumen_salarios.actualizar_desde_csv(RUTA_DATOS)
+    comparacion = resumen_salarios.antes_despues()
+    MEDIDAS = {
+        "n": "Registros", "media": "Media", "mediana": "Mediana", "moda": "Moda", "varianza": "Varianza",
+        "desviacion": "Desviación estándar", "cv": "Coeficiente de variación (%)", "minimo": "Mínimo",
+        "maximo": "Máximo", "q1": "Q1", "q3": "Q3", "iqr": "IQR",
+    }
+    st.dataframe(pd.DataFrame({
+        "Medida": list(MEDIDAS.values()),
+        "Antes": [comparacion["antes"][m] for m in MEDIDAS],
+        "Después": [comparacion["despues"][m] for m in MEDIDAS],
+    }).round(4), hide_index=True)
+    cercas = comparacion["cercas"]
+    st.caption(f"Cercas IQR (Q1 − {cercas['factor']}·IQR, Q3 + {cercas['factor']}·IQR): "
+               f"[{cercas['inferior']:.2f}, {cercas['superior']:.2f}], {comparacion['descartados']} valores fuera. "
+               f"Calculado en una pasada sobre {RUTA_DATOS}; las tablas anteriores corresponden al dataset original.")
+except Exception as e:
+    st.warning(f"No se pudieron calcular las estadísticas en línea: {e}")
+
 st.markdown("## boxplot salario original vs salario limpio")
 st.image("img/salariooriginal_vs_salariolimpio.png", caption="Quantiles", width=1000)
 
@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from observabilidad import capturar_etapas, observar_etapas
+
+# Ejecutor dedicado para la inferencia (CPU) fuera del event loop, con un pool
+# de hilos o de procesos de tamaño configurable y una cola acotada: cuando la
+# cola está llena se rechaza la solicitud en lugar de acumularla.
+
+
+class ColaLlena(Exception):
+    pass
+
+
+def _ejecutar_medido(funcion, args):
+    # Corre en el hilo/proceso trabajador; devuelve el resultado, los instantes de
+    # inicio y fin y las etapas medidas dentro de la función
+    inicio = time.time()
+    with capturar_etapas() as etapas:
+        resultado = funcion(*args)
+    return resultado, inicio, time.time(), etapas
+
+
+class EjecutorInferencia:
+
+    def __init__(self, modo="hilos", trabajadores=4, cola_maxima=64, inicializador=None):
+        if modo not in ("hilos", "procesos"):
+            raise ValueError(f"Modo de inferencia desconocido: {modo}")
+        self.modo = modo
+        self.trabajadores = trabajadores
+        self.cola_maxima = cola_maxima
+        self.inicializador = inicializador
+        self.pool = self._crear_pool()
+
+        self.lock = threading.Lock()
+        self.en_vuelo = 0
+        self.completadas = 0
+        self.rechazadas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+
+    def _crear_pool(self):
+        if self.modo == "procesos":
+            # spawn: los trabajadores no heredan hilos ni locks del proceso principal
+            return ProcessPoolExecutor(
+                max_workers=self.trabajadores,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.inicializador,
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.trabajadores,
+            thread_name_prefix="inferencia",
+            initializer=self.inicializador,
+        )
+
+    def reiniciar_pool(self):
+        # Crea y calienta un pool nuevo (bloquea: llamar fuera del event loop) y
+        # recién entonces lo pone en servicio; el anterior termina lo que ya tiene en cola
+        nuevo = self._crear_pool()
+        for futuro in [nuevo.submit(time.time) for _ in range(self.trabajadores)]:
+            futuro.result()
+        anterior, self.pool = self.pool, nuevo
+        anterior.shutdown(wait=False)
+
+    async def ejecutar(self, funcion, *args):
+        # Devuelve (resultado, métricas de la solicitud) o lanza ColaLlena
+        with self.lock:
+            if self.en_vuelo >= self.trabajadores + self.cola_maxima:
+                self.rechazadas += 1
+                raise ColaLlena(f"Cola de inferencia llena ({self.cola_maxima} en espera)")
+            profundidad = max(0, self.en_vuelo - self.trabajadores)
+            self.en_vuelo += 1
+        encolado = time.time()
+        try:
+            futuro = self.pool.submit(_ejecutar_medido, funcion, args)
+        except Exception:
+            self._terminar(None)
+            raise
+        # El contador se libera cuando termina el trabajo, aunque el cliente se desconecte antes
+        futuro.add_done_callback(self._terminar)
+        resultado, inicio, fin, etapas = await asyncio.wrap_future(futuro)
+        observar_etapas(etapas)
+        espera = max(0.0, inicio - encolado)
+        with self.lock:
+            self.completadas += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+        return resultado, {
+            "profundidad_cola": profundidad,
+            "espera_ms": round(espera * 1000, 3),
+            "inferencia_ms": round((fin - inicio) * 1000, 3),
+        }
+
+    def _terminar(self, _futuro):
+        with self.lock:
+            self.en_vuelo -= 1
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "modo": self.modo,
+                "trabajadores": self.trabajadores,
+                "cola_maxima": self.cola_maxima,
+                "en_vuelo": self.en_vuelo,
+                "en_cola": max(0, self.en_vuelo - self.trabajadores),
+                "completadas": self.completadas,
+                "rechazadas": self.rechazadas,
+                "espera_promedio_ms": round(self.espera_total / self.completadas * 1000, 3) if self.completadas else 0.0,
+                "espera_maxima_ms": round(self.espera_maxima * 1000, 3),
+            }
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+# Reentrenamiento de best_wage_model.joblib. Carga Wage.csv, aplica la misma
+# limpieza de salarios atípicos del análisis (wage hasta ~193 mil dólares) y
+# busca hiperparámetros de CatBoost con validación cruzada: cada combinación x
+# pliegue es una tarea independiente que corre en todos los núcleos (un hilo de
+# CatBoost por tarea), con early stopping sobre una partición interna del
+# pliegue de entrenamiento. Los resultados por pliegue se guardan en disco, así
+# que repetir la búsqueda (o ampliar la grilla) solo entrena lo nuevo. Con la
+# misma semilla el resultado es el mismo.
+
+COLUMNAS = ["age", "education", "jobclass", "health", "health_ins", "maritl", "race", "year"]
+CATEGORICAS = ["education", "jobclass", "health", "health_ins", "maritl", "race"]
+OBJETIVO = "wage"
+SALARIO_MAXIMO = 193.5
+
+GRILLA = {
+    "depth": [4, 6, 8],
+    "learning_rate": [0.05, 0.1],
+    "l2_leaf_reg": [3, 10],
+}
+GRILLA_RAPIDA = {
+    "depth": [4, 6],
+    "learning_rate": [0.1],
+    "l2_leaf_reg": [3],
+}
+
+
+def cargar_datos(ruta_csv="Wage.csv", salario_maximo=SALARIO_MAXIMO):
+    from almacen_datos import leer_dataset
+
+    df = leer_dataset(ruta_csv, columnas=COLUMNAS + [OBJETIVO])
+    filas = len(df)
+    df = df.dropna().drop_duplicates()
+    df = df[df[OBJETIVO] <= salario_maximo].reset_index(drop=True)
+    X = df[COLUMNAS].astype({c: str for c in CATEGORICAS})
+    y = df[OBJETIVO].to_numpy(dtype=float)
+    return X, y, {"filas_originales": filas, "filas_limpias": len(df), "salario_maximo": salario_maximo}
+
+
+def huella_datos(X, y):
+    # Identifica el dataset limpio: la cache de pliegues se invalida si cambian los datos
+    h = hashlib.sha256()
+    h.update(X.to_csv(index=False).encode("utf-8"))
+    h.update(np.ascontiguousarray(y).tobytes())
+    return h.hexdigest()
+
+
+def combinaciones(grilla):
+    nombres = sorted(grilla)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*(grilla[n] for n in nombres))]
+
+
+def evaluar_pliegue(params, pliegue, n_pliegues, semilla, iteraciones, paciencia, huella, X, y):
+    # Una combinación en un pliegue; X e y no forman parte de la clave de cache (la da huella)
+    from catboost import CatBoostRegressor
+    from sklearn.model_selection import KFold, train_test_split
+
+    entrenamiento, validacion = list(KFold(n_pliegues, shuffle=True, random_state=semilla).split(X))[pliegue]
+    X_ent, X_parada, y_ent, y_parada = train_test_split(
+        X.iloc[entrenamiento], y[entrenamiento], test_size=0.1, random_state=semilla
+    )
+    inicio = time.perf_counter()
+    modelo = CatBoostRegressor(
+        iterations=iteraciones,
+        loss_function="RMSE",
+        random_seed=semilla,
+        thread_count=1,
+        od_type="Iter",
+        od_wait=paciencia,
+        verbose=0,
+        allow_writing_files=False,
+        **params,
+    )
+    modelo.fit(X_ent, y_ent, cat_features=CATEGORICAS, eval_set=(X_parada, y_parada), use_best_model=True)
+    segundos = time.perf_counter() - inicio
+    # get_best_iteration() es None sin conjunto de evaluación; 0 es una iteración válida
+    mejor = modelo.get_best_iteration()
+    pred = modelo.predict(X.iloc[validacion])
+    error = y[validacion] - pred
+    return {
+        "rmse": float(np.sqrt(np.mean(error ** 2))),
+        "mae": float(np.mean(np.abs(error))),
+        "r2": float(1 - np.sum(error ** 2) / np.sum((y[validacion] - y[validacion].mean()) ** 2)),
+        "mejor_iteracion": int(iteraciones - 1 if mejor is None else mejor) + 1,
+        "segundos": segundos,
+    }
+
+
+def buscar_hiperparametros(X, y, grilla=GRILLA, n_pliegues=5, semilla=42, iteraciones=1000,
+                           paciencia=50, trabajos=-1, directorio_cache=".cache_entrenamiento"):
+    from joblib import Memory, Parallel, delayed
+
+    memoria = Memory(directorio_cache, verbose=0) if directorio_cache else Memory(None, verbose=0)
+    evaluar = memoria.cache(evaluar_pliegue, ignore=["X", "y"])
+    huella = huella_datos(X, y)
+    candidatos = combinaciones(grilla)
+    tareas = [(i, p) for i in range(len(candidatos)) for p in range(n_pliegues)]
+    print(f"{len(candidatos)} combinaciones x {n_pliegues} pliegues = {len(tareas)} entrenamientos")
+
+    inicio = time.perf_counter()
+    resultados = Parallel(n_jobs=trabajos, verbose=5)(
+        delayed(evaluar)(candidatos[i], p, n_pliegues, semilla, iteraciones, paciencia, huella, X, y)
+        for i, p in tareas
+    )
+    segundos = time.perf_counter() - inicio
+
+    resumen = []
+    for i, params in enumerate(candidatos):
+        pliegues = [r for (j, _), r in zip(tareas, resultados) if j == i]
+        resumen.append({
+            "params": params,
+            **{
+                f"{m}_{estadistico}": float(funcion([r[m] for r in pliegues]))
+                for m in ("rmse", "mae", "r2")
+                for estadistico, funcion in (("media", np.mean), ("desviacion", np.std))
+            },
+            "iteraciones": int(np.median([r["mejor_iteracion"] for r in pliegues])),
+            "segundos_entrenamiento": float(sum(r["segundos"] for r in pliegues)),
+        })
+    resumen.sort(key=lambda r: (r["rmse_media"], json.dumps(r["params"], sort_keys=True)))
+    return resumen, segundos
+
+
+def entrenar(ruta_csv="Wage.csv", ruta_salida="best_wage_model.joblib", grilla=GRILLA, n_pliegues=5,
+             semilla=42, iteraciones=1000, paciencia=50, trabajos=-1, salario_maximo=SALARIO_MAXIMO,
+             directorio_cache=".cache_entrenamiento"):
+    import catboost
+    import joblib
+    from catboost import CatBoostRegressor
+
+    from clasificacion_salario import BandasSalario, ruta_bandas
+
+    inicio = time.perf_counter()
+    X, y, limpieza = cargar_datos(ruta_csv, salario_maximo)
+    print(f"{limpieza['filas_limpias']} de {limpieza['filas_originales']} filas tras la limpieza (wage <= {salario_maximo})")
+
+    resumen, segundos_busqueda = buscar_hiperparametros(
+        X, y, grilla, n_pliegues, semilla, iteraciones, paciencia, trabajos, directorio_cache
+    )
+    mejor = resumen[0]
+    print(f"Mejor: {mejor['params']} RMSE {mejor['rmse_media']:.3f} ± {mejor['rmse_desviacion']:.3f}, "
+          f"{mejor['iteraciones']} iteraciones")
+
+    # Modelo final sobre todos los datos limpios con las iteraciones que eligió el early stopping
+    inicio_final = time.perf_counter()
+    modelo = CatBoostRegressor(
+        iterations=mejor["iteraciones"],
+        loss_function="RMSE",
+        random_seed=semilla,
+        verbose=0,
+        allow_writing_files=False,
+        **mejor["params"],
+    )
+    modelo.fit(X, y, cat_features=CATEGORICAS)
+    segundos_final = time.perf_counter() - inicio_final
+
+    temporal = ruta_salida + ".tmp"
+    joblib.dump(modelo, temporal)
+    os.replace(temporal, ruta_salida)
+    # Las bandas de clasificación viajan con el modelo (y con él al registro)
+    BandasSalario.desde_datos(ruta_csv).guardar(ruta_bandas(ruta_salida))
+
+    metricas = {
+        "modelo": ruta_salida,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "semilla": semilla,
+        "datos": {"ruta": ruta_csv, "huella": huella_datos(X, y), **limpieza},
+        "validacion_cruzada": {"pliegues": n_pliegues, "paciencia": paciencia, "iteraciones_maximas": iteraciones},
+        "mejor": mejor,
+        "candidatos": resumen,
+        "tiempos": {
+            "busqueda_s": round(segundos_busqueda, 2),
+            "modelo_final_s": round(segundos_final, 2),
+            "total_s": round(time.perf_counter() - inicio, 2),
+        },
+        "entorno": {"python": platform.python_version(), "catboost": catboost.__version__, "cpus": os.cpu_count()},
+    }
+    with open(os.path.splitext(ruta_salida)[0] + ".metricas.json", "w", encoding="utf-8") as f:
+        json.dump(metricas, f, indent=2, ensure_ascii=False)
+    print(f"Modelo guardado en {ruta_salida} en {metricas['tiempos']['total_s']} s")
+    return modelo, metricas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reentrena best_wage_model.joblib con búsqueda de hiperparámetros")
+    parser.add_argument("--csv", default="Wage.csv")
+    parser.add_argument("--salida", default="best_wage_model.joblib")
+    parser.add_argument("--pliegues", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--iteraciones", type=int, default=1000, help="Máximo por entrenamiento (early stopping)")
+    parser.add_argument("--paciencia", type=int, default=50)
+    parser.add_argument("--trabajos", type=int, default=-1, help="Procesos en paralelo (-1 = todos los núcleos)")
+    parser.add_argument("--salario-maximo", type=float, default=SALARIO_MAXIMO)
+    parser.add_argument("--cache", default=".cache_entrenamiento", help="Directorio de resultados por pliegue ('' la desactiva)")
+    parser.add_argument("--rapido", action="store_true", help="Grilla reducida")
+    parser.add_argument("--registrar", default=None, metavar="VERSION",
+                        help="Además registra el modelo en el registro de modelos con esta versión")
+    args = parser.parse_args()
+
+    _, metricas = entrenar(
+        args.csv, args.salida, GRILLA_RAPIDA if args.rapido else GRILLA, args.pliegues, args.semilla,
+        args.iteraciones, args.paciencia, args.trabajos, args.salario_maximo, args.cache or None,
+    )
+    if args.registrar:
+        from registro_modelos import RegistroModelos
+        mejor = metricas["mejor"]
+        RegistroModelos().registrar(
+            args.salida, args.registrar, descripcion=f"entrenar.py {mejor['params']}",
+            metricas={k: mejor[k] for k in ("rmse_media", "mae_media", "r2_media")},
+        )
+        print(f"Registrado como versión {args.registrar}")
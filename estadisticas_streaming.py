@@ -0,0 +1,377 @@
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from almacen_datos import cambio_archivo, leer_bloques_csv, origen_archivo
+
+# Estadísticas del salario en una sola pasada, para la comparación antes/después
+# de la limpieza del dashboard:
+#
+# - Momentos: media, varianza (Welford/Chan), mínimo y máximo exactos.
+# - SketchCuantiles: cubetas logarítmicas (DDSketch) con error relativo alfa en
+#   cualquier cuantil; cada cubeta guarda además sus propios momentos, así que
+#   las estadísticas "después" (solo los valores dentro de las cercas IQR) salen
+#   del mismo sketch sin volver a leer los datos.
+# - Frecuentes: Misra-Gries para la moda con memoria acotada.
+#
+# Todos los estados se combinan (combinar), así que un archivo grande se resume
+# por tramos en paralelo y las filas que se agregan al CSV se suman sin releer
+# las anteriores.
+
+ALFA = 0.001
+FACTOR_IQR = 1.5
+MAX_FRECUENTES = 256
+INDICE_NO_POSITIVO = -(2 ** 31)
+
+
+class Momentos:
+
+    def __init__(self, n=0, media=0.0, m2=0.0, minimo=math.inf, maximo=-math.inf):
+        self.n = n
+        self.media = media
+        self.m2 = m2
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def actualizar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        if len(valores):
+            media = float(valores.mean())
+            self.combinar(Momentos(len(valores), media, float(((valores - media) ** 2).sum()),
+                                   float(valores.min()), float(valores.max())))
+        return self
+
+    def combinar(self, otro):
+        # Fórmula de Chan para unir dos estados de Welford
+        n = self.n + otro.n
+        if n:
+            delta = otro.media - self.media
+            self.m2 += otro.m2 + delta ** 2 * self.n * otro.n / n
+            self.media += delta * otro.n / n
+        self.n = n
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        return self
+
+    @property
+    def varianza(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def desviacion(self):
+        return math.sqrt(self.varianza)
+
+    @property
+    def cv(self):
+        return self.desviacion / self.media * 100 if self.n and self.media else math.nan
+
+    def a_lista(self):
+        return [self.n, self.media, self.m2, self.minimo, self.maximo]
+
+
+class SketchCuantiles:
+
+    def __init__(self, alfa=ALFA):
+        self.alfa = alfa
+        self.gamma = (1 + alfa) / (1 - alfa)
+        self.log_gamma = math.log(self.gamma)
+        self.cubetas = {}
+
+    def indices(self, valores):
+        positivos = valores > 0
+        indices = np.full(len(valores), INDICE_NO_POSITIVO, dtype=np.int64)
+        indices[positivos] = np.ceil(np.log(valores[positivos]) / self.log_gamma).astype(np.int64)
+        return indices
+
+    def representante(self, indice, momentos):
+        # Valor con error relativo <= alfa para toda la cubeta; la de no positivos usa su media
+        if indice == INDICE_NO_POSITIVO:
+            return momentos.media
+        return 2 * self.gamma ** indice / (self.gamma + 1)
+
+    def actualizar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        if len(valores) == 0:
+            return self
+        unicos, inversa = np.unique(self.indices(valores), return_inverse=True)
+        n = np.bincount(inversa)
+        media = np.bincount(inversa, valores) / n
+        m2 = np.bincount(inversa, (valores - media[inversa]) ** 2)
+        minimo = np.full(len(unicos), np.inf)
+        maximo = np.full(len(unicos), -np.inf)
+        np.minimum.at(minimo, inversa, valores)
+        np.maximum.at(maximo, inversa, valores)
+        for i, indice in enumerate(unicos.tolist()):
+            lote = Momentos(int(n[i]), float(media[i]), float(m2[i]), float(minimo[i]), float(maximo[i]))
+            self._sumar(indice, lote)
+        return self
+
+    def _sumar(self, indice, momentos):
+        actual = self.cubetas.get(indice)
+        if actual is None:
+            self.cubetas[indice] = Momentos(*momentos.a_lista())
+        else:
+            actual.combinar(momentos)
+
+    def combinar(self, otro):
+        if otro.alfa != self.alfa:
+            raise ValueError(f"No se pueden combinar sketches con alfa distinto ({self.alfa} y {otro.alfa})")
+        for indice, momentos in otro.cubetas.items():
+            self._sumar(indice, momentos)
+        return self
+
+    def ordenadas(self, inferior=-math.inf, superior=math.inf):
+        # Cubetas en orden cuyo representante cae dentro de [inferior, superior]
+        for indice in sorted(self.cubetas):
+            momentos = self.cubetas[indice]
+            if inferior <= self.representante(indice, momentos) <= superior:
+                yield indice, momentos
+
+    def cuantiles(self, cuantiles, inferior=-math.inf, superior=math.inf):
+        cubetas = list(self.ordenadas(inferior, superior))
+        total = sum(m.n for _, m in cubetas)
+        if total == 0:
+            return [math.nan for _ in cuantiles]
+        acumulado = np.cumsum([m.n for _, m in cubetas])
+        resultado = []
+        for q in cuantiles:
+            posicion = int(np.searchsorted(acumulado, q * (total - 1), side="right"))
+            indice, momentos = cubetas[min(posicion, len(cubetas) - 1)]
+            resultado.append(min(max(self.representante(indice, momentos), momentos.minimo), momentos.maximo))
+        return resultado
+
+
+class Frecuentes:
+    # Misra-Gries ponderado: los conteos estimados fallan a lo sumo por n / (k + 1)
+
+    def __init__(self, k=MAX_FRECUENTES):
+        self.k = k
+        self.conteos = collections.Counter()
+
+    def actualizar(self, valores):
+        unicos, conteos = np.unique(np.round(np.asarray(valores, dtype=float), 2), return_counts=True)
+        self.conteos.update(dict(zip(unicos.tolist(), conteos.tolist())))
+        self._recortar()
+        return self
+
+    def combinar(self, otro):
+        self.conteos.update(otro.conteos)
+        self._recortar()
+        return self
+
+    def _recortar(self):
+        if len(self.conteos) > self.k:
+            umbral = sorted(self.conteos.values(), reverse=True)[self.k]
+            self.conteos = collections.Counter({v: c - umbral for v, c in self.conteos.items() if c > umbral})
+
+    def moda(self, inferior=-math.inf, superior=math.inf):
+        candidatos = [(c, -v) for v, c in self.conteos.items() if inferior <= v <= superior]
+        return -max(candidatos)[1] if candidatos else math.nan
+
+
+class ResumenSalarios:
+
+    def __init__(self, alfa=ALFA, k=MAX_FRECUENTES):
+        self.momentos = Momentos()
+        self.sketch = SketchCuantiles(alfa)
+        self.frecuentes = Frecuentes(k)
+        self.origen = None
+        self.lock = threading.RLock()
+
+    def actualizar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[np.isfinite(valores)]
+        with self.lock:
+            self.momentos.actualizar(valores)
+            self.sketch.actualizar(valores)
+            self.frecuentes.actualizar(valores)
+        return len(valores)
+
+    def combinar(self, otro):
+        with self.lock:
+            self.momentos.combinar(otro.momentos)
+            self.sketch.combinar(otro.sketch)
+            self.frecuentes.combinar(otro.frecuentes)
+        return self
+
+    def cercas_iqr(self, factor=FACTOR_IQR):
+        with self.lock:
+            q1, q3 = self.sketch.cuantiles([0.25, 0.75])
+        return q1 - factor * (q3 - q1), q3 + factor * (q3 - q1)
+
+    def resumen(self, inferior=-math.inf, superior=math.inf):
+        # Sin límites: momentos exactos. Con límites: se combinan los momentos de las
+        # cubetas dentro del rango (resolución de una cubeta, alfa relativo)
+        with self.lock:
+            if inferior == -math.inf and superior == math.inf:
+                momentos = self.momentos
+            else:
+                momentos = Momentos()
+                for _, cubeta in self.sketch.ordenadas(inferior, superior):
+                    momentos.combinar(cubeta)
+            q1, mediana, q3 = self.sketch.cuantiles([0.25, 0.5, 0.75], inferior, superior)
+            moda = self.frecuentes.moda(inferior, superior)
+        return {
+            "n": momentos.n,
+            "media": momentos.media if momentos.n else math.nan,
+            "mediana": mediana,
+            "moda": moda,
+            "varianza": momentos.varianza,
+            "desviacion": momentos.desviacion,
+            "cv": momentos.cv,
+            "minimo": momentos.minimo if momentos.n else math.nan,
+            "maximo": momentos.maximo if momentos.n else math.nan,
+            "q1": q1,
+            "q3": q3,
+            "iqr": q3 - q1,
+        }
+
+    def antes_despues(self, factor=FACTOR_IQR):
+        # Todos los valores frente a los que quedan dentro de las cercas IQR
+        inferior, superior = self.cercas_iqr(factor)
+        antes = self.resumen()
+        despues = self.resumen(inferior, superior)
+        return {
+            "cercas": {"inferior": inferior, "superior": superior, "factor": factor},
+            "descartados": antes["n"] - despues["n"],
+            "antes": antes,
+            "despues": despues,
+        }
+
+    def actualizar_desde_csv(self, ruta_csv, sep=";", columna="wage", procesos=1):
+        # Devuelve "sin cambios", "incremental" o "reconstruido"
+        with self.lock:
+            cambio = cambio_archivo(ruta_csv, self.origen)
+            if cambio == "sin cambios":
+                return cambio
+            origen = origen_archivo(ruta_csv)
+            if cambio == "incremental":
+                self.combinar(resumir_csv(ruta_csv, sep, columna, procesos, self.origen["bytes"], origen["bytes"],
+                                          self.sketch.alfa, self.frecuentes.k))
+            else:
+                limpio = resumir_csv(ruta_csv, sep, columna, procesos, 0, origen["bytes"],
+                                     self.sketch.alfa, self.frecuentes.k)
+                self.momentos, self.sketch, self.frecuentes = limpio.momentos, limpio.sketch, limpio.frecuentes
+                cambio = "reconstruido"
+            self.origen = origen
+            return cambio
+
+    def a_dict(self):
+        with self.lock:
+            return {
+                "alfa": self.sketch.alfa,
+                "k": self.frecuentes.k,
+                "momentos": self.momentos.a_lista(),
+                "cubetas": [[i] + m.a_lista() for i, m in sorted(self.sketch.cubetas.items())],
+                "frecuentes": [[v, c] for v, c in self.frecuentes.conteos.items()],
+                "origen": self.origen,
+            }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        resumen = cls(datos["alfa"], datos["k"])
+        resumen.momentos = Momentos(*datos["momentos"])
+        resumen.sketch.cubetas = {int(c[0]): Momentos(*c[1:]) for c in datos["cubetas"]}
+        resumen.frecuentes.conteos = collections.Counter({float(v): int(c) for v, c in datos["frecuentes"]})
+        resumen.origen = datos["origen"]
+        return resumen
+
+    def guardar(self, ruta):
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.a_dict(), f)
+        os.replace(ruta + ".tmp", ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            return cls.desde_dict(json.load(f))
+
+    # pickle (pool de procesos): el lock no se copia
+    def __getstate__(self):
+        return self.a_dict()
+
+    def __setstate__(self, estado):
+        self.__dict__.update(ResumenSalarios.desde_dict(estado).__dict__)
+
+
+def _resumir_tramo(ruta_csv, sep, columna, desde, hasta, alfa, k):
+    resumen = ResumenSalarios(alfa, k)
+    for bloque in leer_bloques_csv(ruta_csv, sep, desde_byte=desde, hasta_byte=hasta):
+        resumen.actualizar(bloque[columna].to_numpy(dtype=float))
+    return resumen
+
+
+def tramos_por_lineas(ruta, partes, desde=0, hasta=None):
+    # Cortes cercanos a partes iguales, movidos al siguiente inicio de línea
+    hasta = os.path.getsize(ruta) if hasta is None else hasta
+    with open(ruta, "rb") as f:
+        if desde == 0:
+            f.readline()
+            desde = f.tell()
+        cortes = [desde]
+        for i in range(1, partes):
+            f.seek(max(desde + (hasta - desde) * i // partes - 1, cortes[-1]))
+            f.readline()
+            cortes.append(min(f.tell(), hasta))
+    cortes.append(hasta)
+    return [(a, b) for a, b in zip(cortes, cortes[1:]) if b > a]
+
+
+def resumir_csv(ruta_csv, sep=";", columna="wage", procesos=1, desde=0, hasta=None, alfa=ALFA, k=MAX_FRECUENTES):
+    # Resume [desde, hasta) del CSV; con procesos > 1 cada tramo va a un proceso y se combinan
+    tramos = tramos_por_lineas(ruta_csv, procesos or 1, desde, hasta)
+    resumen = ResumenSalarios(alfa, k)
+    if len(tramos) <= 1:
+        for a, b in tramos:
+            resumen.combinar(_resumir_tramo(ruta_csv, sep, columna, a, b, alfa, k))
+        return resumen
+    with ProcessPoolExecutor(max_workers=len(tramos), mp_context=multiprocessing.get_context("spawn")) as pool:
+        parciales = [pool.submit(_resumir_tramo, ruta_csv, sep, columna, a, b, alfa, k) for a, b in tramos]
+        for parcial in parciales:
+            resumen.combinar(parcial.result())
+    return resumen
+
+
+def ruta_estadisticas(ruta_csv):
+    return os.path.splitext(ruta_csv)[0] + ".estadisticas.json"
+
+
+def resumen_para(ruta_csv="Wage.csv", sep=";", procesos=1):
+    # Carga el resumen guardado junto al CSV (o lo construye) y lo pone al día
+    ruta = ruta_estadisticas(ruta_csv)
+    resumen = None
+    if os.path.exists(ruta):
+        try:
+            resumen = ResumenSalarios.cargar(ruta)
+        except Exception as e:
+            print(f"Resumen descartado ({e}), se reconstruye")
+    resumen = resumen or ResumenSalarios()
+    if resumen.actualizar_desde_csv(ruta_csv, sep, procesos=procesos) != "sin cambios":
+        resumen.guardar(ruta)
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estadísticas del salario en una pasada con comparación antes/después de las cercas IQR")
+    parser.add_argument("csv", nargs="?", default="Wage.csv")
+    parser.add_argument("--sep", default=";")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--factor", type=float, default=FACTOR_IQR)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resumen = resumen_para(args.csv, args.sep, args.procesos)
+    comparacion = resumen.antes_despues(args.factor)
+    print(f"Resumen listo en {time.perf_counter() - inicio:.2f} s -> {ruta_estadisticas(args.csv)}")
+    print(f"Cercas IQR: [{comparacion['cercas']['inferior']:.2f}, {comparacion['cercas']['superior']:.2f}], "
+          f"{comparacion['descartados']} valores fuera")
+    for medida in comparacion["antes"]:
+        print(f"{medida:10s} {comparacion['antes'][medida]:14.4f} {comparacion['despues'][medida]:14.4f}")
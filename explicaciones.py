@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import re
+import time
+
+# Generación asíncrona de explicaciones con un LLM. /predict responde de
+# inmediato con un id de explicación y el texto se genera en segundo plano, con
+# límite de concurrencia y timeout. El id es la propia clave de cache
+# (cubeta de salario, clasificación), así que cubetas iguales nunca llaman
+# dos veces al modelo. Solo son válidos los ids que una predicción puede
+# producir: cubeta dentro del rango de salarios y clase cuya banda se cruza con
+# la cubeta, así que el conjunto de textos posibles es pequeño y acotado.
+
+
+class BackendGemini:
+
+    def __init__(self, obtener_genai, nombre_modelo="gemini-1.5-flash"):
+        self.obtener_genai = obtener_genai
+        self.nombre_modelo = nombre_modelo
+        self.modelo = None
+
+    async def generar(self, prompt):
+        if self.modelo is None:
+            self.modelo = self.obtener_genai().GenerativeModel(self.nombre_modelo)
+        respuesta = await self.modelo.generate_content_async(prompt)
+        return respuesta.text
+
+
+class BackendLocal:
+    # Backend sin red para desarrollo y pruebas: devuelve un texto fijo a partir del prompt
+
+    def __init__(self, retardo=0.0):
+        self.retardo = retardo
+        self.llamadas = 0
+
+    async def generar(self, prompt):
+        self.llamadas += 1
+        if self.retardo:
+            await asyncio.sleep(self.retardo)
+        return "Explicación generada localmente (sin LLM):\n" + prompt
+
+
+class ServicioExplicaciones:
+
+    def __init__(self, backend, generar_prompt, obtener_bandas, ancho_cubeta=5.0, concurrencia=4,
+                 timeout=20.0, tamano_cache=1024, salario_maximo=350.0):
+        self.backend = backend
+        self.generar_prompt = generar_prompt
+        # Bandas de clasificación activas (cambian con la versión del modelo)
+        self.obtener_bandas = obtener_bandas
+        self.ancho_cubeta = ancho_cubeta
+        self.salario_maximo = salario_maximo
+        self.timeout = timeout
+        self.tamano_cache = tamano_cache
+        self.semaforo = None
+        self.concurrencia = concurrencia
+        self.resultados = collections.OrderedDict()
+        self.tareas = {}
+
+        self.llamadas = 0
+        self.aciertos = 0
+        self.errores = 0
+        self.timeouts = 0
+
+    def clave(self, salario, clasificacion):
+        cubeta = int(salario // self.ancho_cubeta)
+        return f"{cubeta}-{int(clasificacion)}"
+
+    def solicitar(self, salario, clasificacion):
+        # Debe llamarse desde el event loop; devuelve el id sin esperar al LLM
+        clave = self.clave(salario, clasificacion)
+        self._asegurar(clave)
+        return clave
+
+    def _asegurar(self, clave):
+        resultado = self.resultados.get(clave)
+        if resultado is not None and resultado["estado"] == "listo":
+            self.resultados.move_to_end(clave)
+            self.aciertos += 1
+            return
+        if clave in self.tareas:
+            self.aciertos += 1
+            self.resultados.setdefault(clave, {"estado": "pendiente", "texto": None})
+            return
+        self.resultados[clave] = {"estado": "pendiente", "texto": None}
+        self.tareas[clave] = asyncio.get_running_loop().create_task(self._generar(clave))
+
+    async def _generar(self, clave):
+        if self.semaforo is None:
+            self.semaforo = asyncio.Semaphore(self.concurrencia)
+        inicio = time.perf_counter()
+        try:
+            tramo = self.rango(clave)
+            if tramo is None:
+                # Las bandas cambiaron (otra versión del modelo) y el id ya no corresponde
+                raise ValueError(f"Id de explicación fuera de las bandas activas: {clave}")
+            _, clasificacion, desde, hasta = tramo
+            # El prompt usa el centro del tramo de la cubeta dentro de la banda de la
+            # clase: el texto vale para todos sus salarios y no contradice la clase
+            prompt = self.generar_prompt((desde + hasta) / 2, clasificacion)
+            async with self.semaforo:
+                self.llamadas += 1
+                texto = await asyncio.wait_for(self.backend.generar(prompt), self.timeout)
+            resultado = {"estado": "listo", "texto": texto}
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            resultado = {"estado": "error", "texto": None, "error": f"Timeout de {self.timeout} s"}
+        except Exception as e:
+            self.errores += 1
+            resultado = {"estado": "error", "texto": None, "error": str(e)}
+        except asyncio.CancelledError:
+            resultado = {"estado": "error", "texto": None, "error": "Generación cancelada"}
+            raise
+        finally:
+            # La entrada nunca queda pendiente sin tarea, pase lo que pase arriba
+            resultado["segundos"] = round(time.perf_counter() - inicio, 3)
+            self.resultados[clave] = resultado
+            self.resultados.move_to_end(clave)
+            self.tareas.pop(clave, None)
+            # Se desalojan los más antiguos ya terminados; los pendientes siguen su tarea
+            exceso = len(self.resultados) - self.tamano_cache
+            if exceso > 0:
+                terminados = [c for c in self.resultados if c not in self.tareas][:exceso]
+                for c in terminados:
+                    del self.resultados[c]
+
+    def rango(self, clave):
+        # (cubeta, clase, desde, hasta): tramo de salarios de la cubeta dentro de la
+        # banda de la clase; None si ninguna predicción puede producir ese id
+        partes = _partes(clave)
+        if partes is None:
+            return None
+        cubeta, clasificacion = partes
+        bordes = self.obtener_bandas().bordes
+        if not (0 <= cubeta <= self.salario_maximo // self.ancho_cubeta and 0 <= clasificacion <= len(bordes)):
+            return None
+        desde = max(cubeta * self.ancho_cubeta, bordes[clasificacion - 1] if clasificacion > 0 else 0.0)
+        hasta = min((cubeta + 1) * self.ancho_cubeta, bordes[clasificacion] if clasificacion < len(bordes) else float("inf"))
+        return (cubeta, clasificacion, float(desde), float(hasta)) if desde < hasta else None
+
+    def consultar(self, clave):
+        # Un id válido que no está en cache (p. ej. desalojado o de otro worker) se vuelve a generar
+        if self.rango(clave) is None:
+            return None
+        resultado = self.resultados.get(clave)
+        if resultado is None or resultado["estado"] == "error":
+            self._asegurar(clave)
+            resultado = self.resultados[clave]
+        return {"explicacion_id": clave, **resultado}
+
+    def estadisticas(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "en_cache": sum(1 for r in self.resultados.values() if r["estado"] == "listo"),
+            "pendientes": len(self.tareas),
+            "llamadas_llm": self.llamadas,
+            "aciertos": self.aciertos,
+            "errores": self.errores,
+            "timeouts": self.timeouts,
+        }
+
+
+_FORMATO_ID = re.compile(r"(\d+)-(\d+)", re.ASCII)
+
+
+def _partes(clave):
+    # "cubeta-clasificacion" -> (cubeta, clasificacion); None si el id no es válido.
+    # Solo la forma canónica que genera clave(): sin ceros a la izquierda, signos ni
+    # espacios, para que cada cubeta tenga un único id y una única llamada al LLM
+    coincidencia = _FORMATO_ID.fullmatch(clave)
+    if coincidencia is None:
+        return None
+    cubeta, clasificacion = int(coincidencia.group(1)), int(coincidencia.group(2))
+    return (cubeta, clasificacion) if f"{cubeta}-{clasificacion}" == clave else None
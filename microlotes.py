@@ -0,0 +1,130 @@
+import asyncio
+import collections
+import time
+
+# Planificador de micro-lotes para /predict: agrupa las solicitudes concurrentes
+# y las puntúa con una sola llamada al modelo. Un lote sale cuando (a) alcanza
+# max_filas, (b) hay un trabajador libre o (c) la primera fila lleva max_espera_ms
+# esperando. Con poca carga cada solicitud sale sola en el siguiente ciclo del
+# event loop; con los trabajadores ocupados los lotes crecen solos, así que el
+# tamaño del lote y la espera se adaptan a la carga.
+
+
+class MicroLotes:
+
+    def __init__(self, funcion_lote, ejecutar, max_filas=64, max_espera_ms=5.0, max_en_vuelo=1):
+        self.funcion_lote = funcion_lote
+        self.ejecutar = ejecutar
+        self.max_filas = max_filas
+        self.max_espera = max_espera_ms / 1000
+        self.max_en_vuelo = max_en_vuelo
+
+        self.pendientes = []
+        self.en_vuelo = 0
+        self.despacho_programado = False
+        self.temporizador = None
+
+        self.lotes = 0
+        self.filas = 0
+        self.histograma = collections.Counter()
+        self.esperas = collections.deque(maxlen=2048)
+        self.motivos = collections.Counter()
+
+    async def predecir(self, registro):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self.pendientes.append((registro, futuro, time.perf_counter()))
+        if len(self.pendientes) >= self.max_filas:
+            self._despachar("tamano")
+        elif self.en_vuelo < self.max_en_vuelo:
+            if not self.despacho_programado:
+                # call_soon junta las solicitudes que llegan en el mismo ciclo del loop
+                self.despacho_programado = True
+                loop.call_soon(self._despachar, "libre")
+        elif self.temporizador is None:
+            self.temporizador = loop.call_later(self.max_espera, self._despachar, "espera")
+        return await futuro
+
+    def _despachar(self, motivo):
+        self.despacho_programado = False
+        if self.temporizador is not None:
+            self.temporizador.cancel()
+            self.temporizador = None
+        if not self.pendientes:
+            return
+        lote, self.pendientes = self.pendientes[:self.max_filas], self.pendientes[self.max_filas:]
+        self.en_vuelo += 1
+        self.motivos[motivo] += 1
+        asyncio.get_running_loop().create_task(self._ejecutar_lote(lote))
+        if self.pendientes:
+            self._reprogramar()
+
+    def _reprogramar(self):
+        loop = asyncio.get_running_loop()
+        if len(self.pendientes) >= self.max_filas or self.en_vuelo < self.max_en_vuelo:
+            if not self.despacho_programado:
+                self.despacho_programado = True
+                loop.call_soon(self._despachar, "libre")
+        elif self.temporizador is None:
+            # La espera máxima se cuenta desde la llegada de la fila más antigua
+            restante = self.max_espera - (time.perf_counter() - self.pendientes[0][2])
+            self.temporizador = loop.call_later(max(0.0, restante), self._despachar, "espera")
+
+    async def _ejecutar_lote(self, lote):
+        despacho = time.perf_counter()
+        registros = [r for r, _, _ in lote]
+        try:
+            resultado, metricas = await self.ejecutar(self.funcion_lote, registros)
+        except Exception as e:
+            for _, futuro, _ in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        finally:
+            self.en_vuelo -= 1
+            if self.pendientes:
+                self._reprogramar()
+
+        self.lotes += 1
+        self.filas += len(lote)
+        self.histograma[_cubeta(len(lote))] += 1
+        for i, (_, futuro, llegada) in enumerate(lote):
+            espera = despacho - llegada
+            self.esperas.append(espera)
+            if not futuro.done():
+                futuro.set_result((resultado[i], {
+                    **metricas,
+                    "tamano_lote": len(lote),
+                    "espera_lote_ms": round(espera * 1000, 3),
+                }))
+
+    def estadisticas(self):
+        esperas = sorted(self.esperas)
+
+        def percentil(p):
+            return round(esperas[min(len(esperas) - 1, int(p * len(esperas)))] * 1000, 3) if esperas else 0.0
+
+        return {
+            "max_filas": self.max_filas,
+            "max_espera_ms": self.max_espera * 1000,
+            "lotes": self.lotes,
+            "filas": self.filas,
+            "tamano_promedio": round(self.filas / self.lotes, 2) if self.lotes else 0.0,
+            "histograma_tamano": {k: self.histograma[k] for k in sorted(self.histograma, key=_orden_cubeta)},
+            "motivos_despacho": dict(self.motivos),
+            "espera_agregada_ms": {"p50": percentil(0.5), "p95": percentil(0.95), "p99": percentil(0.99)},
+            "pendientes": len(self.pendientes),
+            "en_vuelo": self.en_vuelo,
+        }
+
+
+def _cubeta(n):
+    # Cubetas en potencias de dos: "1", "2", "3-4", "5-8", ...
+    if n <= 2:
+        return str(n)
+    superior = 1 << (n - 1).bit_length()
+    return f"{superior // 2 + 1}-{superior}"
+
+
+def _orden_cubeta(etiqueta):
+    return int(etiqueta.split("-")[-1])
@@ -0,0 +1,183 @@
+import csv
+import threading
+import time
+
+import numpy as np
+
+from vocabulario import COLUMNAS_VOCABULARIO
+
+# Monitor de deriva de las entradas de /predict respecto a Wage.csv. Cada
+# característica tiene sus celdas en un vector plano de contadores: una por valor
+# entero de las numéricas (más "menor" y "mayor" que el rango de entrenamiento) y
+# una por categoría del vocabulario (más "otro"). Observar una solicitud son ocho
+# incrementos de enteros en el vector del hilo actual (un vector por hilo, sin
+# locks); el cálculo periódico suma los vectores y compara contra la línea base:
+#
+# - PSI sobre ~10 grupos de igual masa en la línea base (numéricas) o por
+#   categoría; por encima de 0.1 la deriva es moderada y de 0.25 significativa.
+# - KS (máxima diferencia entre distribuciones acumuladas) en las numéricas y
+#   variación total en las categóricas.
+#
+# Se informa lo acumulado desde el arranque y la ventana desde el cálculo anterior.
+
+RANGOS_NUMERICOS = {"age": (18, 80), "year": (2003, 2009)}
+OTRO = "(otro)"
+GRUPOS_PSI = 10
+EPSILON = 1e-4
+UMBRALES_PSI = ((0.25, "significativa"), (0.1, "moderada"), (0.0, "estable"))
+
+
+def nivel_psi(psi):
+    return next(nivel for umbral, nivel in UMBRALES_PSI if psi >= umbral)
+
+
+def psi(observada, base):
+    p = np.clip(observada / max(observada.sum(), 1), EPSILON, None)
+    q = np.clip(base / max(base.sum(), 1), EPSILON, None)
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+class MonitorDeriva:
+
+    def __init__(self, linea_base, numericas=RANGOS_NUMERICOS, categoricas=COLUMNAS_VOCABULARIO,
+                 min_muestras=100):
+        # linea_base: {característica: {valor: conteo}} con los valores de Wage.csv
+        self.numericas = dict(numericas)
+        self.categoricas = list(categoricas)
+        self.min_muestras = min_muestras
+        self.celdas = {}
+        self.inicio = {}
+        self.indices = {}
+        posicion = 0
+        for col, (minimo, maximo) in self.numericas.items():
+            self.celdas[col] = [f"<{minimo}"] + [str(v) for v in range(minimo, maximo + 1)] + [f">{maximo}"]
+            self.inicio[col] = posicion
+            posicion += len(self.celdas[col])
+        for col in self.categoricas:
+            self.celdas[col] = sorted(linea_base[col]) + [OTRO]
+            self.indices[col] = {v: posicion + i for i, v in enumerate(self.celdas[col])}
+            self.inicio[col] = posicion
+            posicion += len(self.celdas[col])
+        self.tamano = posicion
+
+        self.base = np.zeros(self.tamano, dtype=np.int64)
+        for col in self.numericas:
+            for valor, conteo in linea_base[col].items():
+                self.base[self._celda_numerica(col, int(valor))] += conteo
+        for col in self.categoricas:
+            for valor, conteo in linea_base[col].items():
+                self.base[self.indices[col][valor]] += conteo
+        self.grupos = {col: self._grupos_numericos(col) for col in self.numericas}
+        # Datos del camino caliente precalculados: (columna, primera celda, mínimo, última posición)
+        self._plan_numericas = tuple(
+            (col, self.inicio[col] + 1, minimo, maximo - minimo + 1) for col, (minimo, maximo) in self.numericas.items()
+        )
+        self._plan_categoricas = tuple((col, self.indices[col], self.indices[col][OTRO]) for col in self.categoricas)
+
+        self._local = threading.local()
+        self._lock_vectores = threading.Lock()
+        self.vectores = []
+        self.anterior = np.zeros(self.tamano, dtype=np.int64)
+        self.reporte = None
+
+    @classmethod
+    def desde_csv(cls, ruta_csv="Wage.csv", sep=";", **opciones):
+        # Lectura directa con csv, como el vocabulario: no importa pandas al iniciar
+        numericas = opciones.get("numericas", RANGOS_NUMERICOS)
+        categoricas = opciones.get("categoricas", COLUMNAS_VOCABULARIO)
+        linea_base = {col: {} for col in list(numericas) + list(categoricas)}
+        with open(ruta_csv, newline="", encoding="utf-8") as f:
+            for fila in csv.DictReader(f, delimiter=sep):
+                for col, conteos in linea_base.items():
+                    conteos[fila[col]] = conteos.get(fila[col], 0) + 1
+        return cls(linea_base, **opciones)
+
+    def _celda_numerica(self, col, valor):
+        minimo, maximo = self.numericas[col]
+        return self.inicio[col] + 1 + min(max(valor - minimo, -1), maximo - minimo + 1)
+
+    def _grupos_numericos(self, col):
+        # Cortes de igual masa en la línea base; las celdas fuera de rango quedan en los extremos
+        inicio, fin = self.inicio[col], self.inicio[col] + len(self.celdas[col])
+        acumulada = np.cumsum(self.base[inicio:fin]) / max(self.base[inicio:fin].sum(), 1)
+        cortes = np.unique(np.searchsorted(acumulada, np.arange(1, GRUPOS_PSI) / GRUPOS_PSI, side="right"))
+        return np.split(np.arange(inicio, fin), cortes[(cortes > 0) & (cortes < fin - inicio)])
+
+    def _vector(self):
+        vector = getattr(self._local, "vector", None)
+        if vector is None:
+            vector = [0] * self.tamano
+            with self._lock_vectores:
+                self.vectores.append(vector)
+            self._local.vector = vector
+        return vector
+
+    def observar(self, registro):
+        # Camino caliente: sin locks ni numpy, solo enteros en la lista del hilo
+        vector = getattr(self._local, "vector", None) or self._vector()
+        for col, primera, minimo, ultima in self._plan_numericas:
+            desplazamiento = int(getattr(registro, col)) - minimo
+            vector[primera + (-1 if desplazamiento < 0 else ultima if desplazamiento > ultima else desplazamiento)] += 1
+        for col, indices, otro in self._plan_categoricas:
+            valor = getattr(registro, col)
+            vector[indices.get(getattr(valor, "value", valor), otro)] += 1
+
+    def conteos(self):
+        with self._lock_vectores:
+            vectores = list(self.vectores)
+        return np.sum([np.asarray(v, dtype=np.int64) for v in vectores], axis=0) if vectores \
+            else np.zeros(self.tamano, dtype=np.int64)
+
+    def _puntajes(self, observados):
+        resultado = {}
+        for col, celdas in self.celdas.items():
+            inicio, fin = self.inicio[col], self.inicio[col] + len(celdas)
+            o, b = observados[inicio:fin], self.base[inicio:fin]
+            n = int(o.sum())
+            if n < self.min_muestras:
+                resultado[col] = {"n": n, "nivel": "insuficiente"}
+                continue
+            p, q = o / n, b / b.sum()
+            if col in self.numericas:
+                grupos = self.grupos[col]
+                valor = psi(np.array([observados[g].sum() for g in grupos]), np.array([self.base[g].sum() for g in grupos]))
+                extra = {"ks": round(float(np.max(np.abs(np.cumsum(p) - np.cumsum(q)))), 4),
+                         "fuera_de_rango": int(o[0] + o[-1])}
+            else:
+                valor = psi(o, b)
+                extra = {"variacion_total": round(float(0.5 * np.abs(p - q).sum()), 4),
+                         "fuera_de_vocabulario": int(o[-1]),
+                         "distribucion": {c.strip(): {"observada": round(float(pi), 4), "base": round(float(qi), 4)}
+                                          for c, pi, qi in zip(celdas, p, q)}}
+            resultado[col] = {"n": n, "psi": round(valor, 4), "nivel": nivel_psi(valor), **extra}
+        return resultado
+
+    def calcular(self):
+        # Llamado en segundo plano cada DERIVA_INTERVALO segundos; solo vectores de ~100 celdas
+        inicio = time.perf_counter()
+        acumulado = self.conteos()
+        ventana = acumulado - self.anterior
+        self.anterior = acumulado
+        puntajes = self._puntajes(acumulado)
+        con_psi = {col: p["psi"] for col, p in puntajes.items() if "psi" in p}
+        peor = max(con_psi, key=con_psi.get) if con_psi else None
+        self.reporte = {
+            "calculado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "segundos_calculo": round(time.perf_counter() - inicio, 6),
+            "observaciones": int(acumulado[:len(self.celdas[next(iter(self.celdas))])].sum()),
+            "nivel": nivel_psi(con_psi[peor]) if peor else "insuficiente",
+            "caracteristica_mas_derivada": peor,
+            "acumulado": puntajes,
+            "ventana": self._puntajes(ventana),
+        }
+        return self.reporte
+
+    def exponer(self):
+        # Líneas para /metrics (se registra en observabilidad.METRICAS)
+        reporte = self.reporte or {"acumulado": {}}
+        lineas = ["# HELP wage_api_deriva_psi PSI de las entradas de /predict contra Wage.csv",
+                  "# TYPE wage_api_deriva_psi gauge"]
+        for col, puntaje in reporte["acumulado"].items():
+            if "psi" in puntaje:
+                lineas.append(f'wage_api_deriva_psi{{caracteristica="{col}"}} {puntaje["psi"]}')
+        return lineas
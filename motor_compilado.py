@@ -0,0 +1,442 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# Motor de evaluación compilado para el CatBoostRegressor de best_wage_model.joblib.
+# Convierte el modelo una sola vez en arreglos contiguos (tablas de categorías,
+# CTRs, splits/umbrales/hojas de los árboles) y evalúa una fila sin DataFrame
+# ni Pool. Se apoya en el exportador oficial de CatBoost a Python, que necesita
+# el dataset de entrenamiento para conocer el hash de cada categoría.
+# El motor se puede exportar a un .npz (solo arreglos numpy, sin pickle) que se
+# carga y evalúa sin catboost ni pandas.
+
+FORMATO_EXPORTADO = 1
+
+MAGIC_MULT = np.uint64(0x4906ba494954cb65)
+MASCARA_64 = 0xffFFffFFffFFffFF
+HASH_VACIO = 0xffFFffFFffFFffFF
+
+# Tipos de elemento dentro de la proyección de un CTR
+_ELEM_VACIO, _ELEM_CAT, _ELEM_BIN_MAYOR, _ELEM_BIN_IGUAL = 0, 1, 2, 3
+
+
+def _exportar_a_python(modelo, df_entrenamiento):
+    # Usa el exportador de CatBoost y carga el código generado en un namespace
+    from catboost import Pool
+
+    cat_idx = modelo.get_cat_feature_indices()
+    pool = Pool(df_entrenamiento[modelo.feature_names_], cat_features=cat_idx)
+    fd, ruta = tempfile.mkstemp(suffix=".py")
+    os.close(fd)
+    try:
+        modelo.save_model(ruta, format="python", pool=pool)
+        with open(ruta, encoding="utf-8") as f:
+            codigo = f.read()
+    finally:
+        os.remove(ruta)
+    namespace = {}
+    exec(compile(codigo, "<catboost_export>", "exec"), namespace)
+    return namespace
+
+
+def _calc_hash(a, b):
+    # Misma combinación de hashes que CatBoost, vectorizada en uint64 (overflow modular)
+    with np.errstate(over="ignore"):
+        return MAGIC_MULT * (a + MAGIC_MULT * b)
+
+
+class MotorCompilado:
+
+    def __init__(self, modelo, df_entrenamiento):
+        ns = _exportar_a_python(modelo, df_entrenamiento)
+        m = ns["catboost_model"]
+        if m.dimension != 1:
+            raise NotImplementedError("Solo se soportan modelos de regresión de una dimensión")
+
+        nombres = list(modelo.feature_names_)
+        cat_idx = set(modelo.get_cat_feature_indices())
+        self.columnas_numericas = [nombres[i] for i in range(len(nombres)) if i not in cat_idx]
+        self.columnas_categoricas = [nombres[i] for i in sorted(cat_idx)]
+
+        # Tablas de categorías: valor -> código, código -> hash de CatBoost
+        hashes = ns["cat_features_hashes"]
+        self.codigos = []
+        self.hash_por_codigo = []
+        for col in self.columnas_categoricas:
+            valores = sorted(df_entrenamiento[col].astype(str).unique())
+            self.codigos.append({v: i for i, v in enumerate(valores)})
+            self.hash_por_codigo.append(
+                np.array([hashes[v] & MASCARA_64 for v in valores], dtype=np.uint64)
+            )
+
+        # Binarización de variables numéricas
+        self.bordes_float = [
+            np.asarray(b, dtype=np.float64) for b in m.float_feature_borders if len(b) > 0
+        ]
+        self.indices_float = [
+            m.float_features_index[i] for i, b in enumerate(m.float_feature_borders) if len(b) > 0
+        ]
+
+        # One-hot: posición del feature categórico y hash esperado
+        pos_cat = {m.cat_features_index[i]: i for i in range(m.cat_feature_count)}
+        self.onehot_pos = np.array([pos_cat[i] for i in m.one_hot_cat_feature_index], dtype=np.intp)
+        self.onehot_hash = np.array(
+            [[v & MASCARA_64 for v in vals] for vals in m.one_hot_hash_values], dtype=np.uint64
+        )
+
+        self._compilar_ctrs(m)
+        self._compilar_arboles(m)
+
+    def _compilar_ctrs(self, m):
+        contenedor = getattr(m, "model_ctrs", None)
+        proyecciones = contenedor.compressed_model_ctrs if contenedor is not None else []
+        largo = max(
+            [len(p.projection.transposed_cat_feature_indexes) + len(p.projection.binarized_indexes)
+             for p in proyecciones] or [0]
+        )
+        n_proy = len(proyecciones)
+        self.proy_tipo = np.zeros((n_proy, largo), dtype=np.int8)
+        self.proy_indice = np.zeros((n_proy, largo), dtype=np.intp)
+        self.proy_valor = np.zeros((n_proy, largo), dtype=np.int64)
+        for p_i, comprimido in enumerate(proyecciones):
+            proy = comprimido.projection
+            k = 0
+            for idx in proy.transposed_cat_feature_indexes:
+                self.proy_tipo[p_i, k] = _ELEM_CAT
+                self.proy_indice[p_i, k] = idx
+                k += 1
+            for b in proy.binarized_indexes:
+                self.proy_tipo[p_i, k] = _ELEM_BIN_IGUAL if b.check_value_equal else _ELEM_BIN_MAYOR
+                self.proy_indice[p_i, k] = b.bin_index
+                self.proy_valor[p_i, k] = b.value
+                k += 1
+
+        self._preparar_pasos()
+
+        # Una sola tabla global (id de tabla, hash) -> fila de conteos; la fila 0
+        # queda en cero para los hashes no vistos en entrenamiento
+        self.tabla_ctr = {}
+        conteos, totales = [0.0], [0.0]
+        ids_tabla = {}
+        ctr_proyeccion, ctr_tabla = [], []
+        ctr_prior_num, ctr_prior_denom, ctr_shift, ctr_scale = [], [], [], []
+        for p_i, comprimido in enumerate(proyecciones):
+            for ctr in comprimido.model_ctrs:
+                if ctr.base_ctr_type not in ("Borders", "Counter"):
+                    raise NotImplementedError(f"Tipo de CTR no soportado: {ctr.base_ctr_type}")
+                if ctr.base_hash not in ids_tabla:
+                    ids_tabla[ctr.base_hash] = len(ids_tabla)
+                    tabla = contenedor.ctr_data.learn_ctrs[ctr.base_hash]
+                    for h, conteo, total in self._leer_tabla(tabla, ctr.base_ctr_type):
+                        self.tabla_ctr[(ids_tabla[ctr.base_hash], h)] = len(conteos)
+                        conteos.append(conteo)
+                        totales.append(total)
+                ctr_proyeccion.append(p_i)
+                ctr_tabla.append(ids_tabla[ctr.base_hash])
+                ctr_prior_num.append(ctr.prior_num)
+                ctr_prior_denom.append(ctr.prior_denom)
+                ctr_shift.append(ctr.shift)
+                ctr_scale.append(ctr.scale)
+
+        # Pares (tabla, proyección) distintos que hay que resolver por fila
+        pares = sorted(set(zip(ctr_tabla, ctr_proyeccion)))
+        posicion_par = {par: i for i, par in enumerate(pares)}
+        self.pares_tabla = [t for t, _ in pares]
+        self.pares_proyeccion = np.array([p for _, p in pares], dtype=np.intp)
+        self.ctr_par = np.array(
+            [posicion_par[par] for par in zip(ctr_tabla, ctr_proyeccion)], dtype=np.intp
+        )
+
+        self.ctr_conteos = np.array(conteos, dtype=np.float32)
+        self.ctr_totales = np.array(totales, dtype=np.float32)
+        self.ctr_prior_num = np.array(ctr_prior_num, dtype=np.float32)
+        self.ctr_prior_denom = np.array(ctr_prior_denom, dtype=np.float32)
+        self.ctr_shift = np.array(ctr_shift, dtype=np.float32)
+        self.ctr_scale = np.array(ctr_scale, dtype=np.float32)
+
+        # Bordes de los CTR en una matriz rellena con +inf
+        n_bordes = max([len(b) for b in m.ctr_feature_borders] or [0])
+        self.bordes_ctr = np.full((len(m.ctr_feature_borders), n_bordes), np.inf, dtype=np.float32)
+        for c, bordes in enumerate(m.ctr_feature_borders):
+            self.bordes_ctr[c, :len(bordes)] = bordes
+
+    def _preparar_pasos(self):
+        # Máscaras por posición del elemento, precalculadas para la evaluación
+        self.proy_pasos = []
+        for e in range(self.proy_tipo.shape[1]):
+            tipo = self.proy_tipo[:, e]
+            self.proy_pasos.append((
+                tipo != _ELEM_VACIO,
+                np.flatnonzero(tipo == _ELEM_CAT),
+                np.flatnonzero(tipo == _ELEM_BIN_MAYOR),
+                np.flatnonzero(tipo == _ELEM_BIN_IGUAL),
+                self.proy_indice[:, e],
+                self.proy_valor[:, e],
+            ))
+
+    @staticmethod
+    def _leer_tabla(tabla, tipo):
+        # Devuelve (hash, conteo en clase, total) por bucket, como en calc_ctrs de CatBoost
+        historia = tabla.ctr_total
+        for h, bucket in tabla.index_hash_viewer.items():
+            if h == HASH_VACIO:
+                continue
+            if tipo == "Counter":
+                yield h, historia[bucket], tabla.counter_denominator
+            else:
+                if tabla.target_classes_count != 2:
+                    raise NotImplementedError("Solo se soportan CTR Borders con target binarizado en 2 clases")
+                yield h, historia[2 * bucket + 1], historia[2 * bucket] + historia[2 * bucket + 1]
+
+    def _compilar_arboles(self, m):
+        profundidades = np.asarray(m.tree_depth, dtype=np.intp)
+        n_arboles = len(profundidades)
+        prof_max = int(profundidades.max())
+        self.n_binarios = m.binary_feature_count
+
+        # Splits rellenados a la profundidad máxima; el relleno apunta a un feature
+        # binario constante en cero (índice n_binarios) con umbral 1 -> bit siempre 0
+        self.split_feature = np.full((n_arboles, prof_max), self.n_binarios, dtype=np.intp)
+        self.split_borde = np.ones((n_arboles, prof_max), dtype=np.int32)
+        self.split_xor = np.zeros((n_arboles, prof_max), dtype=np.int32)
+        inicio = np.concatenate([[0], np.cumsum(profundidades)[:-1]])
+        for t in range(n_arboles):
+            d, s = profundidades[t], inicio[t]
+            self.split_feature[t, :d] = m.tree_split_feature_index[s:s + d]
+            self.split_borde[t, :d] = m.tree_split_border[s:s + d]
+            self.split_xor[t, :d] = m.tree_split_xor_mask[s:s + d]
+
+        self.potencias = (1 << np.arange(prof_max)).astype(np.intp)
+        self.offset_hojas = np.concatenate([[0], np.cumsum(1 << profundidades)[:-1]]).astype(np.intp)
+        self.hojas = np.asarray([v[0] for v in m.leaf_values], dtype=np.float64)
+        self.escala = float(m.scale)
+        self.sesgo = float(m.biases[0])
+
+    def _codificar(self, columnas):
+        # columnas: dict nombre -> lista de valores; devuelve None si hay categorías desconocidas
+        numericas = np.column_stack(
+            [np.asarray(columnas[c], dtype=np.float64) for c in self.columnas_numericas]
+        )
+        hashes = np.empty((len(numericas), len(self.columnas_categoricas)), dtype=np.uint64)
+        for j, col in enumerate(self.columnas_categoricas):
+            codigos = self.codigos[j]
+            try:
+                cod = np.array([codigos[str(v)] for v in columnas[col]], dtype=np.intp)
+            except KeyError:
+                return None
+            hashes[:, j] = self.hash_por_codigo[j][cod]
+        return numericas, hashes
+
+    def _binarizar(self, numericas, hashes):
+        n = len(numericas)
+        bf = np.zeros((n, self.n_binarios + 1), dtype=np.int32)
+        k = 0
+        for idx, bordes in zip(self.indices_float, self.bordes_float):
+            bf[:, k] = np.searchsorted(bordes, numericas[:, idx], side="left")
+            k += 1
+        for j, pos in enumerate(self.onehot_pos):
+            iguales = hashes[:, pos][:, None] == self.onehot_hash[j][None, :]
+            bf[:, k] = (iguales * np.arange(1, iguales.shape[1] + 1)).max(axis=1)
+            k += 1
+
+        if len(self.ctr_par):
+            # Hash de cada proyección para todas las filas a la vez
+            h = np.zeros((n, self.proy_tipo.shape[0]), dtype=np.uint64)
+            for activo, es_cat, es_mayor, es_igual, idx, valor_ref in self.proy_pasos:
+                valor = np.zeros_like(h)
+                valor[:, es_cat] = hashes[:, idx[es_cat]]
+                valor[:, es_mayor] = bf[:, idx[es_mayor]] >= valor_ref[es_mayor]
+                valor[:, es_igual] = bf[:, idx[es_igual]] == valor_ref[es_igual]
+                h = np.where(activo, _calc_hash(h, valor), h)
+
+            hp = h[:, self.pares_proyeccion].tolist()
+            filas = np.array(
+                [[self.tabla_ctr.get(par, 0) for par in zip(self.pares_tabla, fila)] for fila in hp],
+                dtype=np.intp,
+            )[:, self.ctr_par]
+            ctrs = (self.ctr_conteos[filas] + self.ctr_prior_num) / (self.ctr_totales[filas] + self.ctr_prior_denom)
+            ctrs = (ctrs + self.ctr_shift) * self.ctr_scale
+            bf[:, k:k + len(self.bordes_ctr)] = (ctrs[:, :, None] > self.bordes_ctr[None, :, :]).sum(axis=2)
+        return bf
+
+    def _evaluar(self, bf):
+        bits = (bf[:, self.split_feature] ^ self.split_xor) >= self.split_borde
+        indice_hoja = bits @ self.potencias
+        valores = self.hojas[self.offset_hojas + indice_hoja]
+        return valores.sum(axis=1) * self.escala + self.sesgo
+
+    def predecir_columnas(self, columnas):
+        codificado = self._codificar(columnas)
+        if codificado is None:
+            return None
+        return self._evaluar(self._binarizar(*codificado))
+
+    def guardar(self, ruta, metadatos=None):
+        # Solo arreglos numpy y un JSON de metadatos: se carga con allow_pickle=False
+        claves_ctr = list(self.tabla_ctr.items())
+        arreglos = {
+            "onehot_pos": self.onehot_pos,
+            "onehot_hash": self.onehot_hash,
+            "proy_tipo": self.proy_tipo,
+            "proy_indice": self.proy_indice,
+            "proy_valor": self.proy_valor,
+            "ctr_clave_tabla": np.array([t for (t, _), _ in claves_ctr], dtype=np.intp),
+            "ctr_clave_hash": np.array([h for (_, h), _ in claves_ctr], dtype=np.uint64),
+            "ctr_clave_fila": np.array([f for _, f in claves_ctr], dtype=np.intp),
+            "pares_tabla": np.array(self.pares_tabla, dtype=np.intp),
+            "pares_proyeccion": self.pares_proyeccion,
+            "ctr_par": self.ctr_par,
+            "ctr_conteos": self.ctr_conteos,
+            "ctr_totales": self.ctr_totales,
+            "ctr_prior_num": self.ctr_prior_num,
+            "ctr_prior_denom": self.ctr_prior_denom,
+            "ctr_shift": self.ctr_shift,
+            "ctr_scale": self.ctr_scale,
+            "bordes_ctr": self.bordes_ctr,
+            "split_feature": self.split_feature,
+            "split_borde": self.split_borde,
+            "split_xor": self.split_xor,
+            "potencias": self.potencias,
+            "offset_hojas": self.offset_hojas,
+            "hojas": self.hojas,
+        }
+        for j, hashes in enumerate(self.hash_por_codigo):
+            arreglos[f"hash_por_codigo_{j}"] = hashes
+        for k, bordes in enumerate(self.bordes_float):
+            arreglos[f"bordes_float_{k}"] = bordes
+        meta = {
+            "formato": FORMATO_EXPORTADO,
+            "columnas_numericas": self.columnas_numericas,
+            "columnas_categoricas": self.columnas_categoricas,
+            "valores_categoricos": [sorted(c, key=c.get) for c in self.codigos],
+            "indices_float": [int(i) for i in self.indices_float],
+            "n_binarios": int(self.n_binarios),
+            "escala": self.escala,
+            "sesgo": self.sesgo,
+            **(metadatos or {}),
+        }
+        arreglos["metadatos"] = np.array(json.dumps(meta, ensure_ascii=False))
+        temporal = ruta + ".tmp.npz"
+        np.savez(temporal, **arreglos)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta, allow_pickle=False) as datos:
+            arreglos = {k: datos[k] for k in datos.files}
+        meta = json.loads(str(arreglos.pop("metadatos")))
+        if meta.get("formato") != FORMATO_EXPORTADO:
+            raise ValueError(f"Formato de motor exportado no soportado: {meta.get('formato')}")
+        motor = cls.__new__(cls)
+        motor.metadatos = meta
+        motor.columnas_numericas = meta["columnas_numericas"]
+        motor.columnas_categoricas = meta["columnas_categoricas"]
+        motor.codigos = [{v: i for i, v in enumerate(valores)} for valores in meta["valores_categoricos"]]
+        motor.hash_por_codigo = [arreglos.pop(f"hash_por_codigo_{j}") for j in range(len(motor.codigos))]
+        motor.indices_float = meta["indices_float"]
+        motor.bordes_float = [arreglos.pop(f"bordes_float_{k}") for k in range(len(motor.indices_float))]
+        motor.n_binarios = meta["n_binarios"]
+        motor.escala = meta["escala"]
+        motor.sesgo = meta["sesgo"]
+        motor.tabla_ctr = {
+            (t, h): f for t, h, f in zip(
+                arreglos.pop("ctr_clave_tabla").tolist(),
+                arreglos.pop("ctr_clave_hash").tolist(),
+                arreglos.pop("ctr_clave_fila").tolist(),
+            )
+        }
+        motor.pares_tabla = arreglos.pop("pares_tabla").tolist()
+        for nombre, arreglo in arreglos.items():
+            setattr(motor, nombre, arreglo)
+        motor._preparar_pasos()
+        return motor
+
+
+def compilar_motor(modelo, ruta_csv="Wage.csv", tolerancia=1e-6):
+    # Compila el modelo y verifica paridad contra modelo.predict sobre todo el dataset;
+    # si algo falla o difiere devuelve None para seguir usando el pipeline original
+    from almacen_datos import leer_dataset
+
+    try:
+        df = leer_dataset(ruta_csv)
+        motor = MotorCompilado(modelo, df)
+        X = df[modelo.feature_names_]
+        esperado = np.asarray(modelo.predict(X), dtype=np.float64)
+        obtenido = motor.predecir_columnas({c: X[c].tolist() for c in X.columns})
+    except Exception as e:
+        print(f"Motor compilado deshabilitado: {e}")
+        return None
+    if obtenido is None:
+        print("Motor compilado deshabilitado: categorías desconocidas en la verificación")
+        return None
+    diferencia = float(np.max(np.abs(obtenido - esperado)))
+    if diferencia > tolerancia:
+        print(f"Motor compilado deshabilitado: diferencia máxima {diferencia:.3g} contra modelo.predict")
+        return None
+    print(f"Motor compilado activo (diferencia máxima {diferencia:.3g})")
+    return motor
+
+
+def ruta_exportada(ruta_modelo):
+    return os.path.splitext(ruta_modelo)[0] + ".motor.npz"
+
+
+def verificar_paridad(motor, modelo, ruta_csv="Wage.csv"):
+    # Diferencia máxima contra modelo.predict sobre todo el dataset
+    from almacen_datos import leer_dataset
+
+    X = leer_dataset(ruta_csv)[modelo.feature_names_]
+    esperado = np.asarray(modelo.predict(X), dtype=np.float64)
+    obtenido = motor.predecir_columnas({c: X[c].tolist() for c in X.columns})
+    if obtenido is None:
+        raise ValueError("El motor no reconoce todas las categorías del dataset")
+    return float(np.max(np.abs(obtenido - esperado)))
+
+
+def exportar_motor(ruta_modelo="best_wage_model.joblib", ruta_csv="Wage.csv", ruta_salida=None,
+                   tolerancia=1e-6):
+    # Compila, guarda y vuelve a cargar el archivo exportado para verificar paridad
+    from carga_modelo import cargar_modelo
+    from tabla_predicciones import hash_archivo
+
+    ruta_salida = ruta_salida or ruta_exportada(ruta_modelo)
+    modelo = cargar_modelo(ruta_modelo)
+    motor = compilar_motor(modelo, ruta_csv, tolerancia)
+    if motor is None:
+        raise RuntimeError("No se pudo compilar el modelo con paridad exacta; no se exporta")
+    motor.guardar(ruta_salida, {"modelo_sha256": hash_archivo(ruta_modelo)})
+    diferencia = verificar_paridad(MotorCompilado.cargar(ruta_salida), modelo, ruta_csv)
+    if diferencia > tolerancia:
+        os.remove(ruta_salida)
+        raise RuntimeError(f"El motor exportado difiere de modelo.predict ({diferencia:.3g})")
+    print(f"Paridad del motor exportado sobre {ruta_csv}: diferencia máxima {diferencia:.3g}")
+    return ruta_salida
+
+
+def cargar_motor_exportado(ruta, ruta_modelo="best_wage_model.joblib"):
+    # None si no existe o fue exportado desde otra versión del modelo
+    from tabla_predicciones import hash_archivo
+
+    if not os.path.exists(ruta):
+        print(f"Motor exportado no encontrado: {ruta}")
+        return None
+    motor = MotorCompilado.cargar(ruta)
+    if motor.metadatos.get("modelo_sha256") != hash_archivo(ruta_modelo):
+        print(f"Motor exportado descartado: {ruta} corresponde a otra versión del modelo")
+        return None
+    return motor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el modelo a un motor numpy portable (.npz)")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    parser.add_argument("--csv", default="Wage.csv")
+    parser.add_argument("--salida", default=None)
+    args = parser.parse_args()
+    inicio = time.perf_counter()
+    ruta = exportar_motor(args.modelo, args.csv, args.salida)
+    print(f"Motor exportado a {ruta} en {time.perf_counter() - inicio:.2f} s")
@@ -0,0 +1,252 @@
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+# Métricas en formato de texto de Prometheus y logging estructurado para la API.
+# Las etapas de /predict (validación, DataFrame, modelo, clasificación y
+# serialización) se registran en histogramas de latencia. Las etapas que corren
+# en el pool de inferencia se capturan en el trabajador y se devuelven con el
+# resultado, así funcionan igual con hilos que con procesos.
+
+CUBETAS_SEGUNDOS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = ",".join(f'{n}="{str(v)}"' for n, v in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+class Contador:
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.lock = threading.Lock()
+        self.valores = {}
+
+    def incrementar(self, *valores, cantidad=1):
+        with self.lock:
+            self.valores[valores] = self.valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self.lock:
+            for valores, total in sorted(self.valores.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+class Medidor:
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.lock = threading.Lock()
+        self.valor = 0
+
+    def sumar(self, cantidad):
+        with self.lock:
+            self.valor += cantidad
+
+    def exponer(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge",
+                f"{self.nombre} {self.valor}"]
+
+
+class Histograma:
+
+    def __init__(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.cubetas = tuple(cubetas)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observar(self, valor, *valores):
+        # Conteo no acumulado por cubeta; se acumula al exponer
+        indice = len(self.cubetas)
+        for i, limite in enumerate(self.cubetas):
+            if valor <= limite:
+                indice = i
+                break
+        with self.lock:
+            serie = self.series.get(valores)
+            if serie is None:
+                serie = self.series[valores] = [[0] * (len(self.cubetas) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self.lock:
+            for valores, (conteos, suma, total) in sorted(self.series.items()):
+                acumulado = 0
+                for limite, conteo in zip(self.cubetas + ("+Inf",), conteos):
+                    acumulado += conteo
+                    etiquetas = _etiquetas(self.etiquetas + ("le",), valores + (limite,))
+                    lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+                base = _etiquetas(self.etiquetas, valores)
+                lineas.append(f"{self.nombre}_sum{base} {suma:.6f}")
+                lineas.append(f"{self.nombre}_count{base} {total}")
+        return lineas
+
+
+SOLICITUDES = Contador("wage_api_solicitudes_total", "Solicitudes HTTP por método, ruta y estado",
+                       ("metodo", "ruta", "estado"))
+EN_VUELO = Medidor("wage_api_solicitudes_en_vuelo", "Solicitudes HTTP en curso")
+LATENCIA = Histograma("wage_api_latencia_segundos", "Latencia total de la solicitud", ("metodo", "ruta"))
+ETAPAS = Histograma("wage_api_etapa_segundos", "Latencia por etapa de la predicción", ("etapa",))
+METRICAS = [SOLICITUDES, EN_VUELO, LATENCIA, ETAPAS]
+
+
+def exponer_metricas():
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+# -------------------------------
+# Etapas
+# -------------------------------
+
+_colector = threading.local()
+_solicitud = contextvars.ContextVar("solicitud", default=None)
+
+
+@contextlib.contextmanager
+def capturar_etapas():
+    # En el trabajador: junta las etapas medidas durante una llamada
+    etapas = {}
+    anterior = getattr(_colector, "etapas", None)
+    _colector.etapas = etapas
+    try:
+        yield etapas
+    finally:
+        _colector.etapas = anterior
+
+
+@contextlib.contextmanager
+def medir_etapa(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        etapas = getattr(_colector, "etapas", None)
+        if etapas is not None:
+            etapas[nombre] = etapas.get(nombre, 0.0) + duracion
+        else:
+            ETAPAS.observar(duracion, nombre)
+
+
+def observar_etapas(etapas):
+    for nombre, duracion in etapas.items():
+        ETAPAS.observar(duracion, nombre)
+
+
+def marcar_inicio_handler():
+    # Validación = desde que llega la solicitud hasta que entra al handler
+    solicitud = _solicitud.get()
+    if solicitud is not None:
+        ETAPAS.observar(time.perf_counter() - solicitud["inicio"], "validacion")
+
+
+def marcar_fin_handler():
+    # Serialización = desde que sale del handler hasta que empieza la respuesta
+    solicitud = _solicitud.get()
+    if solicitud is not None:
+        solicitud["fin_handler"] = time.perf_counter()
+
+
+class MiddlewareMetricas:
+    # Middleware ASGI puro: sin tareas extra por solicitud
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        solicitud = {"inicio": time.perf_counter(), "fin_handler": None, "estado": 500}
+        token = _solicitud.set(solicitud)
+        EN_VUELO.sumar(1)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                solicitud["estado"] = mensaje["status"]
+                if solicitud["fin_handler"] is not None:
+                    ETAPAS.observar(time.perf_counter() - solicitud["fin_handler"], "serializacion")
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            EN_VUELO.sumar(-1)
+            _solicitud.reset(token)
+            # La plantilla de la ruta (no la URL) mantiene acotada la cardinalidad
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            SOLICITUDES.incrementar(scope["method"], ruta, solicitud["estado"])
+            LATENCIA.observar(time.perf_counter() - solicitud["inicio"], scope["method"], ruta)
+
+
+# -------------------------------
+# Logging
+# -------------------------------
+
+class FormatoJSON(logging.Formatter):
+
+    def format(self, record):
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        evento.update(getattr(record, "campos", {}))
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreo(logging.Filter):
+    # Deja pasar una fracción de los eventos INFO/DEBUG; advertencias, errores y los
+    # eventos marcados con extra={"sin_muestreo": True} (p. ej. cambios de modelo) siempre
+
+    def __init__(self, fraccion):
+        super().__init__()
+        self.fraccion = fraccion
+
+    def filter(self, record):
+        return (record.levelno >= logging.WARNING or getattr(record, "sin_muestreo", False)
+                or random.random() < self.fraccion)
+
+
+def configurar_logging(nombre="wage_api", muestreo=0.01, nivel="INFO"):
+    # El handler solo encola; un hilo aparte formatea y escribe en stderr
+    logger = logging.getLogger(nombre)
+    if getattr(logger, "_oyente", None) is not None:
+        return logger
+    cola = queue.SimpleQueue()
+    salida = logging.StreamHandler()
+    salida.setFormatter(FormatoJSON())
+    oyente = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    oyente.start()
+    encolador = logging.handlers.QueueHandler(cola)
+    encolador.addFilter(FiltroMuestreo(muestreo))
+    logger.addHandler(encolador)
+    logger.setLevel(nivel)
+    logger.propagate = False
+    logger._oyente = oyente
+    return logger
@@ -0,0 +1,98 @@
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from almacen_datos import COLUMNAS_CATEGORICAS
+
+# Puntuación masiva de archivos con el esquema de Wage.csv (separados por ";").
+# El archivo se lee por bloques de tamaño fijo, cada bloque se puntúa en un pool
+# de procesos y la salida se escribe en el orden de entrada. Como nunca hay más
+# de 2 bloques por proceso en vuelo, la memoria no depende del tamaño del archivo.
+
+
+_modelo = None
+_vocabulario = None
+
+
+def _iniciar_trabajador(ruta_modelo, ruta_datos):
+    # Cada proceso carga el modelo y el vocabulario una sola vez
+    global _modelo, _vocabulario
+    from carga_modelo import cargar_modelo
+    from vocabulario import Vocabulario
+    _modelo = cargar_modelo(ruta_modelo)
+    _vocabulario = Vocabulario.desde_csv(ruta_datos)
+
+
+def _predecir_bloque(bloque):
+    # Categorías al valor canónico del entrenamiento (p. ej. "College Grad" -> " College Grad")
+    X = bloque[list(_modelo.feature_names_)].copy()
+    for columna in _vocabulario.mapas:
+        if columna in X.columns:
+            X[columna] = _vocabulario.normalizar_columna(columna, X[columna].to_numpy())[0]
+    # Un hilo por proceso: el paralelismo lo da el pool, no CatBoost
+    return _modelo.predict(X, thread_count=1)
+
+
+def puntuar_archivo(ruta_entrada, ruta_salida, ruta_modelo="best_wage_model.joblib",
+                    tam_bloque=100_000, procesos=None, sep=";", ruta_datos="Wage.csv"):
+    import pandas as pd
+    from clasificacion_salario import cargar_bandas
+
+    bandas = cargar_bandas(ruta_modelo, ruta_datos)
+
+    procesos = procesos or os.cpu_count() or 1
+    max_en_vuelo = 2 * procesos
+    lector = pd.read_csv(
+        ruta_entrada, sep=sep, chunksize=tam_bloque,
+        dtype={c: str for c in COLUMNAS_CATEGORICAS},
+    )
+    pendientes = collections.deque()
+    filas = 0
+    inicio = time.perf_counter()
+    temporal = ruta_salida + ".tmp"
+
+    def escribir_siguiente(destino):
+        nonlocal filas
+        bloque, futuro = pendientes.popleft()
+        prediccion = futuro.result()
+        bloque["prediccion_salario"] = prediccion.round(2)
+        bloque["clasificacion"] = bandas.clasificar(prediccion)
+        bloque.to_csv(destino, sep=sep, index=False, header=filas == 0)
+        filas += len(bloque)
+        segundos = time.perf_counter() - inicio
+        print(f"{filas} filas puntuadas ({filas / segundos:,.0f} filas/s)", file=sys.stderr)
+
+    with ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_iniciar_trabajador,
+        initargs=(ruta_modelo, ruta_datos),
+    ) as pool, open(temporal, "w", newline="") as destino:
+        for bloque in lector:
+            if len(pendientes) >= max_en_vuelo:
+                escribir_siguiente(destino)
+            pendientes.append((bloque, pool.submit(_predecir_bloque, bloque)))
+        while pendientes:
+            escribir_siguiente(destino)
+    os.replace(temporal, ruta_salida)
+
+    segundos = time.perf_counter() - inicio
+    print(f"Listo: {filas} filas en {segundos:.1f} s ({filas / max(segundos, 1e-9):,.0f} filas/s) -> {ruta_salida}",
+          file=sys.stderr)
+    return filas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Puntúa un CSV con el esquema de Wage.csv usando best_wage_model.joblib")
+    parser.add_argument("entrada")
+    parser.add_argument("salida")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    parser.add_argument("--tam-bloque", type=int, default=100_000)
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--sep", default=";")
+    args = parser.parse_args()
+    puntuar_archivo(args.entrada, args.salida, args.modelo, args.tam_bloque, args.procesos, args.sep)
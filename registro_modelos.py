@@ -0,0 +1,268 @@
+import argparse
+import collections
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clasificacion_salario import cargar_bandas
+from tabla_predicciones import cargar_tabla, hash_archivo
+
+# Registro de modelos versionados para recargas sin reiniciar la API. Cada
+# versión vive en su propio directorio con el artefacto y un metadata.json:
+#
+#   modelos/
+#     ACTIVO               <- versión activa (se reemplaza de forma atómica)
+#     v1/modelo.joblib
+#     v1/metadata.json
+#
+# ModeloServido agrupa lo que depende de un artefacto (pipeline, motor, tabla y
+# bandas de clasificación) para que la API lo cambie como una unidad, y
+# EvaluacionSombra puntúa una muestra del tráfico con un modelo candidato fuera
+# del camino de la solicitud.
+
+PATRON_VERSION = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+
+class RegistroModelos:
+
+    def __init__(self, directorio="modelos"):
+        self.directorio = directorio
+
+    def _validar(self, version):
+        # La versión llega por URL: solo nombres simples, nunca rutas
+        if not PATRON_VERSION.match(version or ""):
+            raise ValueError(f"Versión inválida: {version!r}")
+        return version
+
+    def ruta_version(self, version):
+        return os.path.join(self.directorio, self._validar(version))
+
+    def metadatos(self, version):
+        with open(os.path.join(self.ruta_version(version), "metadata.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def ruta_artefacto(self, version):
+        return os.path.join(self.ruta_version(version), self.metadatos(version)["archivo"])
+
+    def listar(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        versiones = []
+        for nombre in sorted(os.listdir(self.directorio)):
+            if PATRON_VERSION.match(nombre) and os.path.exists(os.path.join(self.directorio, nombre, "metadata.json")):
+                versiones.append(self.metadatos(nombre))
+        return sorted(versiones, key=lambda m: m["creado"])
+
+    def registrar(self, ruta_modelo, version=None, descripcion="", metricas=None):
+        # Copia el artefacto (y su .cbm / .motor.npz / .bandas.json si existen) a un directorio nuevo
+        sha256 = hash_archivo(ruta_modelo)
+        version = self._validar(version or time.strftime("%Y%m%d-%H%M%S"))
+        destino = self.ruta_version(version)
+        if os.path.exists(destino):
+            raise FileExistsError(f"La versión {version} ya existe en {self.directorio}")
+        temporal = destino + ".tmp"
+        os.makedirs(temporal)
+        base, extension = os.path.splitext(ruta_modelo)
+        archivo = "modelo" + extension
+        shutil.copy2(ruta_modelo, os.path.join(temporal, archivo))
+        for sufijo in (".cbm", ".motor.npz", ".bandas.json"):
+            if os.path.exists(base + sufijo):
+                shutil.copy2(base + sufijo, os.path.join(temporal, "modelo" + sufijo))
+        metadatos = {
+            "version": version,
+            "archivo": archivo,
+            "sha256": sha256,
+            "tamano_bytes": os.path.getsize(ruta_modelo),
+            "creado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "origen": os.path.abspath(ruta_modelo),
+            "descripcion": descripcion,
+            "metricas": metricas or {},
+        }
+        with open(os.path.join(temporal, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadatos, f, indent=2, ensure_ascii=False)
+        os.rename(temporal, destino)
+        return metadatos
+
+    def leer_activa(self):
+        try:
+            with open(os.path.join(self.directorio, "ACTIVO"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def marcar_activa(self, version):
+        self.metadatos(version)
+        ruta = os.path.join(self.directorio, "ACTIVO")
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            f.write(version + "\n")
+        os.replace(ruta + ".tmp", ruta)
+
+
+class ModeloServido:
+    # Pipeline, motor, tabla y bandas de clasificación de una misma versión del modelo
+
+    def __init__(self, ruta, version=None, backend="joblib", compilar=False,
+                 ruta_tabla=None, ruta_motor=None, ruta_csv="Wage.csv", cuantiles=None):
+        self.ruta = ruta
+        self.sha256 = hash_archivo(ruta)
+        self.version = version or self.sha256[:12]
+        self.compilar = compilar
+        self.ruta_csv = ruta_csv
+        self.modelo = None
+        self.motor = None
+        self.lock = threading.Lock()
+        self.estado = {"version": self.version, "cargado": False, "calentado": False,
+                       "segundos_carga": None, "error": None}
+        if backend == "exportado":
+            from motor_compilado import cargar_motor_exportado, ruta_exportada
+            self.motor = cargar_motor_exportado(ruta_motor or ruta_exportada(ruta), ruta)
+        self.tabla = cargar_tabla(ruta_tabla, ruta) if ruta_tabla else None
+        self.bandas = cargar_bandas(ruta, ruta_csv, cuantiles)
+
+    def obtener_modelo(self):
+        # Carga el pipeline una sola vez (doble verificación con lock)
+        if self.modelo is None:
+            with self.lock:
+                if self.modelo is None:
+                    from carga_modelo import cargar_modelo
+                    inicio = time.perf_counter()
+                    cargado = cargar_modelo(self.ruta)
+                    # Motor compilado opcional: si la paridad contra modelo.predict falla queda en None
+                    if self.compilar and self.motor is None:
+                        from motor_compilado import compilar_motor
+                        self.motor = compilar_motor(cargado, self.ruta_csv)
+                    self.modelo = cargado
+                    self.estado["cargado"] = True
+                    self.estado["segundos_carga"] = round(time.perf_counter() - inicio, 3)
+        return self.modelo
+
+
+class EvaluacionSombra:
+    # Puntúa una fracción del tráfico con un modelo candidato en un hilo aparte.
+    # Si ya hay max_pendientes evaluaciones en curso la muestra se descarta: la
+    # sombra nunca agrega espera a /predict.
+
+    def __init__(self, version, funcion_prediccion, clasificar, fraccion=0.05, max_pendientes=8):
+        self.version = version
+        self.funcion_prediccion = funcion_prediccion
+        self.clasificar = clasificar
+        self.fraccion = fraccion
+        self.max_pendientes = max_pendientes
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sombra")
+        self.lock = threading.Lock()
+        self.pendientes = 0
+        self.evaluadas = 0
+        self.descartadas = 0
+        self.errores = 0
+        self.coincidencias = 0
+        self.latencias = collections.deque(maxlen=2048)
+        self.latencias_activo = collections.deque(maxlen=2048)
+        self.diferencias = collections.deque(maxlen=2048)
+        self.suma_diferencias = 0.0
+
+    def muestrear(self):
+        return random.random() < self.fraccion
+
+    def enviar(self, registros, predicciones_activas, latencia_activa_ms=None):
+        with self.lock:
+            if self.pendientes >= self.max_pendientes:
+                self.descartadas += 1
+                return
+            self.pendientes += 1
+        try:
+            self.pool.submit(self._evaluar, registros, np.asarray(predicciones_activas, dtype=float),
+                             latencia_activa_ms)
+        except RuntimeError:
+            with self.lock:
+                self.pendientes -= 1
+
+    def _evaluar(self, registros, activas, latencia_activa_ms):
+        try:
+            inicio = time.perf_counter()
+            candidatas = np.asarray(self.funcion_prediccion(registros), dtype=float)
+            latencia = (time.perf_counter() - inicio) * 1000
+            diferencias = candidatas - activas
+            coincidencias = int(np.sum(self.clasificar(candidatas) == self.clasificar(activas)))
+            with self.lock:
+                self.evaluadas += len(registros)
+                self.coincidencias += coincidencias
+                self.latencias.append(latencia)
+                if latencia_activa_ms is not None:
+                    self.latencias_activo.append(latencia_activa_ms)
+                self.diferencias.extend(diferencias.tolist())
+                self.suma_diferencias += float(diferencias.sum())
+        except Exception:
+            with self.lock:
+                self.errores += 1
+        finally:
+            with self.lock:
+                self.pendientes -= 1
+
+    def estadisticas(self):
+        with self.lock:
+            latencias = np.array(self.latencias)
+            activas = np.array(self.latencias_activo)
+            diferencias = np.abs(np.array(self.diferencias))
+            evaluadas = self.evaluadas
+
+            def percentiles(valores):
+                if len(valores) == 0:
+                    return None
+                return {f"p{p}": round(float(np.percentile(valores, p)), 3) for p in (50, 95, 99)}
+
+            return {
+                "version": self.version,
+                "fraccion": self.fraccion,
+                "evaluadas": evaluadas,
+                "descartadas": self.descartadas,
+                "errores": self.errores,
+                "pendientes": self.pendientes,
+                "latencia_candidato_ms": percentiles(latencias),
+                "latencia_activo_ms": percentiles(activas),
+                "diferencia_media": round(self.suma_diferencias / evaluadas, 4) if evaluadas else None,
+                "diferencia_absoluta": percentiles(diferencias),
+                "diferencia_absoluta_maxima": round(float(diferencias.max()), 4) if len(diferencias) else None,
+                "coincidencia_clasificacion": round(self.coincidencias / evaluadas, 4) if evaluadas else None,
+            }
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registro de versiones del modelo de salarios")
+    parser.add_argument("--directorio", default="modelos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_registrar = sub.add_parser("registrar", help="Copia un artefacto al registro como nueva versión")
+    p_registrar.add_argument("modelo")
+    p_registrar.add_argument("--version", default=None)
+    p_registrar.add_argument("--descripcion", default="")
+    p_registrar.add_argument("--metricas", default=None, help="JSON con métricas de evaluación")
+    p_registrar.add_argument("--activar", action="store_true")
+    sub.add_parser("listar")
+    p_activar = sub.add_parser("activar", help="Marca la versión activa (los servidores la cargan solos)")
+    p_activar.add_argument("version")
+    args = parser.parse_args()
+
+    registro = RegistroModelos(args.directorio)
+    if args.comando == "registrar":
+        metadatos = registro.registrar(args.modelo, args.version, args.descripcion,
+                                       json.loads(args.metricas) if args.metricas else None)
+        if args.activar:
+            registro.marcar_activa(metadatos["version"])
+        print(json.dumps(metadatos, indent=2, ensure_ascii=False))
+    elif args.comando == "listar":
+        activa = registro.leer_activa()
+        for m in registro.listar():
+            marca = "*" if m["version"] == activa else " "
+            print(f"{marca} {m['version']:24s} {m['creado']}  {m['sha256'][:12]}  {m['descripcion']}")
+    else:
+        registro.marcar_activa(args.version)
+        print(f"Versión activa: {args.version}")
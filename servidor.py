@@ -0,0 +1,212 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# Servidor de la API con workers preforkeados. `uvicorn app:app --workers N`
+# arranca N procesos nuevos y cada uno importa pandas, scikit-learn y catboost y
+# deserializa el modelo por su cuenta, así que la memoria crece con los workers.
+# Aquí el proceso padre importa app con PRECARGAR_MODELO=1, calienta el modelo y
+# abre el socket una sola vez, y después hace fork de los workers: comparten
+# módulos, modelo, tabla y vocabulario por copy-on-write (gc.freeze evita que el
+# recolector de basura toque esas páginas y las copie).
+#
+# - Cada worker queda fijado a un núcleo (sched_setaffinity) y BLAS/OpenMP y
+#   CatBoost usan `--hilos` hilos, para no tener N workers x todos los núcleos.
+# - Reciclado ordenado: un worker termina sus solicitudes en curso y sale tras
+#   `--max-solicitudes` (con variación aleatoria para que no salgan todos juntos)
+#   o `--max-edad` segundos, y el padre lanza otro ya cargado en milisegundos.
+#   SIGHUP recicla todos, de a uno (primero el reemplazo, después el viejo).
+# - Si un worker muere, el padre lo reemplaza; SIGTERM/SIGINT cierran todo
+#   esperando hasta `--espera-cierre` segundos a las solicitudes en curso.
+
+VARIABLES_HILOS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def limitar_hilos(hilos):
+    # Antes de importar numpy y compañía: los pools de BLAS/OpenMP se dimensionan al cargarse
+    for variable in VARIABLES_HILOS:
+        os.environ[variable] = str(hilos)
+    os.environ["MODELO_HILOS"] = str(hilos)
+    os.environ.setdefault("INFERENCIA_TRABAJADORES", str(hilos))
+
+
+def crear_socket(host, puerto, backlog=2048):
+    # Un solo socket en escucha, heredado por todos los workers (el kernel reparte las conexiones)
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+
+    def __init__(self, app_mod, sock, trabajadores, cpus=None, max_solicitudes=None, variacion_solicitudes=0,
+                 max_edad=None, espera_cierre=30, log_nivel="info"):
+        self.app_mod = app_mod
+        self.sock = sock
+        self.n_trabajadores = trabajadores
+        self.cpus = cpus
+        self.max_solicitudes = max_solicitudes
+        self.variacion_solicitudes = variacion_solicitudes
+        self.max_edad = max_edad
+        self.espera_cierre = espera_cierre
+        self.log_nivel = log_nivel
+        self.trabajadores = {}  # pid -> {"ranura", "inicio"}
+        self.pendientes = []
+
+    def lanzar(self, ranura):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 1
+            try:
+                self._trabajador(ranura)
+                codigo = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(codigo)
+        self.trabajadores[pid] = {"ranura": ranura, "inicio": time.monotonic()}
+        return pid
+
+    def _trabajador(self, ranura):
+        import uvicorn
+
+        # Las señales del padre no aplican; uvicorn instala las suyas para SIGINT/SIGTERM
+        for senal in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(senal, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        if self.cpus:
+            os.sched_setaffinity(0, {self.cpus[ranura % len(self.cpus)]})
+        # El hilo que escribe el log se detuvo antes del fork; cada worker arranca el suyo
+        self.app_mod.logger._oyente.start()
+        config = uvicorn.Config(
+            self.app_mod.app,
+            log_level=self.log_nivel,
+            limit_max_requests=self.max_solicitudes,
+            limit_max_requests_jitter=self.variacion_solicitudes,
+            timeout_graceful_shutdown=self.espera_cierre,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _recoger(self):
+        # Reemplaza los workers que salieron (reciclados o caídos)
+        while self.trabajadores:
+            pid, estado = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            info = self.trabajadores.pop(pid, None)
+            if info is None:
+                continue
+            codigo = os.waitstatus_to_exitcode(estado)
+            vida = time.monotonic() - info["inicio"]
+            print(f"Worker {pid} (ranura {info['ranura']}) salió con código {codigo} tras {vida:.0f} s")
+            if codigo != 0 and vida < 5:
+                # Se cae al arrancar: no relanzarlo en un bucle cerrado
+                time.sleep(1)
+            self.lanzar(info["ranura"])
+
+    def _esperar(self, pids, timeout):
+        limite = time.monotonic() + timeout
+        vivos = set(pids)
+        while vivos and time.monotonic() < limite:
+            for pid in list(vivos):
+                if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                    vivos.discard(pid)
+                    self.trabajadores.pop(pid, None)
+            time.sleep(0.05)
+        for pid in vivos:
+            print(f"Worker {pid} no terminó en {timeout} s; se mata")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.trabajadores.pop(pid, None)
+
+    def reemplazar(self, pid):
+        # El reemplazo entra a aceptar conexiones antes de que el viejo deje de hacerlo
+        info = self.trabajadores[pid]
+        nuevo = self.lanzar(info["ranura"])
+        os.kill(pid, signal.SIGTERM)
+        self._esperar([pid], self.espera_cierre + 5)
+        print(f"Worker {pid} reciclado por {nuevo} (ranura {info['ranura']})")
+
+    def _revisar_edad(self):
+        ahora = time.monotonic()
+        for pid, info in list(self.trabajadores.items()):
+            if pid in self.trabajadores and ahora - info["inicio"] > self.max_edad:
+                self.reemplazar(pid)
+
+    def ejecutar(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.pendientes.append("terminar"))
+        signal.signal(signal.SIGINT, lambda *_: self.pendientes.append("terminar"))
+        signal.signal(signal.SIGHUP, lambda *_: self.pendientes.append("reciclar"))
+        for ranura in range(self.n_trabajadores):
+            self.lanzar(ranura)
+        while "terminar" not in self.pendientes:
+            if "reciclar" in self.pendientes:
+                self.pendientes.remove("reciclar")
+                print(f"SIGHUP: reciclando {len(self.trabajadores)} workers")
+                for pid in list(self.trabajadores):
+                    if pid in self.trabajadores:
+                        self.reemplazar(pid)
+            self._recoger()
+            if self.max_edad:
+                self._revisar_edad()
+            time.sleep(0.2)
+        self.detener()
+
+    def detener(self):
+        print(f"Deteniendo {len(self.trabajadores)} workers")
+        for pid in self.trabajadores:
+            os.kill(pid, signal.SIGTERM)
+        self._esperar(list(self.trabajadores), self.espera_cierre + 5)
+        self.sock.close()
+
+
+def servir(host="0.0.0.0", puerto=8000, trabajadores=None, hilos=1, afinidad=True, max_solicitudes=None,
+           variacion_solicitudes=0, max_edad=None, espera_cierre=30, log_nivel="info"):
+    limitar_hilos(hilos)
+    os.environ["PRECARGAR_MODELO"] = "1"
+    cpus = sorted(os.sched_getaffinity(0)) if afinidad and hasattr(os, "sched_setaffinity") else None
+    trabajadores = trabajadores or (len(cpus) if cpus else os.cpu_count() or 1)
+
+    inicio = time.perf_counter()
+    import app as app_mod
+    app_mod.calentar_modelo()
+    sock = crear_socket(host, puerto)
+    # Sin hilos vivos al hacer fork: el del log se detiene aquí y cada worker lanza el suyo
+    app_mod.logger._oyente.stop()
+    gc.collect()
+    gc.freeze()
+    print(f"Modelo cargado y calentado en {time.perf_counter() - inicio:.2f} s; "
+          f"{trabajadores} workers en http://{host}:{puerto} ({hilos} hilo(s) c/u"
+          f"{', afinidad a ' + str(cpus) if cpus else ''})")
+    Supervisor(app_mod, sock, trabajadores, cpus, max_solicitudes, variacion_solicitudes, max_edad,
+               espera_cierre, log_nivel).ejecutar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API con el modelo cargado una vez y workers preforkeados")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--trabajadores", type=int, default=None, help="Workers (por defecto uno por núcleo disponible)")
+    parser.add_argument("--hilos", type=int, default=1, help="Hilos de BLAS/OpenMP/CatBoost por worker")
+    parser.add_argument("--sin-afinidad", action="store_true", help="No fijar cada worker a un núcleo")
+    parser.add_argument("--max-solicitudes", type=int, default=None, help="Recicla el worker tras N solicitudes")
+    parser.add_argument("--variacion-solicitudes", type=int, default=0,
+                        help="Hasta cuántas solicitudes más al azar, para no reciclar todos a la vez")
+    parser.add_argument("--max-edad", type=float, default=None, help="Recicla el worker tras N segundos")
+    parser.add_argument("--espera-cierre", type=int, default=30, help="Segundos para terminar solicitudes en curso")
+    parser.add_argument("--log-nivel", default="info")
+    args = parser.parse_args()
+
+    if args.trabajadores is not None and args.trabajadores < 1:
+        sys.exit("--trabajadores debe ser al menos 1")
+    servir(args.host, args.puerto, args.trabajadores, args.hilos, not args.sin_afinidad, args.max_solicitudes,
+           args.variacion_solicitudes, args.max_edad, args.espera_cierre, args.log_nivel)
@@ -0,0 +1,137 @@
+import argparse
+import hashlib
+import json
+import time
+
+import numpy as np
+
+# Tabla precalculada con la predicción del modelo para toda la grilla de entradas
+# discretas de WageInput (categorías x año x edad). Se guarda como .npy
+# memory-mappable más un .json con las dimensiones y el hash del modelo.
+
+RUTA_TABLA = "tabla_predicciones.npy"
+RANGO_YEAR = (2003, 2009)
+RANGO_AGE = (18, 80)
+
+
+def hash_archivo(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def ruta_metadatos(ruta_tabla):
+    return ruta_tabla[:-len(".npy")] + ".json" if ruta_tabla.endswith(".npy") else ruta_tabla + ".json"
+
+
+def construir_tabla(ruta_modelo="best_wage_model.joblib", ruta_csv="Wage.csv",
+                    ruta_tabla=RUTA_TABLA, tam_bloque=50_000):
+    import pandas as pd
+    from almacen_datos import leer_dataset
+    from carga_modelo import cargar_modelo
+
+    modelo = cargar_modelo(ruta_modelo)
+    nombres = list(modelo.feature_names_)
+    cat_idx = set(modelo.get_cat_feature_indices())
+    # Solo se necesitan las columnas categóricas para fijar los ejes de la tabla
+    df = leer_dataset(ruta_csv, columnas=[nombres[i] for i in sorted(cat_idx)])
+
+    # Dimensiones: primero las categóricas (en el orden del modelo), luego year y age
+    dimensiones = [
+        {"columna": nombres[i], "valores": sorted(df[nombres[i]].astype(str).unique())}
+        for i in sorted(cat_idx)
+    ]
+    dimensiones.append({"columna": "year", "inicio": RANGO_YEAR[0], "fin": RANGO_YEAR[1]})
+    dimensiones.append({"columna": "age", "inicio": RANGO_AGE[0], "fin": RANGO_AGE[1]})
+    ejes = [
+        d["valores"] if "valores" in d else list(range(d["inicio"], d["fin"] + 1))
+        for d in dimensiones
+    ]
+    forma = tuple(len(e) for e in ejes)
+    total = int(np.prod(forma))
+
+    # float64 como modelo.predict: la tabla y el modelo responden exactamente lo mismo
+    tabla = np.lib.format.open_memmap(ruta_tabla, mode="w+", dtype=np.float64, shape=forma)
+    plana = tabla.reshape(-1)
+    inicio = time.perf_counter()
+    for desde in range(0, total, tam_bloque):
+        hasta = min(desde + tam_bloque, total)
+        codigos = np.unravel_index(np.arange(desde, hasta), forma)
+        bloque = pd.DataFrame(
+            {d["columna"]: np.asarray(eje, dtype=object)[cod] for d, eje, cod in zip(dimensiones, ejes, codigos)}
+        )
+        plana[desde:hasta] = modelo.predict(bloque[nombres])
+    tabla.flush()
+    del tabla
+
+    metadatos = {
+        "modelo_sha256": hash_archivo(ruta_modelo),
+        "dimensiones": dimensiones,
+        "forma": list(forma),
+        "dtype": "float64",
+    }
+    with open(ruta_metadatos(ruta_tabla), "w", encoding="utf-8") as f:
+        json.dump(metadatos, f, ensure_ascii=False, indent=2)
+    print(f"Tabla de {total} predicciones construida en {time.perf_counter() - inicio:.1f} s -> {ruta_tabla}")
+
+
+class TablaPredicciones:
+
+    def __init__(self, tabla, dimensiones):
+        self.tabla = tabla
+        self.columnas = [d["columna"] for d in dimensiones]
+        # Por dimensión: dict valor -> código (categóricas) o (inicio, fin) (enteras)
+        self.indices = [
+            {v: i for i, v in enumerate(d["valores"])} if "valores" in d else (d["inicio"], d["fin"])
+            for d in dimensiones
+        ]
+
+    def buscar(self, fila):
+        # fila: objeto con un atributo por columna (p. ej. WageInput validado).
+        # Devuelve None si la entrada cae fuera de la grilla.
+        posicion = []
+        for col, indice in zip(self.columnas, self.indices):
+            valor = getattr(fila, col)
+            valor = getattr(valor, "value", valor)
+            if isinstance(indice, dict):
+                codigo = indice.get(valor)
+                if codigo is None:
+                    return None
+            else:
+                if not indice[0] <= valor <= indice[1]:
+                    return None
+                codigo = valor - indice[0]
+            posicion.append(codigo)
+        return float(self.tabla[tuple(posicion)])
+
+
+def cargar_tabla(ruta_tabla=RUTA_TABLA, ruta_modelo="best_wage_model.joblib"):
+    # Devuelve None si la tabla no existe o fue generada con otro modelo
+    try:
+        with open(ruta_metadatos(ruta_tabla), encoding="utf-8") as f:
+            metadatos = json.load(f)
+    except FileNotFoundError:
+        return None
+    if metadatos["modelo_sha256"] != hash_archivo(ruta_modelo):
+        print(f"Tabla {ruta_tabla} descartada: fue generada con otra versión de {ruta_modelo}")
+        return None
+    tabla = np.load(ruta_tabla, mmap_mode="r")
+    if list(tabla.shape) != metadatos["forma"]:
+        print(f"Tabla {ruta_tabla} descartada: forma inesperada {tabla.shape}")
+        return None
+    if tabla.dtype != np.float64:
+        print(f"Tabla {ruta_tabla} descartada: es {tabla.dtype}; regenerarla con python tabla_predicciones.py")
+        return None
+    return TablaPredicciones(tabla, metadatos["dimensiones"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula la grilla completa de predicciones")
+    parser.add_argument("--modelo", default="best_wage_model.joblib")
+    parser.add_argument("--csv", default="Wage.csv")
+    parser.add_argument("--salida", default=RUTA_TABLA)
+    parser.add_argument("--bloque", type=int, default=50_000)
+    args = parser.parse_args()
+    construir_tabla(args.modelo, args.csv, args.salida, args.bloque)
@@ -0,0 +1,69 @@
+import csv
+from typing import Literal
+
+import numpy as np
+
+# Vocabulario de las columnas categóricas tal como las vio el modelo en
+# entrenamiento. Wage.csv guarda varios valores con espacios iniciales
+# (" College Grad", " Information", " No"); la API los recibe sin ellos. Cada
+# valor se indexa por una clave sin espacios sobrantes ni mayúsculas, así que
+# normalizar es una sola búsqueda en un dict y lo que no está en el vocabulario
+# se rechaza con un error por campo antes de llegar a pandas o al modelo.
+
+COLUMNAS_VOCABULARIO = ["education", "jobclass", "health", "health_ins", "maritl", "race"]
+
+
+def clave(valor):
+    return " ".join(str(valor).split()).casefold()
+
+
+class Vocabulario:
+
+    def __init__(self, valores_por_columna):
+        self.valores = {col: sorted(valores) for col, valores in valores_por_columna.items()}
+        self.mapas = {
+            col: {clave(v): v for v in valores} for col, valores in self.valores.items()
+        }
+
+    @classmethod
+    def desde_csv(cls, ruta_csv="Wage.csv", columnas=COLUMNAS_VOCABULARIO, sep=";"):
+        # Lectura directa con csv: el vocabulario se arma al iniciar sin importar pandas
+        valores = {col: set() for col in columnas}
+        with open(ruta_csv, newline="", encoding="utf-8") as f:
+            for fila in csv.DictReader(f, delimiter=sep):
+                for col in columnas:
+                    valores[col].add(fila[col])
+        return cls(valores)
+
+    def tipo(self, columna):
+        # Literal con los valores canónicos, para anotar el campo de pydantic
+        return Literal[tuple(self.valores[columna])]
+
+    def normalizar(self, columna, valor):
+        canonico = self.mapas[columna].get(clave(valor))
+        if canonico is None:
+            opciones = ", ".join(v.strip() for v in self.valores[columna])
+            raise ValueError(f"'{valor}' no es un valor válido de {columna} (opciones: {opciones})")
+        return canonico
+
+    def normalizador(self, columna):
+        # Función para BeforeValidator: deja pasar tipos no str para que pydantic los rechace
+        def normalizar(valor):
+            return self.normalizar(columna, valor) if isinstance(valor, str) else valor
+        return normalizar
+
+    def normalizar_columna(self, columna, valores):
+        # Forma vectorizada: una búsqueda por valor distinto, no por fila. Devuelve
+        # el arreglo normalizado (los desconocidos quedan como vienen) y la máscara de válidos
+        valores = np.asarray(valores, dtype=object)
+        if len(valores) == 0:
+            return valores, np.ones(0, dtype=bool)
+        unicos, inversa = np.unique(valores.astype(str), return_inverse=True)
+        mapa = self.mapas[columna]
+        canonicos = [mapa.get(clave(u)) for u in unicos]
+        conocidos = np.array([c is not None for c in canonicos])
+        reemplazo = np.array([c if c is not None else u for c, u in zip(canonicos, unicos)], dtype=object)
+        return reemplazo[inversa], conocidos[inversa]
+
+    def a_dict(self):
+        return {col: list(valores) for col, valores in self.valores.items()}